@@ -2,48 +2,156 @@ from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import shutil
 import os
+import asyncio
+import time
 import uuid
+import re
 import json
-import base64
 try:
     import cv2
 except ImportError:
     cv2 = None
 from typing import List, Dict, Optional, Any, Union
 
-from services.image_processing import align_image, get_default_boxes, apply_crop_and_rotate
-from services.eft_generator import generate_eft
-from services.fingerprint import Fingerprint
+from services.image_processing import align_image, apply_crop_and_rotate, load_display_image
+from services.card_registration import register_card
 from services.eft_parser import EFTParser
 from services.eft_editor import EFTEditor
-from services.fd258_generator import FD258Generator
-from services.nbis_helper import decode_wsq
+from services.tile_pyramid import build_pyramid, level_scale
+from services.signed_urls import sign_url, verify_url
+from services.image_probe import ImageRejected, probe_image, check_limits, reduction_factor
+from services.session_store import TMP_DIR, create_session_store, to_relative, to_absolute
+from services.janitor import SWEEP_INTERVAL, SESSION_TTL, sweep, collect_metrics
+from services.artifact_cache import ARTIFACT_CACHE, digest, array_digest, file_digest
+from services.prefetch import schedule_prefetch, wait_for_prefetch
+from services.job_queue import JobFailed, EMBEDDED_WORKERS, create_job_queue, start_workers, wait_for_job
+from services.pipeline import HANDLERS, scale_boxes, print_size, preload
+from services.scratch import sweep_scratch, scratch_in_use
+from services.shared_image import SHARED_NAME, share_image, open_image, crop_print
+from services.quality_precheck import precheck, heatmap
+from services.chunked_upload import UploadError, CHUNK_SIZE, create_upload, get_upload, write_chunk, finalize_upload
 
 
 app = FastAPI()
 
 # Logging handler for validation errors
+# Only the error locations/messages are logged and returned; request bodies can be large and contain PII.
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    print(f"Validation Error: {exc.errors()}")
-    print(f"Body: {await request.body()}")
+    errors = [{k: v for k, v in err.items() if k in ("loc", "msg", "type")} for err in exc.errors()]
+    print(f"Validation Error on {request.url.path}: {errors}")
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors(), "body": str(exc.body)},
+        content={"detail": errors},
     )
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Temp storage
-TMP_DIR = "/app/temp"
 os.makedirs(TMP_DIR, exist_ok=True)
 
-# In-memory session store
-SESSIONS = {}
+# Session store (in-memory by default, SQLite with OEFT_SESSION_STORE=sqlite for multiple workers)
+# Artifact paths in sessions are stored relative to TMP_DIR.
+SESSIONS = create_session_store()
+
+# Returns the session or raises 404
+def get_session(session_id):
+    session = SESSIONS.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    SESSIONS.touch(session_id)
+    return session
+
+# File GETs (tiles, previews, downloads) also count as session activity, recorded at most
+# once per TOUCH_INTERVAL per session and process so tile bursts don't hit the store.
+TOUCH_INTERVAL = 30
+LAST_TOUCH = {}
+
+def touch_session(session_id):
+    now = time.time()
+    if now - LAST_TOUCH.get(session_id, 0) < TOUCH_INTERVAL:
+        return
+    if len(LAST_TOUCH) > 10000:
+        LAST_TOUCH.clear()
+    LAST_TOUCH[session_id] = now
+    if session_id in SESSIONS:
+        SESSIONS.touch(session_id)
+
+# Generation work queue. Jobs are claimed by worker threads embedded in this process
+# (OEFT_EMBEDDED_WORKERS) and/or standalone `python worker.py` processes sharing TMP_DIR.
+JOBS = create_job_queue()
+
+# Generation results are memoized per session and kind ('eft', 'eft-rolled', 'fd258'): a repeated
+# request (double-click, browser retry) for the same source image, boxes, Type-2 data, mode and options
+# returns the existing download immediately. The key doubles as job id, so identical concurrent
+# requests, even on different API processes, wait on one job.
+# Only the latest result per kind is kept, since a new generation may overwrite its file.
+def result_key(session_data, kind, data):
+    return digest(
+        kind, data.session_id, session_data.get("source_hash"),
+        [box.model_dump() for box in data.boxes], data.level, data.type2_data, data.mode, data.condition
+    )
+
+async def memoized_result(session_data, kind, data, job_kind):
+    session_id = data.session_id
+    key = result_key(session_data, kind, data)
+
+    # Repeat of the last request
+    previous = session_data.get("results", {}).get(kind)
+    if previous and previous["key"] == key and os.path.exists(os.path.join(TMP_DIR, session_id, previous["result"]["filename"])):
+        print(f"Returning memoized {kind} result for session {session_id}")
+        return previous["result"]
+
+    job_id = JOBS.submit(job_kind, {"request": data.model_dump(), "session": session_data}, job_id=key)
+    try:
+        result = await wait_for_job(JOBS, job_id)
+    except JobFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    SESSIONS.update(session_id, lambda s: s.setdefault("results", {}).update({kind: {"key": key, "result": result}}))
+    return result
+
+# Background janitor: expires idle sessions, enforces the disk quota, trims the artifact cache
+# and removes RAM scratch left behind by killed workers
+# Sessions with queued or running jobs (any process) are kept however long they have been idle
+def sessions_in_use():
+    active = JOBS.active_sessions()
+    return lambda session_id: session_id in active or scratch_in_use(os.path.join(TMP_DIR, session_id), SESSION_TTL)
+
+async def janitor_loop():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            in_use = await run_in_threadpool(sessions_in_use)
+            await run_in_threadpool(sweep, SESSIONS, TMP_DIR, in_use=in_use)
+            await run_in_threadpool(ARTIFACT_CACHE.evict)
+            await run_in_threadpool(JOBS.purge, SESSION_TTL)
+            await run_in_threadpool(sweep_scratch, SESSION_TTL)
+        except Exception as e:
+            print(f"Janitor sweep failed: {e}")
+
+@app.on_event("startup")
+async def start_janitor():
+    app.state.janitor = asyncio.create_task(janitor_loop())
+
+@app.on_event("startup")
+async def start_job_workers():
+    if EMBEDDED_WORKERS > 0:
+        await run_in_threadpool(preload)
+        app.state.workers = start_workers(JOBS, HANDLERS, EMBEDDED_WORKERS)
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if getattr(app.state, "workers", None):
+        app.state.workers.set()
+
+# Chunk size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # Model selection box on the fingerprint card image.
 class Box(BaseModel):
@@ -53,8 +161,10 @@ class Box(BaseModel):
     y: float
     w: float
     h: float
+    angle: Optional[float] = 0 # Degrees counter-clockwise about the box center
 
 # Request model for the initial crop and rotate step.
+# Coordinates are relative to pyramid `level` when given, otherwise full resolution.
 class CropRequest(BaseModel):
     session_id: str
     rotation: int
@@ -62,24 +172,53 @@ class CropRequest(BaseModel):
     y: int
     w: int
     h: int
+    level: Optional[int] = None
+    deskew: Optional[bool] = True
 
 # Request model for the final EFT generation step.
+# Boxes are relative to pyramid `level` of the aligned image when given.
 class GenerateRequest(BaseModel):
     session_id: str
     boxes: List[Box]
     type2_data: Dict[str, Any]
     mode: Optional[str] = "atf" # 'atf' or 'rolled'
+    level: Optional[int] = None
+    format: Optional[str] = "jpg" # FD-258 output: 'jpg' or 'pdf'
+    condition: Optional[bool] = False # Trim, clean and contrast-stretch prints before encoding
+
+# Request models for resumable chunked uploads.
+class StartUploadRequest(BaseModel):
+    kind: str # 'card' or 'eft'
+    size: int
 
-class CaptureSessionRequest(BaseModel):
-    l_slap: str
-    r_slap: str
-    thumbs: str
+class FinalizeUploadRequest(BaseModel):
+    sha256: Optional[str] = None # Whole-file hash; finalize rejects a missing one with 428
 
 # Request model for saving edited EFT.
 class SaveEFTRequest(BaseModel):
     session_id: str
     type2_data: Dict[str, Any]
 
+# Builds the display pyramid for an image and adds its tile URL base.
+def create_pyramid(session_id, img):
+    pyramid = build_pyramid(img, os.path.join(TMP_DIR, session_id, "tiles"))
+    pyramid["url"] = f"/api/tiles/{session_id}/{pyramid['id']}"
+    return pyramid
+
+# Streams an uploaded file to disk in fixed-size chunks without holding it in memory.
+# Writes run in the threadpool, so a large upload doesn't block the event loop.
+async def save_upload(file: UploadFile, path):
+    buffer = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_in_threadpool(buffer.write, chunk)
+    finally:
+        await run_in_threadpool(buffer.close)
+    return path
+
 # Serves the main SPA.
 @app.get("/")
 async def read_index():
@@ -95,31 +234,107 @@ async def upload_image(file: UploadFile = File(...)):
     os.makedirs(session_dir, exist_ok=True)
     
     file_path = os.path.join(session_dir, "original.jpg")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    # For Step 1.5, we just return the uploaded image as base64
+    await save_upload(file, file_path)
+    return await run_in_threadpool(start_card_session, session_id, file_path)
+
+# Registers an uploaded card image as a new session.
+def start_card_session(session_id, file_path):
+    # Probe the header first: reject oversized images and pick a reduced-scale
+    # decode for scans far above the resolution the FD-258 boxes need
+    try:
+        info = probe_image(file_path)
+        reduction = reduction_factor(info)
+        check_limits(info, reduction)
+    except ImageRejected as e:
+        shutil.rmtree(os.path.join(TMP_DIR, session_id), ignore_errors=True)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    print(f"Probed upload: {info}, decoding at 1/{reduction} scale")
+
+    # For Step 1.5, build a tile pyramid of the color original for the crop editor
     try:
-        # Read the image to get base64
-        with open(file_path, "rb") as f:
-            img_bytes = f.read()
-            img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+        display_img = load_display_image(file_path, reduction)
+        pyramid = create_pyramid(session_id, display_img)
+        del display_img
         
-        SESSIONS[session_id] = {
-            "image_path": file_path, # Temporary path pointing to original uploaded image
-            "boxes": []
-        }
+        SESSIONS.set(session_id, {
+            "image_path": to_relative(file_path), # Temporary path pointing to original uploaded image
+            "boxes": [],
+            "original_pyramid": pyramid,
+            "decode_reduction": reduction # All coordinates are relative to the reduced decode
+        })
         
         return {
             "session_id": session_id,
-            "image_base64": img_base64
+            "pyramid": pyramid
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Resumable chunked uploads (card scans and EFTs).
+# 1. POST /api/uploads with kind and size -> upload_id (also the future session id)
+# 2. PUT /api/uploads/{id}?offset=N with the raw chunk body and its X-Chunk-SHA256 (required)
+#    GET /api/uploads/{id} returns the committed offset to resume from after a failure
+# 3. POST /api/uploads/{id}/finalize with the SHA-256 of the whole file (required) -> same response as /api/upload(_eft)
+
+def upload_error_response(e: UploadError):
+    content = {"detail": str(e)}
+    if e.offset is not None:
+        content["offset"] = e.offset
+    return JSONResponse(status_code=e.status_code, content=content)
+
+def upload_dir(upload_id):
+    # Validate upload id is a valid UUID to prevent directory traversal
+    try:
+        uuid.UUID(upload_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid upload ID format")
+    return os.path.join(TMP_DIR, upload_id)
+
+@app.post("/api/uploads")
+async def start_upload(data: StartUploadRequest):
+    upload_id = str(uuid.uuid4())
+    try:
+        state = create_upload(os.path.join(TMP_DIR, upload_id), data.kind, data.size)
+    except UploadError as e:
+        return upload_error_response(e)
+    return {"upload_id": upload_id, "offset": state["offset"], "chunk_size": CHUNK_SIZE}
+
+@app.get("/api/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    try:
+        state = get_upload(upload_dir(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+    return {"upload_id": upload_id, "offset": state["offset"], "size": state["size"]}
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    # Chunk size is checked against Content-Length before any of the body is read
+    try:
+        length = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=411, detail="Content-Length required")
+    try:
+        state = await write_chunk(upload_dir(upload_id), offset, length, request.stream(), request.headers.get("x-chunk-sha256"))
+    except UploadError as e:
+        return upload_error_response(e)
+    return {"upload_id": upload_id, "offset": state["offset"]}
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finish_upload(upload_id: str, data: FinalizeUploadRequest):
+    try:
+        kind, file_path = await run_in_threadpool(finalize_upload, upload_dir(upload_id), data.sha256)
+    except UploadError as e:
+        return upload_error_response(e)
+
+    if kind == "eft":
+        return await run_in_threadpool(start_eft_session, upload_id, file_path)
+    return await run_in_threadpool(start_card_session, upload_id, file_path)
+
 # Creates a session from captured live scans.
+# The three slaps are sent as binary multipart parts and streamed to disk.
 @app.post("/api/start_capture_session")
-async def start_capture_session(data: CaptureSessionRequest):
+async def start_capture_session(l_slap: UploadFile = File(...), r_slap: UploadFile = File(...), thumbs: UploadFile = File(...)):
     session_id = str(uuid.uuid4())
     session_dir = os.path.join(TMP_DIR, session_id)
     os.makedirs(session_dir, exist_ok=True)
@@ -128,25 +343,32 @@ async def start_capture_session(data: CaptureSessionRequest):
     
     # Save print images
     try:
-        def save_b64(b64_str, name):
-            path = os.path.join(session_dir, name)
-            with open(path, "wb") as f:
-                f.write(base64.b64decode(b64_str))
-            return path
-        
-        # 14 = L_SLAP, 13 = R_SLAP, 15 = THUMBS
-        images_map[14] = save_b64(data.l_slap, "14.png") # 14 = L_SLAP
-        images_map[13] = save_b64(data.r_slap, "13.png") # 13 = R_SLAP
-        images_map[15] = save_b64(data.thumbs, "15.png") # 15 = THUMBS
+        # 14 = L_SLAP, 13 = R_SLAP, 15 = THUMBS (keys are strings so sessions stay JSON-serializable)
+        images_map["14"] = await save_upload(l_slap, os.path.join(session_dir, "14.png")) # 14 = L_SLAP
+        images_map["13"] = await save_upload(r_slap, os.path.join(session_dir, "13.png")) # 13 = R_SLAP
+        images_map["15"] = await save_upload(thumbs, os.path.join(session_dir, "15.png")) # 15 = THUMBS
+
+        # Check each scan's header before anything decodes it
+        for path in images_map.values():
+            check_limits(probe_image(path))
         
         # Save session and return session id
-        SESSIONS[session_id] = {
+        SESSIONS.set(session_id, {
             "mode": "capture",
-            "images": images_map
-        }
+            "images": {k: to_relative(v) for k, v in images_map.items()},
+            "source_hash": digest({k: file_digest(v) for k, v in images_map.items()})
+        })
+
+        # Captured slaps are final; start encoding/segmenting while the operator types Type-2 data
+        schedule_prefetch(session_id, session_dir, [(int(k), v) for k, v in images_map.items()])
         
         return {"session_id": session_id}
     
+    # Reject oversized or unsupported scans
+    except ImageRejected as e:
+        shutil.rmtree(session_dir, ignore_errors=True)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
     # Exception handling in case of an error
     except Exception as e:
         import traceback
@@ -160,8 +382,7 @@ async def process_crop(data: CropRequest):
 
     # Get session
     session_id = data.session_id
-    if session_id not in SESSIONS:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = get_session(session_id)
         
     # Get session directory
     session_dir = os.path.join(TMP_DIR, session_id)
@@ -169,27 +390,40 @@ async def process_crop(data: CropRequest):
     
     # Process crop
     try:
-        crop_rect = {'x': data.x, 'y': data.y, 'w': data.w, 'h': data.h}
-        processed_img = apply_crop_and_rotate(original_path, data.rotation, crop_rect)
+        # Map editor coordinates back to the full-resolution original
+        scale = 1
+        if data.level is not None and "original_pyramid" in session:
+            scale = level_scale(session["original_pyramid"], data.level)
+        crop_rect = {'x': data.x * scale, 'y': data.y * scale, 'w': data.w * scale, 'h': data.h * scale}
+        processed_img = apply_crop_and_rotate(original_path, data.rotation, crop_rect, session.get("decode_reduction", 1), data.deskew is not False)
         
-        # Save as aligned.png
-        aligned_path = os.path.join(session_dir, "aligned.png")
-        cv2.imwrite(aligned_path, processed_img)
+        # Save the aligned image as a raw shared copy (no PNG: compressing a full card takes seconds)
+        # Workers and previews crop from it directly
+        shared = share_image(processed_img, os.path.join(session_dir, SHARED_NAME))
         
-        # Update session
-        SESSIONS[session_id]["image_path"] = aligned_path
+        # Register the card to the FD-258 template and place the print boxes of both modes
+        # (full-resolution coordinates; percentage defaults if registration fails)
+        registration = register_card(processed_img)
+        boxes = registration["boxes"]["atf"]
         
-        # Get default boxes based on new image
-        boxes = get_default_boxes(processed_img.shape)
-        SESSIONS[session_id]["boxes"] = boxes
+        # Return the pyramid of the aligned image and boxes
+        pyramid = create_pyramid(session_id, processed_img)
         
-        # Return new base64 and boxes
-        _, buffer = cv2.imencode('.png', processed_img)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        # Update session
+        SESSIONS.update(session_id, lambda s: s.update({
+            "image_path": shared["path"],
+            "boxes": boxes,
+            "mode_boxes": registration["boxes"],
+            "aligned_pyramid": pyramid,
+            "aligned_shared": shared,
+            "source_hash": array_digest(processed_img) # Identifies the pixels all boxes are cut from
+        }))
         
         return {
-            "image_base64": img_base64,
-            "boxes": boxes
+            "pyramid": pyramid,
+            "boxes": boxes,
+            "mode_boxes": registration["boxes"],
+            "registered": registration["registered"]
         }
     
     # Exception handling in case of an error
@@ -198,41 +432,66 @@ async def process_crop(data: CropRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Returns cropped images for the given boxes so the user can verify.
+# Returns short-lived URLs of cropped images for the given boxes so the user can verify,
+# with a quick ridge-quality check and heatmap per print (bad prints can be re-captured
+# before any encoding). The boxes are considered confirmed: their prints are encoded in the background.
 @app.post("/api/preview")
 async def preview_crops(data: GenerateRequest):
     session_id = data.session_id
-    if session_id not in SESSIONS:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    # Get session directory
-    img_path = SESSIONS[session_id]["image_path"]
-    img = cv2.imread(img_path)
-    
+    session = get_session(session_id)
+    boxes = scale_boxes([box.model_dump() for box in data.boxes], session.get("aligned_pyramid"), data.level)
+    previews, quality, prefetch = await run_in_threadpool(render_previews, session_id, session, boxes, data.mode)
+
+    schedule_prefetch(session_id, os.path.join(TMP_DIR, session_id), prefetch, data.mode, bool(data.condition))
+    return {"previews": previews, "quality": quality}
+
+# Crops, prechecks and writes the preview and heatmap JPEGs of each box (CPU-bound, run in the threadpool)
+def render_previews(session_id, session, boxes, mode):
+    # Get session image (memory-mapped shared copy, or the PNG for older sessions)
+    if session.get("aligned_shared"):
+        img = open_image(session["aligned_shared"])
+    else:
+        img = cv2.imread(to_absolute(session["image_path"]), cv2.IMREAD_GRAYSCALE)
+
     # Generate print previews
+    previews_dir = os.path.join(TMP_DIR, session_id, "previews")
+    os.makedirs(previews_dir, exist_ok=True)
     previews = {}
-    for box in data.boxes:
-        # Crop
-        x, y, w, h = box.x, box.y, box.w, box.h
-        # Ensure bounds
-        x = max(0, x)
-        y = max(0, y)
-        w = min(w, img.shape[1] - x)
-        h = min(h, img.shape[0] - y)
-        
-        crop = img[y:y+h, x:x+w]
-        _, buffer = cv2.imencode('.jpg', crop)
-        b64 = base64.b64encode(buffer).decode('utf-8')
-        previews[box.id] = b64
-        
-    return {"previews": previews}
+    quality = {}
+    prefetch = []
+    for box in boxes:
+        # Same crop (and Type-4 size) as /api/generate, so the cached artifacts match
+        crop = crop_print(img, box, print_size(box["fp_number"], mode))
+        prefetch.append((box["fp_number"], crop))
+
+        name = "".join(c for c in box["id"] if c.isalnum() or c in ('-', '_'))
+        filename = name + ".jpg"
+        cv2.imwrite(os.path.join(previews_dir, filename), crop)
+        previews[box["id"]] = sign_url(f"/api/preview/{session_id}/{filename}")
+
+        check = precheck(crop)
+        cv2.imwrite(os.path.join(previews_dir, name + "-quality.jpg"), heatmap(crop, check.pop("blocks")))
+        quality[box["id"]] = dict(check, heatmap=sign_url(f"/api/preview/{session_id}/{name}-quality.jpg"))
+    return previews, quality, prefetch
+
+# Serves a preview crop as a binary JPEG. URLs are signed by /api/preview and expire.
+@app.get("/api/preview/{session_id}/{filename}")
+async def get_preview(session_id: str, filename: str, expires: int = 0, sig: str = ""):
+    if not verify_url(f"/api/preview/{session_id}/{filename}", expires, sig):
+        raise HTTPException(status_code=403, detail="Preview link expired or invalid")
+
+    file_path = os.path.join(TMP_DIR, session_id, "previews", filename)
+    if os.path.basename(filename) == filename and os.path.exists(file_path):
+        touch_session(session_id)
+        return FileResponse(file_path, media_type="image/jpeg", headers={"Cache-Control": "private, no-store"})
+    raise HTTPException(status_code=404, detail="Preview not found")
     
 """
 > Step 3 (Final): Processes individual fingerprint images and generates the EFT file.
 
 This endpoint does the following:
     1. Crops each finger based on the user-adjusted boxes.
-    2. Converts/segments the images (RGB -> Gray -> JP2).
+    2. Converts/segments the images (8-bit Gray -> JP2).
     3. Assembles the EFT file.
     4. Handles re-compression if the file exceeds the 11MB size limit.
 """
@@ -240,121 +499,20 @@ This endpoint does the following:
 @app.post("/api/generate")
 async def generate_eft_endpoint(data: GenerateRequest):
 
-    # Get session
-    session_id = data.session_id
-    if session_id not in SESSIONS:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
     # Get session data
-    session_data = SESSIONS[session_id]
-    session_dir = os.path.join(TMP_DIR, session_id)
+    session_data = get_session(data.session_id)
     
     # Check if cv2 is installed, handle error if not
     if cv2 is None:
         raise HTTPException(status_code=500, detail="cv2 not installed")
 
-    # Initialize variables
-    prints_map = {}
-    fp_objects = [] 
-
-    # Check session mode (Capture or Upload)
-    if session_data.get("mode") == "capture":
+    # Let background encodes of these prints finish; the work below then hits the artifact cache
+    await wait_for_prefetch(data.session_id)
 
-        # If Capture Mode: Load individual images based on box.fp_number
-        images_map = session_data["images"]
-        for box in data.boxes:
-            if box.fp_number in images_map:
-                img_path = images_map[box.fp_number]
-                img = cv2.imread(img_path)
-
-                # Create Fingerprint object
-                fp = Fingerprint(img, box.fp_number, session_dir, session_id)
-                fp_objects.append(fp)
-
-                # Capture mode currently only supports Type-14 Capture
-                result_path = fp.process_and_convert(compression_ratio=10)
-                if result_path:
-                    prints_map[box.fp_number] = fp
-    else:
-        # Upload Mode: Crop from master image
-        img_path = session_data["image_path"]
-        img = cv2.imread(img_path)
-        
-        for box in data.boxes:
-            # Cast to int for slicing
-            x, y, w, h = int(box.x), int(box.y), int(box.w), int(box.h)
-            crop = img[y:y+h, x:x+w]
-            
-            fp = Fingerprint(crop, box.fp_number, session_dir, session_id)
-            fp_objects.append(fp)
-            
-            # Select processing method based on requested mode (rolled or flat)
-            if data.mode == "rolled":
-                result_path = fp.process_and_convert_type4(compression_ratio=10)
-            else:
-                result_path = fp.process_and_convert(compression_ratio=10) # Default ratio
-            
-            # Add processed fingerprint to prints_map
-            if result_path:
-                size = os.path.getsize(result_path)
-                print(f"Processed FP {box.fp_number}: {result_path} ({size} bytes)")
-                if size == 0:
-                    print(f"WARNING: FP {box.fp_number} is 0 bytes!")
-                prints_map[box.fp_number] = fp
-            else:
-                 print(f"ERROR: Failed to process FP {box.fp_number}")
-            
-    # Generate EFT with size safeguard
-    try:
-        # Initial generation with default compression
-        eft_path = generate_eft(data.type2_data, session_id, {fp.fp_number: fp for fp in fp_objects}, mode=data.mode)
-        
-        # Check size (Max 11MB)
-        max_size = 11 * 1024 * 1024
-        current_size = os.path.getsize(eft_path)
-        
-        retries = 0
-        ratios = [15, 20, 30] # Progressive compression ratios in case file exceeds limit
-        
-        # Re-compress and re-generate EFT if file exceeds limit
-        while current_size > max_size and retries < len(ratios):
-            print(f"EFT size {current_size} exceeds limit. Re-compressing with ratio {ratios[retries]}...")
-            
-            # Re-compress all images
-            for fp in fp_objects:
-                if data.mode == "rolled":
-                    fp.process_and_convert_type4(compression_ratio=ratios[retries])
-                else:
-                    fp.process_and_convert(compression_ratio=ratios[retries])
-            
-            # Re-generate EFT
-            eft_path = generate_eft(data.type2_data, session_id, {fp.fp_number: fp for fp in fp_objects}, mode=data.mode)
-            current_size = os.path.getsize(eft_path)
-            retries += 1
-        
-        # If file still exceeds limit after all retries, raise error
-        if current_size > max_size:
-            raise HTTPException(status_code=400, detail=f"EFT size ({current_size} bytes) exceeds 11MB limit even after compression.")
-        
-        # Determine Filename
-        fname = data.type2_data.get("fname", "Unknown")
-        lname = data.type2_data.get("lname", "Unknown")
-
-        # Sanitize
-        safe_fname = "".join(c for c in fname if c.isalnum() or c in ('-', '_'))
-        safe_lname = "".join(c for c in lname if c.isalnum() or c in ('-', '_'))
-        
-        # Generate filename
-        filename = f"oeft-{safe_fname}-{safe_lname}.eft"
-        
-        # Rename the generated file to the user-friendly name
-        new_path = os.path.join(session_dir, filename)
-        shutil.move(eft_path, new_path)
-        
-        # Return download URL with session path and filename
-        return {"download_url": f"/api/download/{session_id}/{filename}", "filename": filename}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"EFT Generation failed: {str(e)}")
+    # The pipeline runs on a job queue worker; repeats and retries are answered from the memo
+    # Type-14 and Type-4 EFTs of one applicant are separate outputs and may be generated in parallel
+    kind = "eft-rolled" if data.mode == "rolled" else "eft"
+    return await memoized_result(session_data, kind, data, "eft")
 
 # View/Edit EFT Endpoints
 # Upload an existing EFT file for viewing/editing
@@ -367,14 +525,16 @@ async def upload_eft(file: UploadFile = File(...)):
 
     # Save uploaded file to session directory
     file_path = os.path.join(session_dir, "original.eft")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
+    await save_upload(file, file_path)
+    return await run_in_threadpool(start_eft_session, session_id, file_path)
+
+# Registers an uploaded EFT file as a new view/edit session.
+def start_eft_session(session_id, file_path):
     # Store session data
-    SESSIONS[session_id] = {
-        "eft_path": file_path,
+    SESSIONS.set(session_id, {
+        "eft_path": to_relative(file_path),
         "mode": "view_edit"
-    }
+    })
     
     # Return session ID
     return {"session_id": session_id}
@@ -383,12 +543,13 @@ async def upload_eft(file: UploadFile = File(...)):
 @app.get("/api/eft_session/{session_id}")
 async def get_eft_session(session_id: str):
     # Check if session exists
-    if session_id not in SESSIONS or "eft_path" not in SESSIONS[session_id]:
+    session = SESSIONS.get(session_id)
+    if session is None or "eft_path" not in session:
         raise HTTPException(status_code=404, detail="Session not found")
         
     # Get session directory and EFT path
     session_dir = os.path.join(TMP_DIR, session_id)
-    eft_path = SESSIONS[session_id]["eft_path"]
+    eft_path = to_absolute(session["eft_path"])
     
     # Parse EFT
     try:
@@ -424,10 +585,27 @@ async def get_eft_session(session_id: str):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to parse EFT: {str(e)}")
 
+# Serve a single pyramid tile. Pyramid ids are never reused, so tiles can be cached by the browser.
+@app.get("/api/tiles/{session_id}/{pyramid_id}/{level}/{tile}")
+async def get_tile(session_id: str, pyramid_id: str, level: int, tile: str):
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid session ID format")
+    if not re.fullmatch(r"[0-9a-f]+", pyramid_id) or not re.fullmatch(r"\d+_\d+\.jpg", tile):
+        raise HTTPException(status_code=400, detail="Invalid tile")
+
+    file_path = os.path.join(TMP_DIR, session_id, "tiles", pyramid_id, str(level), tile)
+    if os.path.exists(file_path):
+        touch_session(session_id)
+        return FileResponse(file_path, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=86400, immutable"})
+    raise HTTPException(status_code=404, detail="Tile not found")
+
 @app.get("/api/image/{session_id}/{filename}")
 async def get_image(session_id: str, filename: str):
     file_path = os.path.join(TMP_DIR, session_id, "images", filename)
     if os.path.exists(file_path):
+        touch_session(session_id)
         return FileResponse(file_path)
     raise HTTPException(status_code=404, detail="Image not found")
 
@@ -436,11 +614,12 @@ async def get_image(session_id: str, filename: str):
 async def save_eft(data: SaveEFTRequest):
     # Get session ID and throw error if not present
     session_id = data.session_id
-    if session_id not in SESSIONS or "eft_path" not in SESSIONS[session_id]:
+    session = SESSIONS.get(session_id)
+    if session is None or "eft_path" not in session:
         raise HTTPException(status_code=404, detail="Session not found")
         
     session_dir = os.path.join(TMP_DIR, session_id)
-    eft_path = SESSIONS[session_id]["eft_path"]
+    eft_path = to_absolute(session["eft_path"])
     
     # Generate new filename
     output_path = os.path.join(session_dir, "edited.eft")
@@ -471,9 +650,15 @@ async def save_eft(data: SaveEFTRequest):
 async def download_file(session_id: str, filename: str):
     file_path = os.path.join(TMP_DIR, session_id, filename)
     if os.path.exists(file_path):
+        touch_session(session_id)
         return FileResponse(file_path, filename=filename)
     raise HTTPException(status_code=404, detail="File not found")
 
+# Session memory and disk metrics
+@app.get("/api/metrics")
+async def metrics():
+    return await run_in_threadpool(collect_metrics, SESSIONS, TMP_DIR)
+
 # Destroy session
 @app.delete("/api/delete/{session_id}")
 async def delete_session(session_id: str):
@@ -490,177 +675,24 @@ async def delete_session(session_id: str):
 
     if os.path.exists(session_dir):
         shutil.rmtree(session_dir)
-        if session_id in SESSIONS:
-            del SESSIONS[session_id]
+        SESSIONS.delete(session_id)
         return {"message": "Deleted"}
     raise HTTPException(status_code=404, detail="Session not found")
 
-class RawFP:
-    def __init__(self, p, w=0, h=0, is_raw=False):
-        self.img_path = p
-        self.w = w
-        self.h = h
-        self.is_raw = is_raw
-
-class SimpleFP:
-    def __init__(self, p, w=0, h=0): 
-        self.img_path = p
-        self.w = w
-        self.h = h
-
-
 @app.post("/api/generate_fd258")
 async def generate_fd258(data: GenerateRequest):
     # Get session
-    session_id = data.session_id
-    if session_id not in SESSIONS:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    session_data = SESSIONS[session_id]
-    session_dir = os.path.join(TMP_DIR, session_id)
+    session_data = get_session(data.session_id)
     
     # FD258 generation is only available for capture mode
     if session_data.get("mode") != "capture":
         raise HTTPException(status_code=400, detail="Only available for capture sessions")
 
-    # Load images_map
-    images_map = session_data["images"]
-    print(f"DEBUG: images_map keys: {list(images_map.keys())}")
-    
-    # Process slaps (13, 14, 15) to get segments
-    fp_objects = {}
-    
-    for fp_num in [13, 14, 15]:
-        target_path = None
-        # Robust key (int or str) and path check
-        if fp_num in images_map:
-            target_path = images_map[fp_num]
-        elif str(fp_num) in images_map:
-            target_path = images_map[str(fp_num)]
-            
-        if target_path:
-             if not os.path.exists(target_path):
-                 print(f"DEBUG: Image path not found: {target_path}")
-                 continue
-                 
-             img = cv2.imread(target_path)
-             if img is None: 
-                 print(f"DEBUG: Failed to load image with cv2: {target_path}")
-                 continue
-             
-             print(f"DEBUG: Loaded FP {fp_num} from {target_path}, shape={img.shape}")
-             fp = Fingerprint(img, fp_num, session_dir, session_id)
-
-             # Saves png and runs segment()
-             # Note: Using a lower compression ratio for intermediate processing, 
-             # but here we just want segmentation side effects.
-             fp.process_and_convert(compression_ratio=10) 
-             
-             # Double check segmentation didn't fail silently
-             if not fp.fingers:
-                 print(f"FP {fp_num} has no segments after process. Forcing segment().")
-                 fp.segment()
-                 
-             fp_objects[fp_num] = fp
-             print(f"FP {fp_num} has {len(fp.fingers)} segments: {[f.n for f in fp.fingers]}")
-
-
-
-    # Collect printable images
-    prints_map = {}
-    
-    for fp in fp_objects.values():
-         # 1. Plain boxes (Slaps)
-         # Map the full slap images to their respective plain codes
-         if fp.fp_number == 13:
-             prints_map[13] = fp # R Slap -> P_R4
-         elif fp.fp_number == 14:
-             prints_map[14] = fp # L Slap -> P_L4
-             
-         # 2. Segments (Rolled boxes 1-10)
-         for finger in fp.fingers:
-             try:
-                 fn = int(finger.n)
-                 seg_path = os.path.join(session_dir, finger.name)
-                 if fp.fp_number == 14:
-                     # Swap 7 <-> 10 to properly place prints in order
-                     if fn == 7: fn = 10
-                     elif fn == 10: fn = 7
-                     # Swap 8 <-> 9  to properly place prints in order
-                     elif fn == 8: fn = 9
-                     elif fn == 9: fn = 8
-                     print(f"Swapped Left Hand Segment {finger.n} -> {fn}")
-
-                 
-
-                 # Check/Decode WSQ or RAW
-                 if seg_path.endswith('.wsq'):
-                     if os.path.exists(seg_path):
-                         # Decode to RAW
-                         raw_path = decode_wsq(seg_path)
-                         sfp = RawFP(raw_path, finger.sw, finger.sh, is_raw=True)
-                     else:
-                         print(f"WSQ not found: {seg_path}")
-                         continue
-                 elif seg_path.endswith('.raw'):
-                     if os.path.exists(seg_path):
-                         sfp = RawFP(seg_path, finger.sw, finger.sh, is_raw=True)
-                     else:
-                          print(f"RAW not found: {seg_path}")
-                          continue
-                 elif os.path.exists(seg_path):
-                     # Assume standard image and not WSQ or RAW
-                     sfp = RawFP(seg_path)
-                 else:
-                     print(f"Segment file not found: {seg_path}")
-                     continue
-                     
-                 # Map 1-10 (Rolled)
-                 if 1 <= fn <= 10:
-                     prints_map[fn] = sfp
-                     print(f"Mapped Segment {fn} from {seg_path}")
-                 
-                 # Handling Thumbs from FP 15 (which return segments 11 and 12)
-                 # Map 11 -> 1 (Rolled R Thumb) and 11 (Plain R Thumb)
-                 # Map 12 -> 6 (Rolled L Thumb) and 12 (Plain L Thumb)
-                 if fn == 11:
-                     prints_map[1] = sfp  # Rolled R Thumb
-                     prints_map[11] = sfp # Plain R Thumb
-                     print(f"Mapped Segment {fn} to 1 and 11")
-                 elif fn == 12:
-                     prints_map[6] = sfp  # Rolled L Thumb
-                     prints_map[12] = sfp # Plain L Thumb
-                     print(f"Mapped Segment {fn} to 6 and 12")
-                     
-                 # Map Segments to Plain Thumbs 11/12 (Legacy checking 1/6)
-                 if fn == 1:
-                     prints_map[11] = sfp # P_RT (11) mapping to layout "P_RT"
-                 elif fn == 6:
-                     prints_map[12] = sfp # P_LT (12) mapping to layout "P_LT"
-
-                             
-             except Exception as e:
-                 print(f"Error processing segment for FP {fp.fp_number}: {e}")
-
-    print(f"DEBUG: Final prints_map keys: {list(prints_map.keys())}")
-
-
-
-                 
-    # Generate FD258
-    try:
-        generator = FD258Generator("static/img/fd258-blank.jpg")
-        img_bytes = generator.generate(data.type2_data, prints_map)
-        
-        # Save
-        filename = f"fd258-{session_id}.jpg"
-        out_path = os.path.join(session_dir, filename)
-        with open(out_path, "wb") as f:
-            f.write(img_bytes)
-            
-        return {"download_url": f"/api/download/{session_id}/{filename}", "filename": filename}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"FD258 Generation failed: {str(e)}")
+    # Segments of the captured slaps are usually cached by the prefetch started with the session
+    await wait_for_prefetch(data.session_id)
 
+    # JPEG and PDF cards are separate outputs
+    if data.format not in ("jpg", "pdf"):
+        raise HTTPException(status_code=400, detail="Unknown FD-258 format")
+    kind = "fd258-pdf" if data.format == "pdf" else "fd258"
+    return await memoized_result(session_data, kind, data, "fd258")
@@ -0,0 +1,146 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+from services.session_store import TMP_DIR
+
+# Content-addressed cache for per-print artifacts (PNG, JP2 at a given ratio,
+# nfseg segments with NFIQ scores).
+# Keys are hashes of everything an artifact depends on, so a changed box or
+# rotation yields new keys and unchanged prints are reused across regenerations
+# and sessions. Entries are directories `<root>/<key[:2]>/<key>/` holding named
+# files; their mtime is bumped on every hit and the least recently used entries
+# are evicted once the cache exceeds its size limit.
+
+CACHE_DIR = os.environ.get("OEFT_CACHE_DIR", os.path.join(TMP_DIR, "cache"))
+CACHE_MAX_BYTES = int(os.environ.get("OEFT_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+
+def digest(*parts) -> str:
+    """
+    Hashes a canonical JSON encoding of `parts` (dicts are key-sorted).
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def array_digest(img) -> str:
+    """
+    Hashes the pixels, shape and dtype of a numpy image.
+    """
+    h = hashlib.sha256()
+    h.update(f"{img.shape}:{img.dtype}".encode())
+    h.update(memoryview(img if img.flags["C_CONTIGUOUS"] else img.copy()))
+    return h.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """
+    Hashes the contents of a file.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str, name: str):
+        """
+        Returns the path of a cached file, or None on a miss.
+        """
+        path = os.path.join(self._entry_dir(key), name)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(self._entry_dir(key)) # LRU bookkeeping
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, name: str, src_path: str) -> str:
+        """
+        Copies `src_path` into the cache entry under `name`. The file appears atomically.
+        """
+        entry = self._entry_dir(key)
+        os.makedirs(entry, exist_ok=True)
+        dest = os.path.join(entry, name)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src_path, tmp)
+        os.replace(tmp, dest)
+        return dest
+
+    def get_json(self, key: str, name: str = "meta.json"):
+        path = self.get(key, name)
+        if path is None:
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def put_json(self, key: str, data, name: str = "meta.json"):
+        entry = self._entry_dir(key)
+        os.makedirs(entry, exist_ok=True)
+        dest = os.path.join(entry, name)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, dest)
+
+    def export(self, key: str, name: str, dest_path: str):
+        """
+        Copies a cached file to `dest_path` (atomically replacing it). Returns dest_path or None on a miss.
+        Copies rather than hard links, so tools writing to dest_path later can never alter the cache.
+        """
+        src = self.get(key, name)
+        if src is None:
+            return None
+        tmp = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest_path)
+        return dest_path
+
+    def evict(self) -> int:
+        """
+        Removes least recently used entries until the cache is below `max_bytes`.
+
+        Returns:
+            Number of entries removed.
+        """
+        entries = []
+        total = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, entry.path, size))
+                    total += size
+                except FileNotFoundError:
+                    continue
+
+        removed = 0
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, path, size = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Artifact cache: evicted {removed} entries, {total} bytes remaining")
+        return removed
+
+
+# Process-wide cache instance shared by all sessions
+ARTIFACT_CACHE = ArtifactCache()
@@ -0,0 +1,152 @@
+import time
+import threading
+import cv2
+import numpy as np
+
+from services.fd258_generator import LAYOUT
+from services.image_processing import get_default_boxes
+
+# Automatic registration of uploaded card scans to the blank FD-258.
+# Both images are matched at a small working size with ORB features; a RANSAC
+# homography maps the template's print boxes (the same layout the FD-258 renderer
+# uses) onto the scan. If the card cannot be registered, the percentage boxes of a
+# perfectly cropped card are returned instead, flagged as unregistered.
+
+TEMPLATE_PATH = "static/img/fd258-blank.jpg"
+WORK_WIDTH = 800 # Matching resolution (pixels across the card), sized for ~100 ms per card
+ORB_FEATURES = 1500
+RATIO_TEST = 0.75
+MIN_INLIERS = 40
+
+# Print boxes per generation mode: (id, fp_number, layout keys whose union is the box)
+MODE_BOXES = {
+    "atf": [
+        ("L_SLAP", 14, ["P_L4"]),
+        ("R_SLAP", 13, ["P_R4"]),
+        ("THUMBS", 15, ["P_LT", "P_RT"])
+    ],
+    "rolled": [(f"R{i}", i, [f"R{i}"]) for i in range(1, 6)] + [(f"L{i}", i + 5, [f"L{i}"]) for i in range(1, 6)] + [
+        ("P_L4", 14, ["P_L4"]),
+        ("P_LT", 12, ["P_LT"]),
+        ("P_RT", 11, ["P_RT"]),
+        ("P_R4", 13, ["P_R4"])
+    ]
+}
+
+_TEMPLATE = None
+_LOCK = threading.Lock()
+
+
+def _downscale(img, width=WORK_WIDTH):
+    # Integer decimation first (cheap on very large scans), then area resampling
+    step = max(1, img.shape[1] // (width * 2))
+    small = img[::step, ::step]
+    scale = width / small.shape[1]
+    small = cv2.resize(small, (width, max(1, round(small.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    return small, small.shape[1] / img.shape[1]
+
+
+def _template():
+    # Template features are computed once per process
+    global _TEMPLATE
+    with _LOCK:
+        if _TEMPLATE is None:
+            img = cv2.imread(TEMPLATE_PATH, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                raise FileNotFoundError(TEMPLATE_PATH)
+            small, scale = _downscale(img)
+            orb = cv2.ORB_create(ORB_FEATURES)
+            keypoints, descriptors = orb.detectAndCompute(small, None)
+            _TEMPLATE = {"shape": img.shape[:2], "scale": scale, "keypoints": keypoints, "descriptors": descriptors}
+        return _TEMPLATE
+
+
+def find_homography(img):
+    """
+    Registers a grayscale card scan to the blank FD-258.
+
+    Returns:
+        3x3 homography mapping blank-card pixels to scan pixels, or None if the
+        card could not be registered reliably.
+    """
+    template = _template()
+    small, scale = _downscale(img)
+    orb = cv2.ORB_create(ORB_FEATURES)
+    keypoints, descriptors = orb.detectAndCompute(small, None)
+    if descriptors is None or len(keypoints) < MIN_INLIERS:
+        return None
+
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    matches = [
+        pair[0] for pair in matcher.knnMatch(template["descriptors"], descriptors, k=2)
+        if len(pair) == 2 and pair[0].distance < RATIO_TEST * pair[1].distance
+    ]
+    if len(matches) < MIN_INLIERS:
+        return None
+
+    src = np.float32([template["keypoints"][m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
+    dst = np.float32([keypoints[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+    H, mask = cv2.findHomography(src, dst, cv2.RANSAC, 4.0)
+    if H is None or int(mask.sum()) < MIN_INLIERS:
+        return None
+
+    # Back to full resolution: blank pixels -> working size -> scan pixels
+    H = np.diag([1 / scale, 1 / scale, 1]) @ H @ np.diag([template["scale"], template["scale"], 1])
+
+    # Reject degenerate fits (mirrored, collapsed or strongly perspective-distorted cards)
+    det = np.linalg.det(H[:2, :2])
+    if det <= 0 or abs(H[2, 0]) > 1e-3 or abs(H[2, 1]) > 1e-3:
+        return None
+    return H
+
+
+def _project_box(H, img_shape, keys):
+    # Corners of the layout boxes (normalized card coordinates)
+    corners = []
+    for key in keys:
+        conf = LAYOUT[key]
+        x, y, w, h = conf["x"], conf["y"], conf["w"], conf["h"]
+        corners += [(x, y), (x + w, y), (x, y + h), (x + w, y + h)]
+    pts = np.float32(corners).reshape(-1, 1, 2)
+    if H is not None:
+        th, tw = _template()["shape"]
+        pts = cv2.perspectiveTransform(pts * np.float32([tw, th]), H)
+    else:
+        # Unregistered: assume the scan is exactly the card
+        pts = pts * np.float32([img_shape[1], img_shape[0]])
+    x1, y1 = np.clip(pts.min(axis=(0, 1)), 0, [img_shape[1], img_shape[0]])
+    x2, y2 = np.clip(pts.max(axis=(0, 1)), 0, [img_shape[1], img_shape[0]])
+    return int(x1), int(y1), int(x2 - x1), int(y2 - y1)
+
+
+def register_card(img):
+    """
+    Finds the print boxes of a card scan for both generation modes.
+
+    Args:
+        img: The aligned grayscale card (full resolution).
+
+    Returns:
+        dict with 'registered' (bool), 'homography' (3x3 list or None) and 'boxes'
+        ({'atf': [...], 'rolled': [...]}, full-resolution pixel boxes).
+    """
+    start = time.time()
+    try:
+        H = find_homography(img)
+    except Exception as e:
+        print(f"Card registration failed: {e}")
+        H = None
+
+    boxes = {}
+    for mode, specs in MODE_BOXES.items():
+        if H is None and mode == "atf":
+            # Keep the established percentage boxes for slaps
+            boxes[mode] = get_default_boxes(img.shape)
+            continue
+        boxes[mode] = []
+        for box_id, fp_number, keys in specs:
+            x, y, w, h = _project_box(H, img.shape, keys)
+            boxes[mode].append({"id": box_id, "fp_number": fp_number, "x": x, "y": y, "w": w, "h": h})
+
+    print(f"Card registration {'succeeded' if H is not None else 'failed, using default boxes'} in {(time.time() - start) * 1000:.0f} ms")
+    return {"registered": H is not None, "homography": H.tolist() if H is not None else None, "boxes": boxes}
@@ -0,0 +1,177 @@
+import os
+import json
+import fcntl
+import asyncio
+import hashlib
+
+# Resumable chunked uploads.
+# An upload lives in its (future) session directory as `upload.part` plus a small
+# `upload.json` state file. Chunks are written with positional writes, and the
+# committed offset only advances once a chunk has been fully received and its
+# checksum matches, so a dropped connection can always resume from `offset`.
+# Every chunk must carry its SHA-256, and finalize checks the hash of the whole file.
+
+MAX_UPLOAD_SIZE = int(os.environ.get("OEFT_MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+MAX_CHUNK_SIZE = int(os.environ.get("OEFT_MAX_CHUNK_BYTES", 8 * 1024 * 1024))
+CHUNK_SIZE = 4 * 1024 * 1024 # Suggested to clients
+
+# Final filename per upload kind
+UPLOAD_KINDS = {
+    "card": "original.jpg",
+    "eft": "original.eft"
+}
+
+PART_NAME = "upload.part"
+STATE_NAME = "upload.json"
+
+
+class UploadError(Exception):
+    """
+    Raised for rejected upload operations. `status_code` is the HTTP status to report.
+    """
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+def _read_state(session_dir):
+    path = os.path.join(session_dir, STATE_NAME)
+    if not os.path.exists(path):
+        raise UploadError("Upload not found", status_code=404)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_state(session_dir, state):
+    # Atomic replace so readers never see a partial state file
+    path = os.path.join(session_dir, STATE_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def create_upload(session_dir: str, kind: str, size: int) -> dict:
+    """
+    Starts a new upload of `size` bytes. The size cap is enforced here, before any data is sent.
+    """
+    if kind not in UPLOAD_KINDS:
+        raise UploadError(f"Unknown upload kind: {kind}")
+    if size <= 0:
+        raise UploadError("Upload size must be positive")
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError(f"Upload of {size} bytes exceeds limit of {MAX_UPLOAD_SIZE} bytes", status_code=413)
+
+    os.makedirs(session_dir, exist_ok=True)
+    with open(os.path.join(session_dir, PART_NAME), "wb"):
+        pass
+
+    state = {"kind": kind, "size": size, "offset": 0}
+    _write_state(session_dir, state)
+    return state
+
+
+def get_upload(session_dir: str) -> dict:
+    """
+    Returns the upload state, including the committed `offset` to resume from.
+    """
+    return _read_state(session_dir)
+
+
+def _check_chunk(state, offset, length):
+    if offset != state["offset"]:
+        raise UploadError("Offset mismatch", status_code=409, offset=state["offset"])
+    if length <= 0 or length > MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunk length must be between 1 and {MAX_CHUNK_SIZE} bytes", status_code=413)
+    if offset + length > state["size"]:
+        raise UploadError("Chunk exceeds declared upload size", status_code=413)
+
+
+def _store_chunk(session_dir, offset, data, sha256):
+    # Blocking part of write_chunk (lock, checksum, positional write, commit), run in a thread
+    with open(os.path.join(session_dir, STATE_NAME + ".lock"), "w") as lock:
+        # One writer per upload at a time
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError("Another chunk is being written", status_code=409)
+        state = _read_state(session_dir)
+        _check_chunk(state, offset, len(data))
+
+        if hashlib.sha256(data).hexdigest() != sha256.lower():
+            raise UploadError("Chunk checksum mismatch", status_code=422, offset=state["offset"])
+        fd = os.open(os.path.join(session_dir, PART_NAME), os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+
+        # Commit
+        state["offset"] = offset + len(data)
+        _write_state(session_dir, state)
+        return state
+
+
+async def write_chunk(session_dir: str, offset: int, length: int, stream, sha256: str) -> dict:
+    """
+    Writes one chunk received from `stream` (an async iterator of bytes) at `offset`.
+    Only receiving the body runs on the event loop; file I/O and hashing run in a thread.
+
+    Args:
+        session_dir: Directory of the upload.
+        offset: Byte offset of the chunk; must equal the committed offset.
+        length: Declared chunk length (Content-Length), checked before reading the body.
+        stream: Async iterator yielding the chunk body.
+        sha256: Hex digest of the chunk (required).
+
+    Returns:
+        The updated upload state.
+    """
+    state = await asyncio.to_thread(_read_state, session_dir)
+    if not sha256:
+        raise UploadError("Chunk checksum (X-Chunk-SHA256) required", status_code=428, offset=state["offset"])
+    _check_chunk(state, offset, length)
+
+    # Chunks are at most MAX_CHUNK_SIZE, so the body is collected in memory
+    data = bytearray()
+    async for piece in stream:
+        if len(data) + len(piece) > length:
+            raise UploadError("Chunk body longer than declared length", status_code=413)
+        data += piece
+    if len(data) != length:
+        raise UploadError(f"Incomplete chunk: received {len(data)} of {length} bytes", offset=state["offset"])
+
+    return await asyncio.to_thread(_store_chunk, session_dir, offset, bytes(data), sha256)
+
+
+def finalize_upload(session_dir: str, sha256: str) -> tuple:
+    """
+    Verifies the completed upload against the SHA-256 of the whole file (required) and
+    moves it to its final filename.
+
+    Returns:
+        A tuple of (kind, final file path).
+    """
+    state = _read_state(session_dir)
+    if state["offset"] != state["size"]:
+        raise UploadError("Upload incomplete", status_code=409, offset=state["offset"])
+    if not sha256:
+        raise UploadError("File checksum (sha256) required", status_code=428)
+
+    part_path = os.path.join(session_dir, PART_NAME)
+    digest = hashlib.sha256()
+    with open(part_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    if digest.hexdigest() != sha256.lower():
+        raise UploadError("File checksum mismatch", status_code=422)
+
+    final_path = os.path.join(session_dir, UPLOAD_KINDS[state["kind"]])
+    os.replace(part_path, final_path)
+    for name in (STATE_NAME, STATE_NAME + ".lock"):
+        try:
+            os.remove(os.path.join(session_dir, name))
+        except FileNotFoundError:
+            pass
+    return state["kind"], final_path
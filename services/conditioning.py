@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+
+# Print conditioning before encoding (opt-in, `condition` on generate requests).
+# Card crops carry paper texture, ruling lines and blank box margins that JPEG 2000
+# spends bytes on. The ridge area is found from local contrast; the print is trimmed
+# to it, everything outside is set to white and the ridges are stretched to the full
+# grey range. All steps are whole-array OpenCV/NumPy operations (~25 ms for a slap).
+
+BLOCK = 15 # Local contrast window (pixels, about 1.5 ridge periods at 500 ppi)
+MIN_STD = 12.0 # Grey-level standard deviation of a block containing ridges
+LINE_WIDTH = 31 # Smallest opening size: thinner high-contrast structures (ruling lines, text) are dropped
+LINE_FRACTION = 8 # ...grown to 1/8 of the print's short side (fingers are wider than that)
+MASK_STEP = 4 # The mask is shaped at 1/4 resolution (it only needs block precision)
+MIN_AREA = 0.01 # Smallest ridge region kept, as a fraction of the print
+MARGIN = 16 # Pixels kept around the ridge area when trimming
+CLIP_PERCENT = 1 # Percent of ridge pixels clipped at each end by the contrast stretch
+
+
+def ridge_mask(img: np.ndarray) -> np.ndarray:
+    """
+    Returns the foreground (ridge area) of a grayscale print as a boolean mask.
+    """
+    gray = img.astype(np.float32)
+    mean = cv2.boxFilter(gray, -1, (BLOCK, BLOCK))
+    sq_mean = cv2.boxFilter(gray * gray, -1, (BLOCK, BLOCK))
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+    small = cv2.resize(std, (max(1, img.shape[1] // MASK_STEP), max(1, img.shape[0] // MASK_STEP)), interpolation=cv2.INTER_AREA)
+    mask = (small > MIN_STD).astype(np.uint8)
+
+    size = max(LINE_WIDTH, min(img.shape[:2]) // LINE_FRACTION) // MASK_STEP | 1
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+
+    # Drop specks (stains, stray marks); slaps keep one region per finger
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    keep = np.zeros(n, dtype=np.uint8)
+    keep[1:] = stats[1:, cv2.CC_STAT_AREA] >= MIN_AREA * mask.size
+    return cv2.resize(keep[labels], (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+
+
+def condition_print(img: np.ndarray, trim: bool = True):
+    """
+    Conditions a grayscale print for encoding.
+
+    Args:
+        img: The grayscale print.
+        trim: Crop to the ridge area (off for fixed-size Type-4 images).
+
+    Returns:
+        (conditioned image, (x, y)) where (x, y) is the position of the conditioned image
+        within `img`. A print without a detectable ridge area is returned unchanged.
+    """
+    mask = ridge_mask(img)
+    if not mask.any():
+        return img, (0, 0)
+
+    x, y = 0, 0
+    if trim:
+        ys, xs = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+        x, y = max(0, int(xs[0]) - MARGIN), max(0, int(ys[0]) - MARGIN)
+        x2, y2 = min(img.shape[1], int(xs[-1]) + 1 + MARGIN), min(img.shape[0], int(ys[-1]) + 1 + MARGIN)
+        img, mask = img[y:y2, x:x2], mask[y:y2, x:x2]
+
+    # Stretch the ridge grey levels to 0..255 with one lookup table, then whiten the background
+    img = np.ascontiguousarray(img)
+    hist = cv2.calcHist([img], [0], np.ascontiguousarray(mask).view(np.uint8), [256], [0, 256]).ravel()
+    cdf = np.cumsum(hist) / hist.sum()
+    low = int(np.searchsorted(cdf, CLIP_PERCENT / 100))
+    high = int(np.searchsorted(cdf, 1 - CLIP_PERCENT / 100))
+    if high > low:
+        lut = np.clip((np.arange(256) - low) * 255.0 / (high - low), 0, 255).astype(np.uint8)
+        out = cv2.LUT(img, lut)
+    else:
+        out = img.copy()
+    out[~mask] = 255
+    return out, (x, y)
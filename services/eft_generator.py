@@ -3,12 +3,12 @@ import cv2
 import shutil
 import subprocess
 import uuid
+import json
 import random
-from services.eft_helper import Type1, Type2, Type14, Type4, get_date
+from services.eft_helper import Type1, Type2, Type14, Type4, PrebuiltRecord, get_date
 from services.fingerprint import Fingerprint 
-
-# Define temp directory location
-TMP_DIR = "/app/temp"
+from services.artifact_cache import digest
+from services.session_store import TMP_DIR
 
 from services.nbis_helper import verify_eft
 
@@ -80,14 +80,97 @@ def get_initials(name_str: str) -> str:
     except:
         return "XXX"
 
+# Serialized image records (Type-14/Type-4) of the last generation, kept per session and mode.
+# A regeneration that only changes Type-2 data splices them in instead of reprocessing prints.
+# One file per mode: a JSON index line followed by the concatenated record bytes, so a
+# single atomic rename keeps index and data consistent under concurrent generations.
+def _records_path(session_id: str, mode: str) -> str:
+    name = "image_records-rolled.bin" if mode == "rolled" else "image_records-atf.bin"
+    return os.path.join(TMP_DIR, session_id, name)
+
+# Key of the image records for a source image, boxes and mode
+# Includes the date, which the records carry (14.005/14.031)
+def image_records_key(source_hash: str, boxes: list, mode: str, condition: bool = False) -> str:
+    return digest("image_records", source_hash, boxes, mode, condition, get_date().split(':')[0])
+
+# Returns the cached image records of a session as `PrebuiltRecord`s, or None if they don't match `key`
+def load_image_records(session_id: str, key: str, mode: str = "atf"):
+    try:
+        with open(_records_path(session_id, mode), "rb") as f:
+            index = json.loads(f.readline())
+            if index["key"] != key:
+                return None
+            blob = f.read()
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(blob) != sum(r["length"] for r in index["records"]):
+        return None
+
+    records = []
+    offset = 0
+    for r in index["records"]:
+        records.append(PrebuiltRecord(r["rtype"], r["idc"], blob[offset:offset + r["length"]]))
+        offset += r["length"]
+    return records
+
+# Stores the image records of a session (replacing the previous ones of the same mode)
+def save_image_records(session_id: str, key: str, records: list, mode: str = "atf"):
+    path = _records_path(session_id, mode)
+    index = {"key": key, "records": [{"rtype": r.rtype, "idc": r.idc, "length": len(r.data)} for r in records]}
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(json.dumps(index).encode() + b"\n")
+        for r in records:
+            f.write(r.data)
+    os.replace(tmp_path, path)
+
+# Builds and serializes the image records for the prints
+def build_image_records(prints_map: dict, mode: str = "atf") -> list:
+    records = []
+    sorted_prints = sorted(prints_map.items(), key=lambda item: int(item[0]))
+    
+    if mode == "rolled":
+        # Type-4 Records (1-14)
+        # Specs: IDC matches FGP (1, 2... 14).
+        # Assume Type-2 is IDC 00.
+        # Process all 14 images.
+        # prints_map should contain 1-14.
+        
+        for fp_num, fp_obj in sorted_prints:
+            num = int(fp_num)
+            if 1 <= num <= 14:
+                # Type 4
+                t4 = Type4(fp_obj, idc=num) # IDC matches FGP
+                t4.build()
+                records.append(t4)
+                
+    else:
+        # ATF Compliant (Type-14)
+        idc = 1
+        # Standard: Type 1 (IDC implicit), Type 2 (IDC 00), Type 14s (IDC 01, 02...).
+        
+        for fp_num, fp_obj in sorted_prints:
+            if int(fp_num) in [13, 14, 15]: # Only Left Slap, Right Slap, and Thumbs
+                t14 = Type14(fp_obj, idc)
+                t14.fcd = get_date().split(':')[0]
+                t14.build()
+                records.append(t14)
+                idc += 1
+
+    # Serialize once; the bytes are what gets written and cached
+    return [PrebuiltRecord(r.rtype, r.idc, r.repr()) for r in records]
+
 # Orchestrate EFT generation
-def generate_eft(data: dict, session_id: str, prints_map: dict, mode: str = "atf") -> str:
+def generate_eft(data: dict, session_id: str, prints_map: dict, mode: str = "atf", image_records: list = None, records_key: str = None, out_dir: str = None) -> str:
     """
     Args:
     - data (dict): A dictionary containing Type-2 field values.
     - session_id (str): A unique identifier for the current user session.
     - prints_map (dict): A dictionary mapping finger position numbers (int) to `Fingerprint` objects.
     - mode (str): Generation mode - 'atf' (Type-14) or 'rolled' (Type-4).
+    - image_records (list): Serialized image records from `load_image_records`; `prints_map` is ignored if given.
+    - records_key (str): If given, the image records built from `prints_map` are saved under this key.
+    - out_dir (str): Directory for the EFT file (defaults to the session directory).
     Returns:
     - str: The absolute path to the generated EFT file.
     """
@@ -161,38 +244,17 @@ def generate_eft(data: dict, session_id: str, prints_map: dict, mode: str = "atf
     
     fname = f"{tcn}.eft"
     
-    # Create Records based on Mode
-    sorted_prints = sorted(prints_map.items(), key=lambda item: int(item[0]))
-    
-    if mode == "rolled":
-        # Type-4 Records (1-14)
-        # Specs: IDC matches FGP (1, 2... 14).
-        # Assume Type-2 is IDC 00.
-        # Process all 14 images.
-        # prints_map should contain 1-14.
-        
-        for fp_num, fp_obj in sorted_prints:
-            num = int(fp_num)
-            if 1 <= num <= 14:
-                # Type 4
-                t4 = Type4(fp_obj, idc=num) # IDC matches FGP
-                t4.build()
-                t1.add_record(t4)
-                
+    # Create Records based on Mode (or reuse the serialized ones)
+    if image_records is None:
+        image_records = build_image_records(prints_map, mode)
+        if records_key:
+            save_image_records(session_id, records_key, image_records, mode)
     else:
-        # ATF Compliant (Type-14)
-        idc = 1
-        # Standard: Type 1 (IDC implicit), Type 2 (IDC 00), Type 14s (IDC 01, 02...).
-        
-        for fp_num, fp_obj in sorted_prints:
-            if int(fp_num) in [13, 14, 15]: # Only Left Slap, Right Slap, and Thumbs
-                t14 = Type14(fp_obj, idc)
-                t14.fcd = get_date().split(':')[0]
-                t14.build()
-                t1.add_record(t14)
-                idc += 1
+        print(f"Reusing {len(image_records)} image records")
+    for record in image_records:
+        t1.add_record(record)
             
-    output_path = os.path.join(session_dir, fname)
+    output_path = os.path.join(out_dir or session_dir, fname)
     t1.write_to_file(output_path)
     
     # Verify the generated EFT file
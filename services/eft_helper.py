@@ -488,3 +488,17 @@ class Type14Raw(Record):
             d[k] = self.fields[k]
             
         return d
+
+# Use `PrebuiltRecord` for records that are already serialized (e.g. image records reused from a previous generation).
+# The bytes are written as-is; only the record type and IDC are needed for the Type-1 CNT field.
+class PrebuiltRecord(Record):
+    def __init__(self, rtype, idc, data: bytes):
+        self.rtype = str(rtype)
+        self.idc = idc
+        self.data = bytes(data)
+
+    def _get_len(self):
+        return len(self.data)
+
+    def repr(self):
+        return self.data
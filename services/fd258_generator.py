@@ -1,106 +1,260 @@
-from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageStat
+from PIL import Image, ImageDraw, ImageFont
+import cv2
+import numpy as np
 
 import os
 import io
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from services.pdf_writer import PDFWriter, pdf_string
 
-class FD258Generator:
+
+# Define Layout (Normalized coordinates)
+LAYOUT = {
+    # Personal Details (approximate percentage coordinates based on FD-258)
+    # Name: "LAST NAME ... FIRST NAME ... MIDDLE NAME"
+    "name": {"x": 0.38, "y": 0.050, "size": 0.024}, 
+    # Row: Aliases (AKA)
+    "aliases": {"x": 0.05, "y": 0.115, "size": 0.018},
+    "ori": {"x": 0.53, "y": 0.115, "size": 0.018},
+    # Row: DOB, Sex, etc.
+    "dob": {"x": 0.81, "y": 0.14, "size": 0.018},
+    "sex": {"x": 0.55, "y": 0.172, "size": 0.018},
+    "race": {"x": 0.58, "y": 0.172, "size": 0.018},
+    "hgt": {"x": 0.62, "y": 0.172, "size": 0.018},
+    "wgt": {"x": 0.67, "y": 0.172, "size": 0.018},
+    "eyes": {"x": 0.71, "y": 0.172, "size": 0.018},
+    "hair": {"x": 0.76, "y": 0.172, "size": 0.018},       
+    # POB
+    "pob": {"x": 0.86, "y": 0.172, "size": 0.018}, 
+    # Citizenship (CTZ)
+    "ctz": {"x": 0.36, "y": 0.172, "size": 0.018}, 
+    # Residence
+    "residence": {"x": 0.02, "y": 0.155, "size": 0.018},
+    # Date generated
+    "date": {"x": 0.00, "y": 0.19, "size": 0.01},
+    # Reason Fingerprinted
+    "reason": {"x": 0.02, "y": 0.32, "size": 0.018},
+    # SOC
+    "soc": {"x": 0.36, "y": 0.31, "size": 0.024}, # 
+    # Fingerprints (box: x, y, w, h)
+    # R1-R5 (Row 1) - y~0.37 approx correct
+    "R1": {"x": 0.010, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Thumb
+    "R2": {"x": 0.205, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Index
+    "R3": {"x": 0.400, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Middle
+    "R4": {"x": 0.595, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Ring
+    "R5": {"x": 0.790, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Little
+    # L6-L10 (Row 2) - y~0.555 approx correct
+    "L1": {"x": 0.010, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Thumb
+    "L2": {"x": 0.205, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Index
+    "L3": {"x": 0.400, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Middle
+    "L4": {"x": 0.595, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Ring
+    "L5": {"x": 0.790, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Little
+    # Row 3: Plain (slaps) - y~0.745 approx correct
+    "P_L4": {"x": 0.010, "y": 0.745, "w": 0.385, "h": 0.230}, # Left 4 Fingers
+    "P_LT": {"x": 0.400, "y": 0.745, "w": 0.095, "h": 0.230}, # L Thumb
+    "P_RT": {"x": 0.500, "y": 0.745, "w": 0.095, "h": 0.230}, # R Thumb
+    "P_R4": {"x": 0.600, "y": 0.745, "w": 0.385, "h": 0.230}  # Right 4 Fingers
+}
+
+# FD-258 print box for each finger position
+# prints_map keys: 1-10 (Rolled), 11(RT Plain), 12(LT Plain), 13(R Plain 4), 14(L Plain 4), 15 (Thumbs Plain)
+FGP_MAP = {
+    1: "R1", 2: "R2", 3: "R3", 4: "R4", 5: "R5",
+    6: "L1", 7: "L2", 8: "L3", 9: "L4", 10: "L5",
+    # Plain
+    13: "P_R4", 14: "P_L4",
+    11: "P_RT", 12: "P_LT"
+}
+
+# Prints are loaded, inverted and resized in parallel (OpenCV/NumPy release the GIL)
+PREPARE_THREADS = int(os.environ.get("OEFT_FD258_THREADS", min(8, os.cpu_count() or 1)))
+_PREPARE_POOL = ThreadPoolExecutor(max_workers=PREPARE_THREADS, thread_name_prefix="fd258")
+
+# Printed FD-258 cards are 8 x 8 inches
+PAGE_WIDTH_PT = 8 * 72
+
+# Candidate TrueType fonts, first one found wins
+FONT_CANDIDATES = [
+    "arial.ttf",
+    r"C:\Windows\Fonts\arial.ttf",
+    r"C:\Windows\Fonts\Arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "FreeSans.ttf"
+]
+
+
+class FD258Template:
+    """
+    Everything about a blank card that does not depend on the applicant: the decoded
+    RGB card, the fonts sized for it, and the layout in pixel coordinates.
+    Built once per process (see `get_template`) and copied per render.
+    """
     def __init__(self, blank_path):
         self.blank_path = blank_path
-        self.width = 0
-        self.height = 0
-        if os.path.exists(blank_path):
-            with Image.open(blank_path) as img:
-                self.width = img.width
-                self.height = img.height
-
-        # Define Layout (Normalized coordinates)
-        self.layout = {
-            # Personal Details (approximate percentage coordinates based on FD-258)
-            # Name: "LAST NAME ... FIRST NAME ... MIDDLE NAME"
-            "name": {"x": 0.38, "y": 0.050, "size": 0.024}, 
-            # Row: Aliases (AKA)
-            "aliases": {"x": 0.05, "y": 0.115, "size": 0.018},
-            "ori": {"x": 0.53, "y": 0.115, "size": 0.018},
-            # Row: DOB, Sex, etc.
-            "dob": {"x": 0.81, "y": 0.14, "size": 0.018},
-            "sex": {"x": 0.55, "y": 0.172, "size": 0.018},
-            "race": {"x": 0.58, "y": 0.172, "size": 0.018},
-            "hgt": {"x": 0.62, "y": 0.172, "size": 0.018},
-            "wgt": {"x": 0.67, "y": 0.172, "size": 0.018},
-            "eyes": {"x": 0.71, "y": 0.172, "size": 0.018},
-            "hair": {"x": 0.76, "y": 0.172, "size": 0.018},       
-            # POB
-            "pob": {"x": 0.86, "y": 0.172, "size": 0.018}, 
-            # Citizenship (CTZ)
-            "ctz": {"x": 0.36, "y": 0.172, "size": 0.018}, 
-            # Residence
-            "residence": {"x": 0.02, "y": 0.155, "size": 0.018},
-            # Date generated
-            "date": {"x": 0.00, "y": 0.19, "size": 0.01},
-            # Reason Fingerprinted
-            "reason": {"x": 0.02, "y": 0.32, "size": 0.018},
-            # SOC
-            "soc": {"x": 0.36, "y": 0.31, "size": 0.024}, # 
-            # Fingerprints (box: x, y, w, h)
-            # R1-R5 (Row 1) - y~0.37 approx correct
-            "R1": {"x": 0.010, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Thumb
-            "R2": {"x": 0.205, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Index
-            "R3": {"x": 0.400, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Middle
-            "R4": {"x": 0.595, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Ring
-            "R5": {"x": 0.790, "y": 0.370, "w": 0.190, "h": 0.180}, # R. Little
-            # L6-L10 (Row 2) - y~0.555 approx correct
-            "L1": {"x": 0.010, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Thumb
-            "L2": {"x": 0.205, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Index
-            "L3": {"x": 0.400, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Middle
-            "L4": {"x": 0.595, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Ring
-            "L5": {"x": 0.790, "y": 0.555, "w": 0.190, "h": 0.180}, # L. Little
-            # Row 3: Plain (slaps) - y~0.745 approx correct
-            "P_L4": {"x": 0.010, "y": 0.745, "w": 0.385, "h": 0.230}, # Left 4 Fingers
-            "P_LT": {"x": 0.400, "y": 0.745, "w": 0.095, "h": 0.230}, # L Thumb
-            "P_RT": {"x": 0.500, "y": 0.745, "w": 0.095, "h": 0.230}, # R Thumb
-            "P_R4": {"x": 0.600, "y": 0.745, "w": 0.385, "h": 0.230}  # Right 4 Fingers
-        }
-    def generate(self, type2_data, prints_map):
-        """
-        type2_data: dict of text fields
-        prints_map: dict of Fingerprint objects or images
-        """
-        print(f"Generating FD258 with {len(prints_map)} prints...")
-        img = Image.open(self.blank_path).convert("RGB")
-        draw = ImageDraw.Draw(img)
-        # Load font
-        font_large = None
-        font_small = None
-        font_debug = None
-        # List of candidate paths
-        font_candidates = [
-            "arial.ttf",
-            r"C:\Windows\Fonts\arial.ttf",
-            r"C:\Windows\Fonts\Arial.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-            "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-            "FreeSans.ttf"
-        ]
-        for fpath in font_candidates:
+        with Image.open(blank_path) as img:
+            self.image = img.convert("RGB")
+            # A JPEG blank is embedded into PDFs as it is
+            self.jpeg = None
+            if img.format == "JPEG" and img.mode in ("L", "RGB"):
+                with open(blank_path, "rb") as f:
+                    self.jpeg = (f.read(), "DeviceGray" if img.mode == "L" else "DeviceRGB")
+        self.pixels = np.asarray(self.image) # Copied per render as the canvas
+        self.width = self.image.width
+        self.height = self.image.height
+
+        # Fonts
+        self.size_large = int(self.height * 0.018) # ~53px
+        self.size_small = int(self.height * 0.015) # ~40px
+        self.font_large, self.font_small, self.font_debug = self._load_fonts()
+
+        # Layout: text anchors (x, y, font) and print boxes (x, y, w, h) in pixels
+        self.text = {}
+        self.text_size = {} # Font size in pixels, for vector text
+        self.boxes = {}
+        for key, conf in LAYOUT.items():
+            x = int(conf["x"] * self.width)
+            y = int(conf["y"] * self.height)
+            if "w" in conf:
+                self.boxes[key] = (x, y, int(conf["w"] * self.width), int(conf["h"] * self.height))
+            else:
+                large = conf.get("size", 0) >= 0.015
+                self.text[key] = (x, y, self.font_large if large else self.font_small)
+                self.text_size[key] = self.size_large if large else self.size_small
+
+    def _load_fonts(self):
+        for fpath in FONT_CANDIDATES:
             try:
-                # Calculate size
-                size_large = int(self.height * 0.018) # ~53px
-                size_small = int(self.height * 0.015) # ~40px
-                font_large = ImageFont.truetype(fpath, size_large)
-                font_small = ImageFont.truetype(fpath, size_small)
-                font_debug = ImageFont.truetype(fpath, 20)
+                fonts = (ImageFont.truetype(fpath, self.size_large), ImageFont.truetype(fpath, self.size_small), ImageFont.truetype(fpath, 20))
                 print(f"Success: Loaded font from {fpath}")
-                break
+                return fonts
             except IOError:
                 continue
-        if font_large is None:
-            print("WARNING: Could not load any TrueType font. Falling back to default (tiny) bitmap font.") # Catch error if font fails to load
-            font_large = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-            font_debug = ImageFont.load_default()
-        # 1. Draw Text
+        print("WARNING: Could not load any TrueType font. Falling back to default (tiny) bitmap font.") # Catch error if font fails to load
+        default = ImageFont.load_default()
+        return default, default, default
+
+
+_TEMPLATES = {} # (blank_path, mtime) -> FD258Template
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def get_template(blank_path) -> FD258Template:
+    """
+    Returns the process-wide template of a blank card, loading it on first use
+    (or when the file changed).
+    """
+    key = (os.path.abspath(blank_path), os.path.getmtime(blank_path))
+    with _TEMPLATES_LOCK:
+        template = _TEMPLATES.get(key)
+        if template is None:
+            template = FD258Template(blank_path)
+            _TEMPLATES.clear()
+            _TEMPLATES[key] = template
+        return template
+
+
+def load_print(fp_obj):
+    """
+    Loads a print as a grayscale array: a raw segment (RawFP with is_raw), an image
+    file (img_path) or an in-memory image (img/image, BGR or gray).
+    """
+    if getattr(fp_obj, 'is_raw', False):
+        raw_data = np.fromfile(fp_obj.img_path, dtype=np.uint8)
+        # Validate expected size
+        expected_size = fp_obj.w * fp_obj.h
+        if raw_data.size > expected_size:
+            # Header expected
+            print(f"Trimming raw data: {raw_data.size} -> {expected_size}")
+            raw_data = raw_data[-expected_size:]
+        if raw_data.size != expected_size:
+            raise ValueError(f"Size mismatch: {raw_data.size} != {fp_obj.w}*{fp_obj.h}")
+        return raw_data.reshape(fp_obj.h, fp_obj.w)
+    if getattr(fp_obj, 'img_path', None) and os.path.exists(fp_obj.img_path):
+        img = cv2.imread(fp_obj.img_path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Cannot decode {os.path.basename(fp_obj.img_path)}")
+        return img
+    # Handle both naming conventions
+    img_arr = getattr(fp_obj, 'img', None)
+    if img_arr is None:
+        img_arr = getattr(fp_obj, 'image', None)
+    if img_arr is None or img_arr.size == 0:
+        raise ValueError("Empty CV2 Image")
+    if len(img_arr.shape) == 3:
+        return cv2.cvtColor(img_arr, cv2.COLOR_BGR2GRAY)
+    return img_arr
+
+
+def prepare_print(fp_obj, box):
+    """
+    Loads a print and fits it into its card box: auto-inverted if mostly dark
+    (white ridges on black background), downscaled keeping the aspect ratio.
+
+    Returns:
+        (gray array, paste_x, paste_y), or (None, error message) on failure.
+    """
+    try:
+        img = load_print(fp_obj)
+    except Exception as e:
+        print(f"Failed to load image: {e}")
+        return None, str(e)
+    if img.mean() < 128:
+        # Mostly dark, invert
+        img = 255 - img
+    # Resize to fit within aspect ratio (only ever shrinks, like PIL's thumbnail)
+    paste_x, paste_y, w, h = fit_box(box, img.shape[1], img.shape[0])
+    if (w, h) != (img.shape[1], img.shape[0]):
+        img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+    return img, paste_x, paste_y
+
+
+def fit_box(box, w, h):
+    """
+    Fits a w x h print into a card box keeping its aspect ratio (never enlarged) and centers it.
+    Returns (x, y, w, h) in card pixels.
+    """
+    target_x, target_y, target_w, target_h = box
+    scale = min(target_w / w, target_h / h)
+    if scale < 1:
+        w, h = max(1, round(w * scale)), max(1, round(h * scale))
+    # Center in box
+    return target_x + (target_w - w) // 2, target_y + (target_h - h) // 2, w, h
+
+
+def prepare_native(fp_obj, box):
+    """
+    Loads a print for PDF output: kept at native resolution and compressed losslessly,
+    with its placement in the card box. Dark prints are inverted by the PDF viewer.
+
+    Returns:
+        (image stream data, width, height, invert, placement), or (None, error message) on failure.
+    """
+    try:
+        img = np.ascontiguousarray(load_print(fp_obj))
+    except Exception as e:
+        print(f"Failed to load image: {e}")
+        return None, str(e)
+    h, w = img.shape[:2]
+    return zlib.compress(img.tobytes(), 6), w, h, img.mean() < 128, fit_box(box, w, h)
+
+
+class FD258Generator:
+    def __init__(self, blank_path):
+        self.blank_path = blank_path
+        self.template = get_template(blank_path)
+        self.width = self.template.width
+        self.height = self.template.height
+        self.layout = LAYOUT
+
+    def text_fields(self, type2_data):
+        """
+        Returns the (layout key, text) pairs printed on the card.
+        """
         # Mapping type2 keys to layout keys
         # 2.018 Name
         name = type2_data.get("2.018", "")
@@ -140,123 +294,56 @@ class FD258Generator:
              date_txt = datetime.now().strftime("%m/%d/%Y")             
         # 2.049 Reason Fingerprinted
         reason = type2_data.get("2.049", "FAUF") # Default to FAUF to be more useful if not used with ATF
-        fields = [
+        return [
              ("name", name), ("dob", dob), ("soc", soc), ("sex", sex),
              ("race", race), ("hgt", hgt), ("wgt", wgt), ("eyes", eyes),
              ("hair", hair), ("pob", pob), ("ctz", ctz),
              ("residence", residence), ("date", date_txt), ("reason", reason)
         ]
-        for key, val in fields:
-            if key in self.layout:
-                conf = self.layout[key]
-                x = int(conf["x"] * self.width)
-                y = int(conf["y"] * self.height)
-                f = font_large if conf.get("size", 0) >= 0.015 else font_small
+
+    def generate(self, type2_data, prints_map):
+        """
+        type2_data: dict of text fields
+        prints_map: dict of Fingerprint objects or images
+        """
+        print(f"Generating FD258 with {len(prints_map)} prints...")
+        template = self.template
+        font_debug = template.font_debug
+
+        # Prepare all prints concurrently
+        jobs = {}
+        for fgp, layout_key in FGP_MAP.items():
+            fp_obj = prints_map.get(fgp)
+            if layout_key in template.boxes and fp_obj:
+                jobs[layout_key] = _PREPARE_POOL.submit(prepare_print, fp_obj, template.boxes[layout_key])
+        prepared = {layout_key: job.result() for layout_key, job in jobs.items()}
+
+        # Composite the prints onto a copy of the blank card in one pass
+        canvas = template.pixels.copy()
+        for layout_key, result in prepared.items():
+            if result[0] is not None:
+                fp_img, paste_x, paste_y = result
+                h, w = fp_img.shape
+                canvas[paste_y:paste_y + h, paste_x:paste_x + w] = fp_img[:, :, None]
+        img = Image.fromarray(canvas)
+        draw = ImageDraw.Draw(img)
+
+        # 1. Draw Text
+        for key, val in self.text_fields(type2_data):
+            if key in template.text:
+                x, y, f = template.text[key]
                 draw.text((x, y), str(val), fill="black", font=f)
 
-        # 2. Draw Fingerprints
-        # prints_map keys: 1-10 (Rolled), 11(RT Plain), 12(LT Plain), 13(R Plain 4), 14(L Plain 4), 15 (Thumbs Plain)
-        # Map FGPs to layout keys
-        fgp_map = {
-            1: "R1", 2: "R2", 3: "R3", 4: "R4", 5: "R5",
-            6: "L1", 7: "L2", 8: "L3", 9: "L4", 10: "L5",
-            # Plain
-            13: "P_R4", 14: "P_L4", 
-            11: "P_RT", 12: "P_LT"
-        }
-        
+        # 2. Mark print boxes that could not be filled
         # FD258 expects separate plain thumbs (11, 12); splitting record is required
-        # Iterate over all expected keys in layout to ensure we draw something (image or error) and check all mapping keys
-        for fgp, layout_key in fgp_map.items():
-            if layout_key not in self.layout: continue
-            fp_obj = prints_map.get(fgp)
-            if fp_obj:
-                # Get the image from fp_obj
-                # fp_obj is expected to be a Fingerprint object which has an image (numpy array or path)
-                fp_img = None
-                img_error_msg = ""
-                if hasattr(fp_obj, 'is_raw') and fp_obj.is_raw:
-                    # Load Raw
-                    try:
-                        with open(fp_obj.img_path, 'rb') as f:
-                            raw_data = f.read()
-                        # Validate expected size
-                        expected_size = fp_obj.w * fp_obj.h
-                        if len(raw_data) > expected_size:
-                             # Header expected
-                             print(f"Trimming raw data: {len(raw_data)} -> {expected_size}")
-                             raw_data = raw_data[-expected_size:]
-                        if len(raw_data) != expected_size:
-                             raise ValueError(f"Size mismatch: {len(raw_data)} != {fp_obj.w}*{fp_obj.h}")
-                        fp_img = Image.frombytes('L', (fp_obj.w, fp_obj.h), raw_data)
-                    # Error handling if raw data fails
-                    except Exception as e:
-                        print(f"Failed to load raw image: {e}")
-                        img_error_msg = str(e)
-                elif hasattr(fp_obj, 'img_path') and os.path.exists(fp_obj.img_path):
-                    try:
-                         # Force verify
-                         img_verify = Image.open(fp_obj.img_path)
-                         img_verify.verify()
-                         # Load image
-                         fp_img = Image.open(fp_obj.img_path)
-                    # Error handling if image fails
-                    except Exception as e:
-                        print(f"Failed to load image: {e}")
-                        img_error_msg = str(e)
-
-                elif hasattr(fp_obj, 'img') or hasattr(fp_obj, 'image'): # numpy array
-                    # Convert cv2 (BGR) to RGB
-                    import cv2
-                    try:
-                        # Handle both naming conventions
-                        img_arr = getattr(fp_obj, 'img', None)
-                        if img_arr is None:
-                            img_arr = getattr(fp_obj, 'image', None)
-                        # Error handling if numpy array fails
-                        if img_arr is not None and img_arr.size > 0:
-                            if len(img_arr.shape) == 3:
-                                rgb = cv2.cvtColor(img_arr, cv2.COLOR_BGR2RGB)
-                            else:
-                                rgb = cv2.cvtColor(img_arr, cv2.COLOR_GRAY2RGB)
-                            fp_img = Image.fromarray(rgb)
-                        else:
-                             img_error_msg = "Empty CV2 Image"
-                    # Error handling if numpy array fails
-                    except Exception as e:
-                        print(f"Failed to load CV2 image: {e}")
-                        img_error_msg = str(e)
-
-                if fp_img:
-                    # Convert to grayscale
-                    # Detect contrast and auto-invert if mostly dark (white ridges on black background)
-                    if fp_img.mode != 'L':
-                        fp_img = fp_img.convert('L')
-                    stat = ImageStat.Stat(fp_img)
-                    if stat.mean[0] < 128:
-                        # Mostly dark, invert
-                        fp_img = ImageOps.invert(fp_img)
-                    conf = self.layout[layout_key]
-                    # Get target dimensions
-                    target_w = int(conf["w"] * self.width)
-                    target_h = int(conf["h"] * self.height)
-                    target_x = int(conf["x"] * self.width)
-                    target_y = int(conf["y"] * self.height)
-                    # Resize to fit within aspect ratio
-                    fp_img.thumbnail((target_w, target_h), Image.Resampling.LANCZOS)
-                    # Center in box
-                    paste_x = target_x + (target_w - fp_img.width) // 2
-                    paste_y = target_y + (target_h - fp_img.height) // 2
-                    # Paste image in box
-                    img.paste(fp_img, (paste_x, paste_y))
-                else:
+        for fgp, layout_key in FGP_MAP.items():
+            if layout_key not in template.boxes: continue
+            target_x, target_y, target_w, target_h = template.boxes[layout_key]
+            if layout_key in prepared:
+                if prepared[layout_key][0] is None:
+                    img_error_msg = prepared[layout_key][1]
                     # Debug: Draw red X if image missing
                     # TODO: Not sure how this might handle missing images, may need to adjust in the future
-                    conf = self.layout[layout_key]
-                    target_w = int(conf["w"] * self.width)
-                    target_h = int(conf["h"] * self.height)
-                    target_x = int(conf["x"] * self.width)
-                    target_y = int(conf["y"] * self.height)
                     draw.rectangle([target_x, target_y, target_x + target_w, target_y + target_h], outline="red", width=5)
                     # Wrap error text
                     err_lines = [img_error_msg[i:i+20] for i in range(0, len(img_error_msg), 20)]
@@ -266,12 +353,6 @@ class FD258Generator:
                          y_off += 25
             else:
                  # Missing Content
-                 img_error_msg = "MISSING DATA"
-                 conf = self.layout[layout_key]
-                 target_w = int(conf["w"] * self.width)
-                 target_h = int(conf["h"] * self.height)
-                 target_x = int(conf["x"] * self.width)
-                 target_y = int(conf["y"] * self.height)
                  draw.rectangle([target_x, target_y, target_x + target_w, target_y + target_h], outline="blue", width=3)
                  draw.text((target_x+10, target_y+target_h/2), "MISSING", fill="blue", font=font_debug)
         # Return bytes
@@ -279,3 +360,77 @@ class FD258Generator:
         img.save(buf, format="JPEG", quality=90)
         print("FD258 Generation Complete")
         return buf.getvalue()
+
+    def generate_pdf(self, type2_data, prints_map, out_path):
+        """
+        Writes the card as a print-ready PDF to `out_path`: the blank card (JPEG passed
+        through) and every print as separate images at native resolution, with vector text.
+        Objects are streamed to the file as they are produced.
+        """
+        print(f"Generating FD258 PDF with {len(prints_map)} prints...")
+        template = self.template
+        scale = PAGE_WIDTH_PT / template.width # Points per card pixel
+        page_w, page_h = PAGE_WIDTH_PT, template.height * scale
+
+        # Card pixel rectangle -> PDF user space (origin bottom left)
+        def rect(x, y, w, h):
+            return f"{x * scale:.2f} {page_h - (y + h) * scale:.2f} {w * scale:.2f} {h * scale:.2f}"
+
+        def text(x, y, size, val, color="0 0 0"):
+            # PIL places text by its top; PDF by the baseline
+            baseline = page_h - (y + size * 0.9) * scale
+            return f"BT {color} rg /F1 {size * scale:.2f} Tf {x * scale:.2f} {baseline:.2f} Td ".encode() + pdf_string(val) + b" Tj ET"
+
+        # Prepare all prints concurrently (load, invert check, compression)
+        jobs = {}
+        for fgp, layout_key in FGP_MAP.items():
+            fp_obj = prints_map.get(fgp)
+            if layout_key in template.boxes and fp_obj:
+                jobs[layout_key] = _PREPARE_POOL.submit(prepare_native, fp_obj, template.boxes[layout_key])
+
+        with open(out_path, "wb") as f:
+            pdf = PDFWriter(f)
+            images = {}
+            content = []
+
+            # Blank card
+            if template.jpeg is not None:
+                images["Card"] = pdf.add_jpeg(template.jpeg[0], template.width, template.height, template.jpeg[1])
+            else:
+                images["Card"] = pdf.add_image(template.pixels)
+            content.append(f"q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Card Do Q".encode())
+
+            # 1. Text
+            for key, val in self.text_fields(type2_data):
+                if key in template.text:
+                    x, y, _ = template.text[key]
+                    content.append(text(x, y, template.text_size[key], val))
+
+            # 2. Prints, written as each one is ready
+            for fgp, layout_key in FGP_MAP.items():
+                if layout_key not in template.boxes: continue
+                target_x, target_y, target_w, target_h = template.boxes[layout_key]
+                if layout_key in jobs:
+                    result = jobs[layout_key].result()
+                    if result[0] is not None:
+                        data, w, h, invert, placement = result
+                        name = f"P{fgp}"
+                        images[name] = pdf.add_flate_image(w, h, data, invert=invert)
+                        x, y, pw, ph = placement
+                        px, py, sw, sh = rect(x, y, pw, ph).split()
+                        content.append(f"q {sw} 0 0 {sh} {px} {py} cm /{name} Do Q".encode())
+                    else:
+                        # Red box with the error message
+                        content.append(f"1 0 0 RG {5 * scale:.2f} w {rect(target_x, target_y, target_w, target_h)} re S".encode())
+                        err = result[1]
+                        for i, line in enumerate(err[j:j+20] for j in range(0, len(err), 20)):
+                            content.append(text(target_x + 10, target_y + 10 + 25 * i, 20, line, "1 0 0"))
+                else:
+                    # Missing Content
+                    content.append(f"0 0 1 RG {3 * scale:.2f} w {rect(target_x, target_y, target_w, target_h)} re S".encode())
+                    content.append(text(target_x + 10, target_y + target_h / 2, 20, "MISSING", "0 0 1"))
+
+            pdf.add_page(page_w, page_h, b"\n".join(content), images=images, fonts={"F1": pdf.helvetica()})
+            pdf.close()
+        print("FD258 PDF Generation Complete")
+        return out_path
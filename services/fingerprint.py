@@ -1,9 +1,27 @@
 import os
 import cv2
 import math
+import subprocess
 import numpy as np
 from services.eft_helper import US_CHAR
-from services.nbis_helper import segment_fingerprints, get_nfiq_quality
+from services.nbis_helper import segment_fingerprints, get_nfiq_quality, decode_wsq
+from services.artifact_cache import ARTIFACT_CACHE, array_digest, digest
+from services.slap_segmentation import segment_slap
+from services.conditioning import condition_print
+
+# Intermediate PNGs are only read by opj_compress and nfseg: favour speed over size
+PNG_FAST = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+# Fixed Type-4 image sizes (w, h) by finger position
+TYPE4_SIZES = {
+    **{fp: (800, 750) for fp in range(1, 11)},  # Rolled
+    11: (400, 572), 12: (400, 572),             # Plain Thumbs
+    13: (1600, 1000), 14: (1600, 1000)          # Plain 4 Fingers
+}
+
+def type4_size(fp_number):
+    """Returns the fixed Type-4 (w, h) of a finger position, or None if it has none."""
+    return TYPE4_SIZES.get(int(fp_number))
 
 class Finger:
     """
@@ -19,8 +37,10 @@ class Finger:
         t (float): Rotation angle (theta) in degrees.
         score (str): NFIQ quality score (1-5).
         tmpdir (str): Directory where the segment file resides.
+
+    A known `score` (e.g. from the artifact cache) skips running nfiq.
     """
-    def __init__(self, str_data, tmpdir):
+    def __init__(self, str_data, tmpdir, score=None):
         self.orgID = "15" # Vendor ID for NFIQv1
         self.algID = "14205" # Algorithm ID for NFIQv1
         self.str = str_data
@@ -33,7 +53,10 @@ class Finger:
         self.t = 0.0
         self.readString()
         self.computeBox()
-        self.segmentQuality()
+        if score is None:
+            self.segmentQuality()
+        else:
+            self.score = str(score)
 
     def readString(self):
         """
@@ -87,7 +110,8 @@ class Finger:
         try:
             # Pass full path to nfiq
             full_path = os.path.join(self.tmpdir, self.name)
-            self.score = str(get_nfiq_quality(full_path))
+            raw_size = (self.sw, self.sh) if self.name.endswith(".raw") else None
+            self.score = str(get_nfiq_quality(full_path, raw_size))
         except Exception as e:
             # print(f"NFIQ failed: {e}") # Silent fail
             self.score = "255"
@@ -120,6 +144,7 @@ class Fingerprint:
         name (str): Unique identifier for this fingerprint instance.
         fingers (List[Finger]): List of segmented `Finger` objects if this is a slap image.
         converted (str): Path to the converted JP2 file.
+        digest (str): Hash of the grayscale pixels; key of all cached artifacts of this print.
     """
     def __init__(self, src_img, fp_number, tmpdir, session_id):
         self.tmpdir = tmpdir
@@ -129,7 +154,7 @@ class Fingerprint:
         self.encoding = 'png'
         self.converted = ""
         
-        # Force 8-bit Grayscale
+        # Force 8-bit Grayscale (callers normally decode straight to gray already)
         if len(src_img.shape) == 3 and src_img.shape[2] == 3:
             print(f"Converting FP {fp_number} from RGB {src_img.shape} to Grayscale")
             self.img = cv2.cvtColor(src_img, cv2.COLOR_BGR2GRAY)
@@ -137,6 +162,7 @@ class Fingerprint:
             self.img = src_img
             
         print(f"FP {fp_number} Image Shape: {self.img.shape}")
+        self.digest = array_digest(self.img)
         self.fingers = []
         
         # Attributes required by Type14 Record
@@ -151,43 +177,83 @@ class Fingerprint:
         self.cga = "JP2"                  # Compression Algorithm
         self.bpx = "8"                    # Bits Per Pixel
 
-    def process_and_convert(self, compression_ratio=10):
+    def condition(self, trim=True):
         """
-        Processes the image: saves as PNG, converts to JP2 using `opj_compress`,
-        and triggers segmentation if applicable.
+        Conditions the print before encoding: trims blank margins to the ridge area,
+        whitens the background and stretches the ridge contrast (see services/conditioning.py).
+        Segment positions are found on the conditioned image, so they refer to the image in
+        the record.
 
         Args:
-            compression_ratio (int): The compression ratio for JPEG 2000 (passed to -r flag).
+            trim (bool): Crop to the ridge area (off for fixed-size Type-4 images).
+        """
+        self.img, (x, y) = condition_print(self.img, trim)
+        self.digest = array_digest(self.img)
+        self.hll = str(self.img.shape[1])
+        self.vll = str(self.img.shape[0])
+        print(f"FP {self.fp_number} conditioned: {self.img.shape[1]}x{self.img.shape[0]} at ({x}, {y})")
 
-        Returns:
-            str: Path to the generated JP2 file, or None on failure.
+    def _write_png(self):
+        """
+        Writes the current image as PNG, restoring it from the artifact cache when possible.
+        Always rewritten, so a PNG left over from a previous crop is never reused.
         """
         png_path = os.path.join(self.tmpdir, self.name + ".png")
-        if not os.path.exists(png_path):
-            cv2.imwrite(png_path, self.img)
-            
-        png_size = os.path.getsize(png_path)
-        print(f"FP {self.fp_number} PNG Saved: {png_path} ({png_size} bytes)")
-        
+        if ARTIFACT_CACHE.export(self.digest, "image.png", png_path) is None:
+            tmp_path = png_path + ".tmp.png"
+            cv2.imwrite(tmp_path, self.img, PNG_FAST)
+            os.replace(tmp_path, png_path)
+            ARTIFACT_CACHE.put(self.digest, "image.png", png_path)
+        return png_path
+
+    def _encode_jp2(self, png_path, compression_ratio):
+        """
+        Converts the PNG to JP2 with `opj_compress`, reusing a cached encode of the same pixels and ratio.
+        """
         jp2_path = os.path.join(self.tmpdir, self.name + ".jp2")
-        
+        key = digest("jp2", self.digest, compression_ratio)
+        if ARTIFACT_CACHE.export(key, "image.jp2", jp2_path) is not None:
+            print(f"FP {self.fp_number} JP2 (ratio {compression_ratio}) restored from cache")
+            self.converted = jp2_path
+            return jp2_path
+
         # Command: opj_compress -i input.png -o output.jp2 -r ratio -n 2
         cmd = ["opj_compress", "-i", png_path, "-o", jp2_path, "-r", str(compression_ratio), "-n", "2"]
-        
+
         try:
             # Capture stdout/stderr
-            import subprocess
             res = subprocess.run(cmd, capture_output=True, text=True)
             if res.returncode != 0:
                 print(f"opj_compress failed for FP {self.fp_number}: {res.stderr}")
                 return None
-            
-            self.converted = jp2_path
         except Exception as e:
             print(f"Conversion failed: {e}")
             return None
 
-        if int(self.fp_number) >= 13:
+        ARTIFACT_CACHE.put(key, "image.jp2", jp2_path)
+        self.converted = jp2_path
+        return jp2_path
+
+    def process_and_convert(self, compression_ratio=10):
+        """
+        Processes the image: saves as PNG, converts to JP2 using `opj_compress`,
+        and triggers segmentation if applicable.
+        Each step is skipped if the artifact cache holds its result for the same pixels.
+
+        Args:
+            compression_ratio (int): The compression ratio for JPEG 2000 (passed to -r flag).
+
+        Returns:
+            str: Path to the generated JP2 file, or None on failure.
+        """
+        png_path = self._write_png()
+        png_size = os.path.getsize(png_path)
+        print(f"FP {self.fp_number} PNG Saved: {png_path} ({png_size} bytes)")
+
+        if self._encode_jp2(png_path, compression_ratio) is None:
+            return None
+
+        if int(self.fp_number) >= 13 and not self.fingers:
             self.segment()
             
         return self.converted
@@ -201,69 +267,128 @@ class Fingerprint:
         - 13-14: 1600x1000 (Plain 4 Fingers)
         """
         # Determine target dimensions
-        target_w, target_h = 0, 0
         fp_num = int(self.fp_number)
-        
-        if 1 <= fp_num <= 10:
-            target_w, target_h = 800, 750
-        elif 11 <= fp_num <= 12:
-            target_w, target_h = 400, 572
-        elif 13 <= fp_num <= 14:
-            target_w, target_h = 1600, 1000
-        else:
+        if type4_size(fp_num) is None:
             # Fallback for unknown
             return self.process_and_convert(compression_ratio)
+        target_w, target_h = type4_size(fp_num)
             
         # Resize logic
         # We need to fit the crop into target_w/h without distortion?
         # Or usually stretch? Or Pad?
         # FBI specs usually imply 500ppi. If the crop is correct, resizing it
         # is the best bet to enforce strict pixel dimensions.
-        print(f"Resizing FP {fp_num} to {target_w}x{target_h} for Type-4")
-        resized_img = cv2.resize(self.img, (target_w, target_h), interpolation=cv2.INTER_AREA)
-        
-        # Update internal image
-        self.img = resized_img
+        # Card crops normally arrive at this size already (see shared_image.crop_print).
+        if self.img.shape[:2] != (target_h, target_w):
+            print(f"Resizing FP {fp_num} to {target_w}x{target_h} for Type-4")
+            self.img = cv2.resize(self.img, (target_w, target_h), interpolation=cv2.INTER_AREA)
+            self.digest = array_digest(self.img)
         self.hll = str(target_w)
         self.vll = str(target_h)
         
         # Proceed with normal conversion (save PNG -> JP2)
         # Note: Type-4 segmentation is not required/standard in the same way as Type-14 slaps.
         # So we skip segment() for 13-14 in Type-4 mode (as they are just treated as flat images).
-        
-        png_path = os.path.join(self.tmpdir, self.name + ".png")
-        if not os.path.exists(png_path):
-            cv2.imwrite(png_path, self.img)
-            
-        jp2_path = os.path.join(self.tmpdir, self.name + ".jp2")
-        
-        # Command: opj_compress ...
-        cmd = ["opj_compress", "-i", png_path, "-o", jp2_path, "-r", str(compression_ratio), "-n", "2"]
-        
-        try:
-            import subprocess
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            if res.returncode != 0:
-                print(f"opj_compress failed for FP {self.fp_number}: {res.stderr}")
-                return None
-            self.converted = jp2_path
-        except Exception as e:
-            print(f"Conversion failed: {e}")
-            return None
-            
-        return self.converted
+        png_path = self._write_png()
+        return self._encode_jp2(png_path, compression_ratio)
 
     def segment(self):
         """
         Segments the slap image into individual fingers using `nfseg`.
         Populates the `self.fingers` list with `Finger` objects.
+
+        Segment files and NFIQ scores are cached per slap. nfseg names its output after
+        the input file, so cached files are stored by suffix and restored under this
+        instance's name.
         """
         png_path = os.path.join(self.tmpdir, self.name + ".png")
+        key = digest("segments", self.digest, self.fp_number)
+        cached = ARTIFACT_CACHE.get_json(key)
+        if cached is not None:
+            try:
+                fingers = []
+                for seg in cached:
+                    seg_name = self.name + seg["suffix"]
+                    self._drop_decoded(seg_name)
+                    if ARTIFACT_CACHE.export(key, seg["suffix"], os.path.join(self.tmpdir, seg_name)) is None:
+                        raise FileNotFoundError(seg["suffix"])
+                    fingers.append(Finger(seg["line"].replace("{name}", seg_name), self.tmpdir, score=seg["score"]))
+                self.fingers = fingers
+                print(f"FP {self.fp_number} segments restored from cache")
+                return
+            except FileNotFoundError:
+                # Entry partially evicted, segment again
+                pass
+
         try:
-            segments = segment_fingerprints(png_path, self.fp_number)
+            if not os.path.exists(png_path):
+                self._write_png() # nfseg reads the PNG (segment_only() skips writing it on cache hits)
+            try:
+                segments = segment_fingerprints(png_path, self.fp_number)
+            except Exception as e:
+                print(f"nfseg failed for FP {self.fp_number}: {e}")
+                segments = []
+            fallback = not segments
+            if fallback:
+                # A poor slap still gets positions and segments (see slap_segmentation)
+                segments = segment_slap(self.img, png_path, self.fp_number)
+            entries = []
             for segment in segments:
+                self._drop_decoded(segment["file"])
                 # The Finger class expects a string, so we need to reconstruct it
-                line = f"FILE {segment['file']} e 3 sw {segment['sw']} sh {segment['sh']} sx {segment['sx']} sy {segment['sy']} th {segment['th']}"
-                self.fingers.append(Finger(line, self.tmpdir))
+                params = f"e 3 sw {segment['sw']} sh {segment['sh']} sx {segment['sx']} sy {segment['sy']} th {segment['th']}"
+                finger = Finger(f"FILE {segment['file']} {params}", self.tmpdir)
+                self.fingers.append(finger)
+                if segment["file"].startswith(self.name):
+                    suffix = segment["file"][len(self.name):]
+                    entries.append({"suffix": suffix, "line": f"FILE {{name}} {params}", "score": finger.score})
+
+            # Only cache complete nfseg results (an NFIQ or nfseg failure may be transient)
+            if not fallback and entries and len(entries) == len(segments) and all(e["score"] != "255" for e in entries):
+                for entry in entries:
+                    ARTIFACT_CACHE.put(key, entry["suffix"], os.path.join(self.tmpdir, self.name + entry["suffix"]))
+                ARTIFACT_CACHE.put_json(key, entries)
         except Exception as e:
             print(f"Segmentation failed: {e}")
+
+    def segment_only(self):
+        """
+        Segments the slap without encoding it (FD-258 cards need only the fingers).
+        Shares the segment cache with process_and_convert(), so a card rendered for a
+        slap already segmented by /api/generate does not run nfseg again.
+
+        Returns:
+            List[Finger]: The segmented fingers.
+        """
+        if not self.fingers:
+            self.segment()
+        return self.fingers
+
+    def decoded_segment(self, finger):
+        """
+        Returns the path of a finger segment as raw 8-bit pixels (WSQ segments are decoded
+        with `dwsq`). Decoded raws are cached next to the segments they come from.
+        """
+        seg_path = os.path.join(self.tmpdir, finger.name)
+        base, ext = os.path.splitext(finger.name)
+        if ext.lower() != ".wsq":
+            return seg_path
+
+        key = digest("segments", self.digest, self.fp_number)
+        raw_path = os.path.join(self.tmpdir, base + ".raw")
+        suffix = base[len(self.name):] + ".raw" if base.startswith(self.name) else None
+        if suffix and ARTIFACT_CACHE.export(key, suffix, raw_path) is not None:
+            return raw_path
+
+        raw_path = decode_wsq(seg_path)
+        if suffix:
+            ARTIFACT_CACHE.put(key, suffix, raw_path)
+        return raw_path
+
+    def _drop_decoded(self, seg_name):
+        # decode_wsq reuses an existing .raw; remove it so it is never stale relative to the segment
+        if seg_name.endswith(".raw"):
+            return # The segment is raw itself
+        raw_path = os.path.join(self.tmpdir, os.path.splitext(seg_name)[0] + ".raw")
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
@@ -0,0 +1,171 @@
+import os
+import struct
+
+# Header-only probing of uploaded images.
+# Reads just enough of a JPEG/PNG/TIFF file to learn its size, resolution and
+# channel count so oversized scans (or decompression bombs) can be rejected, or
+# decoded at reduced scale, before OpenCV allocates the full bitmap.
+
+MAX_PIXELS = int(os.environ.get("OEFT_MAX_IMAGE_PIXELS", 120_000_000))
+MAX_DIMENSION = int(os.environ.get("OEFT_MAX_IMAGE_DIMENSION", 30000))
+# Resolution the FD-258 boxes need; scans far above this are decoded at reduced scale
+TARGET_DPI = int(os.environ.get("OEFT_TARGET_DPI", 500))
+# Reduction factors supported by libjpeg DCT scaling (cv2.IMREAD_REDUCED_*)
+REDUCTION_FACTORS = (8, 4, 2)
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageRejected(Exception):
+    """
+    Raised when an image header is unreadable or exceeds the configured limits.
+    `status_code` is the HTTP status to report.
+    """
+    def __init__(self, message, status_code=415):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _probe_jpeg(f):
+    info = {"format": "jpeg", "dpi": None}
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ImageRejected("Corrupt JPEG header")
+        code = marker[1]
+        # Fill bytes and markers without a length
+        if code == 0xFF:
+            f.seek(-1, 1)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            raise ImageRejected("JPEG has no frame header")
+        seg_len = struct.unpack(">H", f.read(2))[0]
+        if code == 0xE0 and seg_len >= 16:
+            # JFIF APP0: units, Xdensity, Ydensity
+            data = f.read(seg_len - 2)
+            if data[:5] == b"JFIF\x00":
+                units, xd, yd = struct.unpack(">BHH", data[7:12])
+                if units == 1 and xd > 0:
+                    info["dpi"] = xd
+                elif units == 2 and xd > 0:
+                    info["dpi"] = round(xd * 2.54)
+            continue
+        if code in JPEG_SOF_MARKERS:
+            _, h, w, channels = struct.unpack(">BHHB", f.read(6))
+            info.update({"width": w, "height": h, "channels": channels})
+            return info
+        f.seek(seg_len - 2, 1)
+
+
+def _probe_png(f):
+    info = {"format": "png", "dpi": None}
+    f.seek(8)
+    length, chunk = struct.unpack(">I4s", f.read(8))
+    if chunk != b"IHDR":
+        raise ImageRejected("Corrupt PNG header")
+    w, h, depth, color_type = struct.unpack(">IIBB", f.read(10))
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color_type, 3)
+    info.update({"width": w, "height": h, "channels": channels})
+    f.seek(8 + 8 + length + 4)
+
+    # pHYs must appear before the first IDAT
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, chunk = struct.unpack(">I4s", header)
+        if chunk == b"pHYs":
+            ppu_x, ppu_y, unit = struct.unpack(">IIB", f.read(9))
+            if unit == 1 and ppu_x > 0:
+                info["dpi"] = round(ppu_x * 0.0254)
+            break
+        if chunk in (b"IDAT", b"IEND"):
+            break
+        f.seek(length + 4, 1)
+    return info
+
+
+def _probe_tiff(f, endian):
+    info = {"format": "tiff", "dpi": None}
+    f.seek(4)
+    ifd_offset = struct.unpack(endian + "I", f.read(4))[0]
+    f.seek(ifd_offset)
+    count = struct.unpack(endian + "H", f.read(2))[0]
+    tags = {}
+    for _ in range(count):
+        tag, typ, n, value = struct.unpack(endian + "HHI4s", f.read(12))
+        if typ == 3: # SHORT
+            tags[tag] = struct.unpack(endian + "H", value[:2])[0]
+        elif typ == 4: # LONG
+            tags[tag] = struct.unpack(endian + "I", value)[0]
+        elif typ == 5: # RATIONAL, stored at offset
+            tags[tag] = ("rational", struct.unpack(endian + "I", value)[0])
+
+    if 256 not in tags or 257 not in tags:
+        raise ImageRejected("TIFF has no dimensions")
+    info.update({"width": tags[256], "height": tags[257], "channels": tags.get(277, 1)})
+
+    # XResolution (282) with ResolutionUnit (296, 2 = inch, 3 = cm)
+    xres = tags.get(282)
+    if isinstance(xres, tuple):
+        f.seek(xres[1])
+        num, den = struct.unpack(endian + "II", f.read(8))
+        if den:
+            dpi = num / den
+            if tags.get(296, 2) == 3:
+                dpi *= 2.54
+            info["dpi"] = round(dpi)
+    return info
+
+
+def probe_image(path: str) -> dict:
+    """
+    Reads the image header only.
+
+    Returns:
+        A dict with format, width, height, channels and dpi (None if not recorded).
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(8)
+            if magic[:2] == b"\xff\xd8":
+                return _probe_jpeg(f)
+            if magic == b"\x89PNG\r\n\x1a\n":
+                return _probe_png(f)
+            if magic[:4] == b"II*\x00":
+                return _probe_tiff(f, "<")
+            if magic[:4] == b"MM\x00*":
+                return _probe_tiff(f, ">")
+    except (struct.error, OSError) as e:
+        raise ImageRejected(f"Unreadable image header: {e}")
+    raise ImageRejected("Unsupported image format (expected JPEG, PNG or TIFF)")
+
+
+def check_limits(info: dict, reduction: int = 1):
+    """
+    Raises ImageRejected if the image, as decoded with the given reduction factor,
+    is larger than the configured limits.
+    """
+    w, h = info["width"], info["height"]
+    if w <= 0 or h <= 0:
+        raise ImageRejected("Image has no pixels")
+    dw, dh = -(-w // reduction), -(-h // reduction)
+    if dw > MAX_DIMENSION or dh > MAX_DIMENSION or dw * dh > MAX_PIXELS:
+        raise ImageRejected(f"Image {w}x{h} exceeds the limit of {MAX_PIXELS} pixels", status_code=413)
+
+
+def reduction_factor(info: dict, target_dpi: int = TARGET_DPI) -> int:
+    """
+    Returns the largest DCT scaling factor (1, 2, 4 or 8) that keeps the scan at or above `target_dpi`.
+    Only JPEGs benefit, since libjpeg can skip the discarded coefficients entirely.
+    """
+    dpi = info.get("dpi")
+    if info.get("format") != "jpeg" or not dpi:
+        return 1
+    for factor in REDUCTION_FACTORS:
+        if dpi / factor >= target_dpi:
+            return factor
+    return 1
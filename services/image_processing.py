@@ -3,45 +3,122 @@ import cv2
 import imutils
 import numpy as np
 
+# imread flags for decoding at 1/2, 1/4 and 1/8 scale (libjpeg DCT scaling for JPEGs)
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+}
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Decode an image straight to 8-bit grayscale, optionally at reduced scale.
+# For JPEG this uses libjpeg's grayscale output, so the chroma planes are never decoded.
+def load_grayscale(img_path, reduction=1):
+    img = cv2.imread(img_path, REDUCED_GRAYSCALE_FLAGS[reduction])
+    if img is None:
+        raise ValueError("Image not found")
+    return img
+
+# Decode the color original for display, optionally at reduced scale.
+def load_display_image(img_path, reduction=1):
+    img = cv2.imread(img_path, REDUCED_COLOR_FLAGS[reduction])
+    if img is None:
+        raise ValueError("Unsupported image format")
+    return img
+
 # Read image, assume user uploads a resonably-aligned scan or uses the Crop/Rotate tool.
 def align_image(img_path):
     # Return image as uploaded
-    img = cv2.imread(img_path)
-    if img is None:
-        raise ValueError("Image not found")
+    img = load_grayscale(img_path)
     return img, True
 
+# Skew search range and the smallest correction worth a resample (degrees)
+MAX_SKEW = 10.0
+MIN_SKEW = 0.1
+SKEW_WORK_WIDTH = 500 # Width of the preview the skew is estimated on
+
+# Affine map (2x3) from pixels of the image rotated by 0/90/180/270 degrees clockwise back to the source
+def _rotation_to_source(rotate_angle, src_w, src_h):
+    if rotate_angle == 90:
+        return np.float64([[0, 1, 0], [-1, 0, src_h - 1]])
+    if rotate_angle == 180:
+        return np.float64([[-1, 0, src_w - 1], [0, -1, src_h - 1]])
+    if rotate_angle == 270:
+        return np.float64([[0, -1, src_w - 1], [1, 0, 0]])
+    return np.float64([[1, 0, 0], [0, 1, 0]])
+
+# Composes two 2x3 affine maps: first `inner`, then `outer`
+def _compose(outer, inner):
+    return (np.vstack([outer, [0, 0, 1]]) @ np.vstack([inner, [0, 0, 1]]))[:2]
+
+# Estimates the skew (degrees, counter-clockwise) of a card from the projection profile of its
+# ruling lines: the angle at which the ink piles up into the sharpest rows and columns.
+def estimate_skew(img):
+    scale = min(1.0, SKEW_WORK_WIDTH / img.shape[1])
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else img
+    _, ink = cv2.threshold(small, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    ink = ink.astype(np.float32)
+    h, w = ink.shape
+
+    def sharpness(angle):
+        rotated = cv2.warpAffine(ink, cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0), (w, h))
+        return np.var(rotated.sum(axis=1)) + np.var(rotated.sum(axis=0))
+
+    # Coarse-to-fine search; `best` is the rotation that levels the card
+    best = 0.0
+    for step, span in ((1.0, MAX_SKEW), (0.1, 1.0), (0.02, 0.1)):
+        best = max(np.arange(best - span, best + span + step / 2, step), key=sharpness)
+    return -float(best)
+
 # Logic to crop and rotate the image in case the user uploads something rotated 90/180/270 degrees or cropped out of alignment.
-def apply_crop_and_rotate(img_path, rotate_angle, crop_rect):
-    4# crop_rect: {x, y, w, h}
+# Rotation, crop and deskew are combined into a single warpAffine from the decoded image into a
+# buffer of the crop size, so the full-resolution image is never rotated or copied as a whole.
+def apply_crop_and_rotate(img_path, rotate_angle, crop_rect, reduction=1, deskew=True):
+    # crop_rect: {x, y, w, h}, relative to the image rotated by `rotate_angle` and decoded at `reduction`
+    # Works on a single-channel buffer; the color original is only used for display.
     print(f"Applying crop/rotate: path={img_path}, rot={rotate_angle}, rect={crop_rect}")
-    img = cv2.imread(img_path)
-    if img is None:
-        raise ValueError("Image not found")
-        
-    # 1. Rotate
-    if rotate_angle != 0:
-        if rotate_angle == 90:
-            img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-        elif rotate_angle == 180:
-            img = cv2.rotate(img, cv2.ROTATE_180)
-        elif rotate_angle == 270:
-            img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            
+    img = load_grayscale(img_path, reduction)
+    src_h, src_w = img.shape[:2]
+
+    # 1. Rotate (as a coordinate map only)
+    to_source = _rotation_to_source(rotate_angle, src_w, src_h)
+    rot_w, rot_h = (src_h, src_w) if rotate_angle in (90, 270) else (src_w, src_h)
+
     # 2. Crop
     x, y, w, h = int(crop_rect['x']), int(crop_rect['y']), int(crop_rect['w']), int(crop_rect['h'])
     
     # Ensure bounds
     if x < 0: x = 0
     if y < 0: y = 0
-    if x + w > img.shape[1]: w = img.shape[1] - x
-    if y + h > img.shape[0]: h = img.shape[0] - y
-    
-    if w > 0 and h > 0:
-        img = img[y:y+h, x:x+w]
-        
+    if x + w > rot_w: w = rot_w - x
+    if y + h > rot_h: h = rot_h - y
+    if w <= 0 or h <= 0:
+        x, y, w, h = 0, 0, rot_w, rot_h
+    to_source = _compose(to_source, np.float64([[1, 0, x], [0, 1, y]]))
+
+    # 3. Deskew, estimated on a small preview of exactly this crop
+    if deskew:
+        # Sampled at twice the working width; estimate_skew area-averages it down
+        scale = min(1.0, 2 * SKEW_WORK_WIDTH / w)
+        preview_map = _compose(to_source, np.float64([[1 / scale, 0, 0], [0, 1 / scale, 0]]))
+        preview = cv2.warpAffine(img, preview_map, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                 flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderValue=255)
+        skew = estimate_skew(preview)
+        if MIN_SKEW <= abs(skew) <= MAX_SKEW:
+            print(f"Deskewing by {skew:.2f} degrees")
+            # Output pixels sample the crop rotated about its center
+            rotation = cv2.getRotationMatrix2D((w / 2, h / 2), skew, 1.0)
+            to_source = _compose(to_source, rotation)
+
+    img = cv2.warpAffine(img, to_source, (w, h), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=255)
     print(f"Resulting cropped shape: {img.shape}")
-    # For session simplicity, overwrite aligned.png
     return img
 
 # Returns the default bounding boxes scaled to the image size
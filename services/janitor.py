@@ -0,0 +1,148 @@
+import os
+import time
+import uuid
+import shutil
+from typing import Callable
+
+from services.session_store import TMP_DIR
+
+# Background cleanup of session directories under TMP_DIR.
+# - Sessions idle for longer than SESSION_TTL are deleted (abandoned browsers never call DELETE).
+# - If TMP_DIR grows beyond DISK_QUOTA, the least recently used sessions are evicted.
+# Sessions that are in use (queued or running jobs, see `in_use`) are never removed.
+# Per-print intermediates live in per-job scratch dirs that the pipelines remove themselves.
+
+SESSION_TTL = int(os.environ.get("OEFT_SESSION_TTL", 2 * 60 * 60)) # Seconds of inactivity
+DISK_QUOTA = int(os.environ.get("OEFT_DISK_QUOTA_BYTES", 5 * 1024 * 1024 * 1024))
+SWEEP_INTERVAL = int(os.environ.get("OEFT_JANITOR_INTERVAL", 60)) # Seconds
+
+LAST_SWEEP = {}
+
+
+def dir_size(path: str) -> int:
+    """Total size in bytes of all files below `path`."""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _session_dirs(tmp_dir):
+    # Only UUID-named directories are sessions; databases, caches etc. are left alone
+    for entry in os.scandir(tmp_dir):
+        if not entry.is_dir():
+            continue
+        try:
+            uuid.UUID(entry.name)
+        except ValueError:
+            continue
+        yield entry
+
+
+def _remove_session(store, tmp_dir, session_id):
+    shutil.rmtree(os.path.join(tmp_dir, session_id), ignore_errors=True)
+    store.delete(session_id)
+
+
+def sweep(store, tmp_dir: str = TMP_DIR, ttl: int = SESSION_TTL, quota: int = DISK_QUOTA,
+          in_use: Callable[[str], bool] = None) -> dict:
+    """
+    Runs one cleanup pass.
+
+    Args:
+        store: The SessionStore holding session metadata.
+        tmp_dir: Root directory of session directories.
+        ttl: Idle time in seconds after which a session is deleted.
+        quota: Maximum total bytes of session directories before LRU eviction.
+        in_use: Returns True for a session id that must be kept (jobs in progress);
+            such sessions count as active now.
+
+    Returns:
+        A dict with counts of expired/evicted sessions and remaining disk usage.
+    """
+    now = time.time()
+    activity = store.activity()
+    expired = 0
+    evicted = 0
+
+    # 1. Idle expiry. Directories without a session (e.g. uploads in progress) use their mtime.
+    remaining = []
+    busy = set()
+    for entry in _session_dirs(tmp_dir):
+        last = activity.get(entry.name)
+        if last is None:
+            last = entry.stat().st_mtime
+        if in_use is not None and in_use(entry.name):
+            busy.add(entry.name)
+            last = now
+        if now - last > ttl:
+            _remove_session(store, tmp_dir, entry.name)
+            expired += 1
+        else:
+            remaining.append((last, entry.name, dir_size(entry.path)))
+
+    # Sessions whose directory is already gone
+    for session_id, last in activity.items():
+        if now - last > ttl and not os.path.exists(os.path.join(tmp_dir, session_id)):
+            store.delete(session_id)
+
+    # 2. Disk quota, evicting least recently used first
+    total = sum(size for _, _, size in remaining)
+    remaining.sort()
+    candidates = [item for item in remaining if item[1] not in busy]
+    while total > quota and candidates:
+        last, session_id, size = candidates.pop(0)
+        remaining.remove((last, session_id, size))
+        print(f"Janitor: disk quota exceeded ({total} > {quota} bytes), evicting session {session_id}")
+        _remove_session(store, tmp_dir, session_id)
+        total -= size
+        evicted += 1
+
+    stats = {
+        "time": now,
+        "expired": expired,
+        "evicted": evicted,
+        "sessions": len(remaining),
+        "disk_bytes": total
+    }
+    LAST_SWEEP.clear()
+    LAST_SWEEP.update(stats)
+    if expired or evicted:
+        print(f"Janitor: expired {expired}, evicted {evicted}, {len(remaining)} sessions using {total} bytes")
+    return stats
+
+
+def _rss_bytes():
+    # Resident set size of this process (Linux), falling back to peak RSS
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def collect_metrics(store, tmp_dir: str = TMP_DIR) -> dict:
+    """
+    Returns memory and disk usage of the session storage.
+    """
+    dirs = list(_session_dirs(tmp_dir))
+    usage = shutil.disk_usage(tmp_dir)
+    return {
+        "sessions": len(store.ids()),
+        "session_dirs": len(dirs),
+        "session_disk_bytes": sum(dir_size(entry.path) for entry in dirs),
+        "disk_quota_bytes": DISK_QUOTA,
+        "disk_free_bytes": usage.free,
+        "session_ttl_seconds": SESSION_TTL,
+        "process_rss_bytes": _rss_bytes(),
+        "process_id": os.getpid(),
+        "last_sweep": dict(LAST_SWEEP)
+    }
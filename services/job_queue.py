@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+import traceback
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Set
+
+from services.session_store import TMP_DIR
+
+# Work queue for the heavy pipelines (EFT and FD-258 generation).
+# API processes submit jobs and wait for their result; workers (threads embedded in
+# the API process and/or `python worker.py` processes on the same host) claim them.
+# A claim is a lease: workers renew it while running, and a job whose lease expired
+# (worker crashed or was killed) is claimed again until `max_attempts` is reached.
+# Outputs are written to the shared TMP_DIR, so any process can serve them.
+
+JOB_LEASE = int(os.environ.get("OEFT_JOB_LEASE", 60)) # Seconds, renewed by running workers
+JOB_ATTEMPTS = int(os.environ.get("OEFT_JOB_ATTEMPTS", 3))
+JOB_TIMEOUT = int(os.environ.get("OEFT_JOB_TIMEOUT", 600)) # Seconds an API request waits for its job
+EMBEDDED_WORKERS = int(os.environ.get("OEFT_EMBEDDED_WORKERS", 2))
+POLL_INTERVAL = 0.2 # Maximum; waits start shorter and back off
+
+# Wakes idle worker threads of this process as soon as a job is submitted here
+_SUBMITTED = threading.Event()
+
+
+class JobFailed(Exception):
+    """
+    Raised (or recorded) when a job fails permanently. `status_code` is the HTTP status to report.
+    """
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JobQueue(ABC):
+    """
+    Interface for job brokers. Jobs are dicts with id, kind, payload, status
+    ('queued', 'running', 'done', 'failed'), result, error and attempts.
+    """
+    max_attempts: int = JOB_ATTEMPTS # Claims per job before it is given up
+
+    @abstractmethod
+    def submit(self, kind: str, payload: dict, job_id: str = None) -> str:
+        """
+        Queues a job. If `job_id` is given and that job is still queued or running,
+        the existing job is joined instead of starting a second one.
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease: int = JOB_LEASE) -> Optional[dict]:
+        """Claims the oldest runnable job, or returns None."""
+
+    @abstractmethod
+    def renew(self, job_id: str, worker_id: str, lease: int = JOB_LEASE) -> bool:
+        """Extends the lease. Returns False if the job is no longer held by this worker."""
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str, result: dict):
+        pass
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: str, error: dict, retry: bool = False):
+        pass
+
+    @abstractmethod
+    def active_sessions(self) -> Set[str]:
+        """Session ids of queued and running jobs."""
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Jobs in a local SQLite database (WAL mode) shared by all processes on the host.
+    Claims run inside BEGIN IMMEDIATE, so a job is leased to exactly one worker.
+    """
+    def __init__(self, path: str, max_attempts: int = JOB_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "lease_until REAL, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, created)")
+
+    def _conn(self):
+        # One connection per thread; autocommit, transactions are explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["error"] = json.loads(job["error"]) if job["error"] else None
+        return job
+
+    def submit(self, kind, payload, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row and row["status"] in ("queued", "running"):
+                conn.execute("COMMIT")
+                return job_id
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, payload, status, attempts, created, updated) "
+                "VALUES (?, ?, ?, 'queued', 0, ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        _SUBMITTED.set()
+        return job_id
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self, worker_id, lease=JOB_LEASE):
+        now = time.time()
+        conn = self._conn()
+        # Cheap read first, so idle workers polling the queue don't take the write lock
+        runnable = conn.execute(
+            "SELECT 1 FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) LIMIT 1", (now,)
+        ).fetchone()
+        if runnable is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    # Lease expired on the last attempt: the job keeps killing its workers
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                        (json.dumps({"detail": "Job abandoned after repeated worker failures", "status_code": 500}), now, row["id"])
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, updated = ? WHERE id = ?",
+                    (worker_id, now + lease, now, row["id"])
+                )
+                conn.execute("COMMIT")
+                job = self._row_to_job(row)
+                job["attempts"] += 1
+                return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def renew(self, job_id, worker_id, lease=JOB_LEASE):
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + lease, time.time(), job_id, worker_id)
+        )
+        return cur.rowcount > 0
+
+    def complete(self, job_id, worker_id, result):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_until = NULL, updated = ? WHERE id = ? AND worker = ?",
+            (json.dumps(result), time.time(), job_id, worker_id)
+        )
+
+    def fail(self, job_id, worker_id, error, retry=False):
+        status = "queued" if retry else "failed"
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated = ? WHERE id = ? AND worker = ?",
+            (status, json.dumps(error), time.time(), job_id, worker_id)
+        )
+
+    def active_sessions(self):
+        rows = self._conn().execute("SELECT payload FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return {json.loads(row["payload"]).get("request", {}).get("session_id") for row in rows} - {None}
+
+    def purge(self, older_than: float) -> int:
+        """Deletes finished jobs last updated more than `older_than` seconds ago."""
+        cur = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (time.time() - older_than,)
+        )
+        return cur.rowcount
+
+
+def create_job_queue() -> JobQueue:
+    """
+    Creates the broker selected by OEFT_JOB_BROKER (currently 'sqlite').
+    """
+    backend = os.environ.get("OEFT_JOB_BROKER", "sqlite").lower()
+    if backend == "sqlite":
+        path = os.environ.get("OEFT_JOB_DB", os.path.join(TMP_DIR, "jobs.sqlite"))
+        return SQLiteJobQueue(path)
+    raise ValueError(f"Unknown job broker: {backend}")
+
+
+def _run_one(queue: JobQueue, job: dict, handlers: Dict[str, Callable], worker_id: str):
+    # Keep the lease alive while the handler runs
+    done = threading.Event()
+    def keep_alive():
+        while not done.wait(JOB_LEASE / 3):
+            if not queue.renew(job["id"], worker_id):
+                return
+    threading.Thread(target=keep_alive, daemon=True).start()
+
+    try:
+        handler = handlers.get(job["kind"])
+        if handler is None:
+            raise JobFailed(f"No handler for job kind {job['kind']}")
+        result = handler(job["payload"])
+        queue.complete(job["id"], worker_id, result)
+    except JobFailed as e:
+        # Deterministic failure (bad request, oversized EFT...): report, don't retry
+        queue.fail(job["id"], worker_id, {"detail": str(e), "status_code": e.status_code})
+    except Exception as e:
+        traceback.print_exc()
+        retry = job["attempts"] < queue.max_attempts
+        print(f"Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}: {e}{' - retrying' if retry else ''}")
+        queue.fail(job["id"], worker_id, {"detail": str(e), "status_code": 500}, retry=retry)
+    finally:
+        done.set()
+
+
+def worker_loop(queue: JobQueue, handlers: Dict[str, Callable], stop: threading.Event = None, worker_id: str = None):
+    """
+    Claims and runs jobs until `stop` is set.
+    """
+    stop = stop or threading.Event()
+    worker_id = worker_id or f"{os.uname().nodename}:{os.getpid()}:{threading.get_ident()}"
+    print(f"Worker {worker_id} started")
+    while not stop.is_set():
+        try:
+            job = queue.claim(worker_id)
+        except sqlite3.OperationalError as e:
+            print(f"Worker {worker_id} could not claim a job: {e}")
+            job = None
+        if job is None:
+            # Jobs submitted by other processes are seen at the next poll
+            if _SUBMITTED.wait(POLL_INTERVAL):
+                _SUBMITTED.clear()
+            continue
+        print(f"Worker {worker_id} running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+        _run_one(queue, job, handlers, worker_id)
+
+
+def start_workers(queue: JobQueue, handlers: Dict[str, Callable], count: int) -> threading.Event:
+    """
+    Starts `count` worker threads in this process. Set the returned event to stop them.
+    """
+    stop = threading.Event()
+    for i in range(count):
+        threading.Thread(target=worker_loop, args=(queue, handlers, stop), name=f"job-worker-{i}", daemon=True).start()
+    return stop
+
+
+async def wait_for_job(queue: JobQueue, job_id: str, timeout: float = JOB_TIMEOUT) -> dict:
+    """
+    Waits until the job is done and returns its result. Raises JobFailed on failure or timeout.
+    """
+    deadline = time.time() + timeout
+    interval = 0.005
+    while time.time() < deadline:
+        # Off the event loop: the query can wait on the SQLite lock while workers claim jobs
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is None:
+            raise JobFailed("Job disappeared", status_code=500)
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            error = job["error"] or {}
+            raise JobFailed(error.get("detail", "Job failed"), status_code=error.get("status_code", 500))
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, POLL_INTERVAL)
+    raise JobFailed("Timed out waiting for a worker", status_code=504)
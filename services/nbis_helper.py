@@ -104,7 +104,7 @@ def segment_fingerprints(image_path: str, finger_position: int) -> List[dict]:
 
     return segments
 
-def get_nfiq_quality(image_path: str) -> int:
+def get_nfiq_quality(image_path: str, raw_size: Tuple[int, int] = None) -> int:
     """
     Calculates the NIST Fingerprint Image Quality (NFIQ) score for an image.
 
@@ -114,11 +114,15 @@ def get_nfiq_quality(image_path: str) -> int:
 
     Args:
         image_path: Path to the fingerprint image to be scored.
+        raw_size: (width, height) if the image is raw 8-bit pixels.
 
     Returns:
         An integer representing the NFIQ score (1-5). Returns 255 on failure.
     """
     command = ["nfiq", image_path]
+    if raw_size:
+        # Raw images carry no header: nfiq -raw w,h,depth,ppi
+        command = ["nfiq", "-raw", f"{raw_size[0]},{raw_size[1]},8,500", image_path]
     stdout, stderr, returncode = run_command(command)
 
     if returncode != 0:
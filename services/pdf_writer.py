@@ -0,0 +1,113 @@
+import zlib
+
+# Minimal streaming PDF writer.
+# Objects are written to the output file as soon as they are added; only their byte
+# offsets are kept for the cross-reference table. Supports what printable cards need:
+# JPEG (DCTDecode) passthrough, lossless 8-bit images (FlateDecode), the standard
+# Helvetica font for vector text, and one content stream per page.
+
+
+def pdf_string(text: str) -> bytes:
+    """Encodes text as a PDF literal string (Latin-1, unsupported characters replaced)."""
+    raw = str(text).encode("latin-1", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class PDFWriter:
+    """
+    Writes a PDF document to a binary file object.
+
+    Usage:
+        pdf = PDFWriter(f)
+        img = pdf.add_image(pixels)
+        pdf.add_page(width_pt, height_pt, b"q 100 0 0 100 0 0 cm /Im0 Do Q", images={"Im0": img})
+        pdf.close()
+    """
+    def __init__(self, fileobj):
+        self.f = fileobj
+        self.offsets = {}
+        self.next_num = 1
+        self.pages = []
+        self.catalog = self._reserve()
+        self.page_tree = self._reserve()
+        self.font = None
+        self._write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes):
+        self.f.write(data)
+
+    def _reserve(self) -> int:
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def add_object(self, body: bytes, num: int = None) -> int:
+        """Writes an object (dictionary, array...) and returns its number."""
+        num = num or self._reserve()
+        self.offsets[num] = self.f.tell()
+        self._write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+        return num
+
+    def add_stream(self, entries: str, data: bytes, num: int = None) -> int:
+        """Writes a stream object with the given dictionary entries (without /Length)."""
+        num = num or self._reserve()
+        self.offsets[num] = self.f.tell()
+        self._write(b"%d 0 obj\n<< %s /Length %d >>\nstream\n" % (num, entries.encode(), len(data)))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+        return num
+
+    def add_jpeg(self, data: bytes, width: int, height: int, color_space: str = "DeviceGray") -> int:
+        """Embeds JPEG bytes as they are (no re-encode)."""
+        return self.add_stream(
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /DCTDecode", data
+        )
+
+    def add_flate_image(self, width: int, height: int, data: bytes, color_space: str = "DeviceGray", invert: bool = False) -> int:
+        """
+        Embeds zlib-compressed 8-bit pixels (lossless). `invert` flips the tones at
+        display time via /Decode instead of touching the pixels.
+        """
+        decode = " /Decode [1 0]" if invert else ""
+        return self.add_stream(
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /FlateDecode{decode}", data
+        )
+
+    def add_image(self, pixels, invert: bool = False) -> int:
+        """Embeds an 8-bit grayscale or RGB numpy image losslessly."""
+        h, w = pixels.shape[:2]
+        color_space = "DeviceRGB" if pixels.ndim == 3 else "DeviceGray"
+        return self.add_flate_image(w, h, zlib.compress(pixels.tobytes(), 6), color_space, invert)
+
+    def helvetica(self) -> int:
+        """Standard Helvetica font (not embedded; every PDF viewer provides it)."""
+        if self.font is None:
+            self.font = self.add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        return self.font
+
+    def add_page(self, width: float, height: float, content: bytes, images: dict = None, fonts: dict = None) -> int:
+        """Writes a page with its content stream. `images`/`fonts` map resource names to object numbers."""
+        contents = self.add_stream("/Filter /FlateDecode", zlib.compress(content, 6))
+        xobjects = " ".join(f"/{name} {num} 0 R" for name, num in (images or {}).items())
+        font_refs = " ".join(f"/{name} {num} 0 R" for name, num in (fonts or {}).items())
+        page = self.add_object((
+            f"<< /Type /Page /Parent {self.page_tree} 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+            f"/Resources << /XObject << {xobjects} >> /Font << {font_refs} >> >> /Contents {contents} 0 R >>"
+        ).encode())
+        self.pages.append(page)
+        return page
+
+    def close(self):
+        """Writes the page tree, catalog, cross-reference table and trailer."""
+        kids = " ".join(f"{num} 0 R" for num in self.pages)
+        self.add_object(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode(), num=self.page_tree)
+        self.add_object(f"<< /Type /Catalog /Pages {self.page_tree} 0 R >>".encode(), num=self.catalog)
+
+        xref = self.f.tell()
+        count = self.next_num
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for num in range(1, count):
+            self._write(b"%010d 00000 n \n" % self.offsets[num])
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, self.catalog, xref))
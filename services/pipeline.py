@@ -0,0 +1,382 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from services.eft_generator import generate_eft, image_records_key, load_image_records
+from services.fingerprint import Fingerprint, type4_size
+from services.fd258_generator import FD258Generator, get_template
+from services.tile_pyramid import level_scale
+from services.session_store import TMP_DIR, to_absolute
+from services.scratch import run_in_scratch, check_space, publish
+from services.job_queue import JobFailed
+from services.shared_image import SHARED_NAME, share_image, crop_print
+
+# Generation pipelines (EFT and FD-258), run by job queue workers.
+# Jobs carry the generate request and a snapshot of the session as plain dicts, so
+# a worker in another process needs nothing but the shared TMP_DIR. Each run works
+# in its own scratch directory and publishes its output into the session directory.
+
+# Blank FD-258 card
+FD258_BLANK = "static/img/fd258-blank.jpg"
+
+# Per-print encoding runs in a process pool (0 = inline in the worker thread).
+# Pool processes receive the shared card descriptor and a box, never pixel data.
+PRINT_PROCESSES = int(os.environ.get("OEFT_PRINT_PROCESSES", min(4, os.cpu_count() or 1)))
+
+# Errors that a retry would only repeat (malformed request or Type-2 data, bad image data).
+# Anything else (OSError/ENOSPC, BrokenProcessPool, tool crashes) propagates and the job queue retries it.
+DETERMINISTIC_ERRORS = (ValueError, KeyError, TypeError)
+
+_PRINT_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+# Returns the process pool, started on first use ('spawn': the parent runs threads)
+def print_pool():
+    global _PRINT_POOL
+    with _POOL_LOCK:
+        if _PRINT_POOL is None:
+            _PRINT_POOL = ProcessPoolExecutor(max_workers=PRINT_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _PRINT_POOL
+
+def _reset_print_pool(pool):
+    global _PRINT_POOL
+    with _POOL_LOCK:
+        if _PRINT_POOL is pool:
+            _PRINT_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# Loads per-process resources (FD-258 template and fonts) before the first job arrives
+def preload():
+    try:
+        get_template(FD258_BLANK)
+    except Exception as e:
+        print(f"Could not preload FD-258 template: {e}")
+
+# Output size of a card crop: the fixed Type-4 size in rolled mode, otherwise the box itself
+def print_size(fp_number, mode):
+    return type4_size(fp_number) if mode == "rolled" else None
+
+# Loads one print: the box of the shared card (one warp at `size`), or a capture image path
+def load_print(src, box, size=None):
+    if box is None:
+        return cv2.imread(to_absolute(src), cv2.IMREAD_GRAYSCALE)
+    return crop_print(src, box, size)
+
+# Creates the Fingerprint of a print, conditioned if requested (Type-4 sizes are fixed: no trim)
+def open_print(src, box, fp_number, job_dir, session_id, mode, condition=False):
+    fp = Fingerprint(load_print(src, box, print_size(fp_number, mode)), fp_number, job_dir, session_id)
+    if condition:
+        fp.condition(trim=mode != "rolled")
+    return fp
+
+# Encodes one print (PNG -> JP2, segments). Runs in a pool process or inline.
+def encode_print(src, box, fp_number, job_dir, session_id, mode, compression_ratio, condition=False):
+    fp = open_print(src, box, fp_number, job_dir, session_id, mode, condition)
+    if mode == "rolled":
+        result_path = fp.process_and_convert_type4(compression_ratio=compression_ratio)
+    else:
+        result_path = fp.process_and_convert(compression_ratio=compression_ratio)
+    # Only paths and metadata travel back; the parent re-attaches pixels if it needs them
+    fp.img = None
+    return fp, result_path
+
+# Encodes prints given as (src, box, fp_number), in parallel when the pool is enabled
+def encode_prints(prints, job_dir, session_id, mode, compression_ratio, condition=False):
+    if PRINT_PROCESSES > 0 and len(prints) > 1:
+        pool = print_pool()
+        try:
+            futures = [pool.submit(encode_print, src, box, fp_number, job_dir, session_id, mode, compression_ratio, condition) for src, box, fp_number in prints]
+            return [f.result() for f in futures]
+        except BrokenProcessPool:
+            # A pool process died (OOM kill...): drop the pool, the job retry starts a fresh one
+            _reset_print_pool(pool)
+            raise
+    return [encode_print(src, box, fp_number, job_dir, session_id, mode, compression_ratio, condition) for src, box, fp_number in prints]
+
+
+# Maps boxes drawn on a pyramid level back to full-resolution integer pixel coordinates.
+def scale_boxes(boxes, pyramid, level):
+    scale = level_scale(pyramid, level) if (pyramid and level is not None) else 1
+    return [
+        dict(box, x=int(box["x"] * scale), y=int(box["y"] * scale), w=int(box["w"] * scale), h=int(box["h"] * scale))
+        for box in boxes
+    ]
+
+# Runs a pipeline in its own scratch directory, which is removed afterwards
+def run_job(pipeline, payload: dict):
+    data, session_data = payload["request"], payload["session"]
+    if cv2 is None:
+        raise JobFailed("cv2 not installed")
+    return run_in_scratch(os.path.join(TMP_DIR, data["session_id"]), lambda job_dir: pipeline(data, session_data, job_dir))
+
+# Runs the EFT pipeline for a generate request; intermediates go to `job_dir`
+def build_eft(data: dict, session_data: dict, job_dir: str):
+    session_id = data["session_id"]
+    mode = data.get("mode") or "atf"
+    condition = bool(data.get("condition"))
+    session_dir = os.path.join(TMP_DIR, session_id)
+
+    # Initialize variables
+    prints_map = {}
+    fp_objects = [] 
+    boxes = data["boxes"]
+    if session_data.get("mode") != "capture":
+        boxes = scale_boxes(data["boxes"], session_data.get("aligned_pyramid"), data.get("level"))
+
+    # Image records depend only on the source pixels, boxes and mode: if only Type-2 data
+    # changed since the last generation, reuse them and skip all print processing
+    records_key = None
+    image_records = None
+    if session_data.get("source_hash"):
+        records_key = image_records_key(session_data["source_hash"], boxes, mode, condition)
+        image_records = load_image_records(session_id, records_key, mode)
+
+    # Check session mode (Capture or Upload)
+    if image_records is not None:
+        print(f"Type-2 only change for session {session_id}, reusing image records")
+    else:
+        if session_data.get("mode") == "capture":
+            # If Capture Mode: Load individual images based on the box fp_number
+            # Capture mode currently only supports Type-14 Capture
+            images_map = session_data["images"]
+            prints = [(images_map[str(box["fp_number"])], None, box["fp_number"]) for box in boxes if str(box["fp_number"]) in images_map]
+            print_mode = "atf"
+        else:
+            # Upload Mode: Crop from the shared copy of the master image
+            shared = session_data.get("aligned_shared")
+            if shared is None:
+                # Session created before shared images: share the PNG next to it
+                # (on disk: a full card can be larger than the RAM scratch space)
+                img = cv2.imread(to_absolute(session_data["image_path"]), cv2.IMREAD_GRAYSCALE)
+                shared = share_image(img, os.path.join(session_dir, SHARED_NAME))
+            prints = [(shared, box, box["fp_number"]) for box in boxes]
+            print_mode = mode
+        sources = {fp_number: (src, box, fp_number) for src, box, fp_number in prints}
+
+        for fp, result_path in encode_prints(prints, job_dir, session_id, print_mode, 10, condition): # Default ratio
+            fp_objects.append(fp)
+
+            # Add processed fingerprint to prints_map
+            if result_path:
+                size = os.path.getsize(result_path)
+                print(f"Processed FP {fp.fp_number}: {result_path} ({size} bytes)")
+                if size == 0:
+                    print(f"WARNING: FP {fp.fp_number} is 0 bytes!")
+                prints_map[fp.fp_number] = fp
+            else:
+                 print(f"ERROR: Failed to process FP {fp.fp_number}")
+                 check_space(job_dir) # A full RAM scratch re-runs the job on disk
+            
+    # Generate EFT with size safeguard
+    try:
+        # Initial generation with default compression
+        eft_path = generate_eft(data["type2_data"], session_id, {fp.fp_number: fp for fp in fp_objects}, mode=mode, image_records=image_records, records_key=records_key, out_dir=job_dir)
+        
+        # Check size (Max 11MB)
+        max_size = 11 * 1024 * 1024
+        current_size = os.path.getsize(eft_path)
+        
+        retries = 0
+        ratios = [15, 20, 30] # Progressive compression ratios in case file exceeds limit
+        
+        # Re-compress and re-generate EFT if file exceeds limit
+        # (Reused image records are those of the last attempt, so they are never re-compressed)
+        while current_size > max_size and retries < len(ratios) and fp_objects:
+            print(f"EFT size {current_size} exceeds limit. Re-compressing with ratio {ratios[retries]}...")
+            
+            # Re-compress all images
+            for fp in fp_objects:
+                if fp.img is None:
+                    # Conditioning is deterministic: the reloaded pixels match the print's digest
+                    fp.img = open_print(*sources[fp.fp_number], job_dir, session_id, print_mode, condition).img
+                if print_mode == "rolled":
+                    fp.process_and_convert_type4(compression_ratio=ratios[retries])
+                else:
+                    fp.process_and_convert(compression_ratio=ratios[retries])
+            
+            # Re-generate EFT
+            eft_path = generate_eft(data["type2_data"], session_id, {fp.fp_number: fp for fp in fp_objects}, mode=mode, records_key=records_key, out_dir=job_dir)
+            current_size = os.path.getsize(eft_path)
+            retries += 1
+        
+        # If file still exceeds limit after all retries, raise error
+        if current_size > max_size:
+            raise JobFailed(f"EFT size ({current_size} bytes) exceeds 11MB limit even after compression.", status_code=400)
+        
+        # Determine Filename
+        fname = data["type2_data"].get("fname", "Unknown")
+        lname = data["type2_data"].get("lname", "Unknown")
+
+        # Sanitize
+        safe_fname = "".join(c for c in fname if c.isalnum() or c in ('-', '_'))
+        safe_lname = "".join(c for c in lname if c.isalnum() or c in ('-', '_'))
+        
+        # Generate filename (Type-4 EFTs are marked so both variants can coexist)
+        suffix = "-rolled" if mode == "rolled" else ""
+        filename = f"oeft-{safe_fname}-{safe_lname}{suffix}.eft"
+        
+        # Publish the generated file under the user-friendly name
+        publish(eft_path, os.path.join(session_dir, filename))
+        
+        # Return download URL with session path and filename
+        return {"download_url": f"/api/download/{session_id}/{filename}", "filename": filename}
+    except DETERMINISTIC_ERRORS as e:
+        raise JobFailed(f"EFT Generation failed: {str(e)}")
+
+class RawFP:
+    def __init__(self, p, w=0, h=0, is_raw=False):
+        self.img_path = p
+        self.w = w
+        self.h = h
+        self.is_raw = is_raw
+
+# Renders the FD-258 card for a generate request; intermediates go to `job_dir`
+def build_fd258(data: dict, session_data: dict, job_dir: str):
+    session_id = data["session_id"]
+    session_dir = os.path.join(TMP_DIR, session_id)
+
+    # Load images_map
+    images_map = session_data["images"]
+    print(f"DEBUG: images_map keys: {list(images_map.keys())}")
+    
+    # Process slaps (13, 14, 15) to get segments
+    fp_objects = {}
+    
+    for fp_num in [13, 14, 15]:
+        target_path = None
+        # Robust key (int or str) and path check
+        if fp_num in images_map:
+            target_path = to_absolute(images_map[fp_num])
+        elif str(fp_num) in images_map:
+            target_path = to_absolute(images_map[str(fp_num)])
+            
+        if target_path:
+             if not os.path.exists(target_path):
+                 print(f"DEBUG: Image path not found: {target_path}")
+                 continue
+                 
+             img = cv2.imread(target_path, cv2.IMREAD_GRAYSCALE)
+             if img is None: 
+                 print(f"DEBUG: Failed to load image with cv2: {target_path}")
+                 continue
+             
+             print(f"DEBUG: Loaded FP {fp_num} from {target_path}, shape={img.shape}")
+             fp = Fingerprint(img, fp_num, job_dir, session_id)
+
+             # Segmentation only (no JP2 encode); cached segments from /api/generate are reused
+             fp.segment_only()
+                 
+             fp_objects[fp_num] = fp
+             print(f"FP {fp_num} has {len(fp.fingers)} segments: {[f.n for f in fp.fingers]}")
+
+
+
+    # Collect printable images
+    prints_map = {}
+    
+    for fp in fp_objects.values():
+         # 1. Plain boxes (Slaps)
+         # Map the full slap images to their respective plain codes
+         if fp.fp_number == 13:
+             prints_map[13] = fp # R Slap -> P_R4
+         elif fp.fp_number == 14:
+             prints_map[14] = fp # L Slap -> P_L4
+             
+         # 2. Segments (Rolled boxes 1-10)
+         for finger in fp.fingers:
+             try:
+                 fn = int(finger.n)
+                 seg_path = os.path.join(job_dir, finger.name)
+                 if fp.fp_number == 14:
+                     # Swap 7 <-> 10 to properly place prints in order
+                     if fn == 7: fn = 10
+                     elif fn == 10: fn = 7
+                     # Swap 8 <-> 9  to properly place prints in order
+                     elif fn == 8: fn = 9
+                     elif fn == 9: fn = 8
+                     print(f"Swapped Left Hand Segment {finger.n} -> {fn}")
+
+                 
+
+                 # Check/Decode WSQ or RAW (decoded pixels are cached with the segments)
+                 if seg_path.endswith('.wsq') or seg_path.endswith('.raw'):
+                     if os.path.exists(seg_path):
+                         sfp = RawFP(fp.decoded_segment(finger), finger.sw, finger.sh, is_raw=True)
+                     else:
+                         print(f"Segment not found: {seg_path}")
+                         continue
+                 elif os.path.exists(seg_path):
+                     # Assume standard image and not WSQ or RAW
+                     sfp = RawFP(seg_path)
+                 else:
+                     print(f"Segment file not found: {seg_path}")
+                     continue
+                     
+                 # Map 1-10 (Rolled)
+                 if 1 <= fn <= 10:
+                     prints_map[fn] = sfp
+                     print(f"Mapped Segment {fn} from {seg_path}")
+                 
+                 # Handling Thumbs from FP 15 (which return segments 11 and 12)
+                 # Map 11 -> 1 (Rolled R Thumb) and 11 (Plain R Thumb)
+                 # Map 12 -> 6 (Rolled L Thumb) and 12 (Plain L Thumb)
+                 if fn == 11:
+                     prints_map[1] = sfp  # Rolled R Thumb
+                     prints_map[11] = sfp # Plain R Thumb
+                     print(f"Mapped Segment {fn} to 1 and 11")
+                 elif fn == 12:
+                     prints_map[6] = sfp  # Rolled L Thumb
+                     prints_map[12] = sfp # Plain L Thumb
+                     print(f"Mapped Segment {fn} to 6 and 12")
+                     
+                 # Map Segments to Plain Thumbs 11/12 (Legacy checking 1/6)
+                 if fn == 1:
+                     prints_map[11] = sfp # P_RT (11) mapping to layout "P_RT"
+                 elif fn == 6:
+                     prints_map[12] = sfp # P_LT (12) mapping to layout "P_LT"
+
+                             
+             except Exception as e:
+                 print(f"Error processing segment for FP {fp.fp_number}: {e}")
+
+    print(f"DEBUG: Final prints_map keys: {list(prints_map.keys())}")
+
+
+
+                 
+    # Generate FD258
+    try:
+        generator = FD258Generator(FD258_BLANK)
+        if data.get("format") == "pdf":
+            # Print-ready PDF, written straight to the scratch file
+            filename = f"fd258-{session_id}.pdf"
+            out_path = generator.generate_pdf(data["type2_data"], prints_map, os.path.join(job_dir, filename))
+        else:
+            img_bytes = generator.generate(data["type2_data"], prints_map)
+
+            # Save
+            filename = f"fd258-{session_id}.jpg"
+            out_path = os.path.join(job_dir, filename)
+            with open(out_path, "wb") as f:
+                f.write(img_bytes)
+        publish(out_path, os.path.join(session_dir, filename))
+            
+        return {"download_url": f"/api/download/{session_id}/{filename}", "filename": filename}
+    except DETERMINISTIC_ERRORS as e:
+        import traceback
+        traceback.print_exc()
+        raise JobFailed(f"FD258 Generation failed: {str(e)}")
+
+
+# Job kinds handled by workers
+HANDLERS = {
+    "eft": lambda payload: run_job(build_eft, payload),
+    "fd258": lambda payload: run_job(build_fd258, payload)
+}
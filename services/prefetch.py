@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from services.fingerprint import Fingerprint
+from services.scratch import run_in_scratch
+from services.session_store import TMP_DIR
+
+# Speculative pre-encoding.
+# Encoding and segmenting a print depends only on its crop, not on the Type-2 data,
+# so it is started in the background as soon as boxes are confirmed (preview) or
+# captured scans arrive. Results land in the artifact cache; /api/generate waits for
+# a session's pending jobs and then finds every PNG/JP2/segment already cached.
+# Jobs run in the process that scheduled them, but each one is also marked by a file in
+# `<session>/prefetch/`, so a generate served by another API process waits for them too.
+
+PREFETCH_WORKERS = int(os.environ.get("OEFT_PREFETCH_WORKERS", 2))
+PREFETCH_WAIT = int(os.environ.get("OEFT_PREFETCH_WAIT", 60)) # Seconds generate waits for pending jobs
+COMPRESSION_RATIO = 10 # Ratio of the first generate attempt
+PENDING_DIR = "prefetch" # Marker files of queued and running jobs, per session
+POLL_INTERVAL = 0.1 # Seconds between checks of other processes' markers
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_PENDING = {} # session_id -> list of futures of this process
+_LOCK = threading.Lock()
+
+
+def _encode_in(scratch, session_id, fp_number, src, mode, condition):
+    img = cv2.imread(src, cv2.IMREAD_GRAYSCALE) if isinstance(src, str) else src
+    fp = Fingerprint(img, fp_number, scratch, session_id)
+    if condition:
+        fp.condition(trim=mode != "rolled")
+    if mode == "rolled":
+        fp.process_and_convert_type4(compression_ratio=COMPRESSION_RATIO)
+    else:
+        fp.process_and_convert(compression_ratio=COMPRESSION_RATIO)
+
+
+def _encode(session_id, session_dir, fp_number, src, mode, condition):
+    # Private scratch dir, so a generate running at the same time never sees half-written files
+    try:
+        run_in_scratch(session_dir, lambda scratch: _encode_in(scratch, session_id, fp_number, src, mode, condition), prefix="prefetch")
+    except Exception as e:
+        # Session deleted meanwhile, tool failure... generate will simply redo the work
+        print(f"Prefetch of FP {fp_number} for session {session_id} failed: {e}")
+
+
+def _forget(session_id, future, marker):
+    with _LOCK:
+        pending = _PENDING.get(session_id)
+        if pending and future in pending:
+            pending.remove(future)
+            if not pending:
+                del _PENDING[session_id]
+    try:
+        os.remove(marker)
+    except FileNotFoundError:
+        pass
+
+
+def _mark(session_dir):
+    # Marker for a job that is queued or running here, visible to every process sharing TMP_DIR
+    pending_dir = os.path.join(session_dir, PENDING_DIR)
+    os.makedirs(pending_dir, exist_ok=True)
+    marker = os.path.join(pending_dir, uuid.uuid4().hex)
+    open(marker, "w").close()
+    return marker
+
+
+def _pending_markers(session_id):
+    # Markers older than PREFETCH_WAIT were left behind by a killed process
+    cutoff = time.time() - PREFETCH_WAIT
+    try:
+        entries = list(os.scandir(os.path.join(TMP_DIR, session_id, PENDING_DIR)))
+    except FileNotFoundError:
+        return 0
+    count = 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                count += 1
+        except FileNotFoundError:
+            pass
+    return count
+
+
+def schedule_prefetch(session_id: str, session_dir: str, prints, mode: str = "atf", condition: bool = False):
+    """
+    Queues background encodes for a session, replacing jobs of earlier boxes that have not started yet.
+
+    Args:
+        session_id: The session the prints belong to.
+        session_dir: The session directory.
+        prints: List of (fp_number, src) where src is a grayscale crop or an image path.
+        mode: 'atf' (Type-14) or 'rolled' (Type-4).
+        condition: Condition the prints before encoding, as the generate request will.
+    """
+    markers = [_mark(session_dir) for _ in prints]
+    with _LOCK:
+        for future in _PENDING.get(session_id, []):
+            future.cancel()
+        futures = [_EXECUTOR.submit(_encode, session_id, session_dir, fp_number, src, mode, condition) for fp_number, src in prints]
+        _PENDING[session_id] = list(futures)
+    for future, marker in zip(futures, markers):
+        future.add_done_callback(lambda f, sid=session_id, m=marker: _forget(sid, f, m))
+
+
+async def wait_for_prefetch(session_id: str, timeout: float = PREFETCH_WAIT):
+    """
+    Waits until the session's background encodes, in this or any other process sharing
+    TMP_DIR, have finished (or `timeout` passes).
+    """
+    deadline = time.time() + timeout
+    with _LOCK:
+        futures = [f for f in _PENDING.get(session_id, []) if not f.done()]
+    if futures:
+        print(f"Waiting for {len(futures)} prefetch jobs of session {session_id}")
+        await asyncio.wait([asyncio.wrap_future(f) for f in futures], timeout=timeout)
+
+    # Jobs scheduled by other processes
+    pending = _pending_markers(session_id)
+    if pending:
+        print(f"Waiting for {pending} prefetch jobs of session {session_id} in other processes")
+    while pending and time.time() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        pending = _pending_markers(session_id)
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+from services.conditioning import MIN_STD
+
+# Fast ridge-quality precheck of a print crop.
+# Runs on every preview, before any encoding, so smudged, light or partial prints can be
+# re-captured right away instead of being found by nfiq or by the agency. Gradients are
+# aggregated over BLOCK x BLOCK blocks with one area resize each:
+# - coherence: how consistently the ridges in a block share one orientation (structure tensor)
+# - contrast: grey-level standard deviation of the block
+# - foreground: share of blocks that contain ridges at all
+# Not a replacement for NFIQ; thresholds flag prints that are clearly unusable.
+
+BLOCK = 16 # Block size (pixels of the crop)
+MIN_COHERENCE = 0.4 # Mean ridge coherence below this: smudged or blurred
+MIN_CONTRAST = 20.0 # Median ridge-block standard deviation below this: too light
+MIN_FOREGROUND = 0.25 # Share of ridge blocks below this: partial or missing print
+FULL_CONTRAST = 40.0 # Contrast at which a block counts as fully contrasted
+HEATMAP_WIDTH = 320 # Width of the heatmap overlay image
+
+
+def _block_means(values, grid):
+    return cv2.resize(values, grid, interpolation=cv2.INTER_AREA)
+
+
+def precheck(img: np.ndarray) -> dict:
+    """
+    Scores a grayscale print crop.
+
+    Returns:
+        dict with 'score' (0-1), 'coherence', 'contrast', 'foreground', 'issues' (list of
+        'smudged', 'light', 'partial') and 'blocks' (per-block quality 0-1, -1 for background).
+    """
+    gray = np.asarray(img, dtype=np.float32)
+    grid = (max(1, gray.shape[1] // BLOCK), max(1, gray.shape[0] // BLOCK))
+
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    gxx, gyy, gxy = _block_means(gx * gx, grid), _block_means(gy * gy, grid), _block_means(gx * gy, grid)
+    coherence = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / np.maximum(gxx + gyy, 1e-6)
+
+    mean, sq_mean = _block_means(gray, grid), _block_means(gray * gray, grid)
+    contrast = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+    foreground = contrast > MIN_STD
+
+    quality = np.where(foreground, coherence * np.minimum(1.0, contrast / FULL_CONTRAST), -1.0)
+    fg_share = float(foreground.mean())
+    if foreground.any():
+        mean_coherence = float(coherence[foreground].mean())
+        median_contrast = float(np.median(contrast[foreground]))
+        score = float(quality[foreground].mean()) * min(1.0, fg_share / MIN_FOREGROUND)
+    else:
+        mean_coherence, median_contrast, score = 0.0, 0.0, 0.0
+
+    issues = []
+    if fg_share < MIN_FOREGROUND:
+        issues.append("partial")
+    if median_contrast < MIN_CONTRAST:
+        issues.append("light")
+    if mean_coherence < MIN_COHERENCE:
+        issues.append("smudged")
+    return {
+        "score": round(score, 2),
+        "coherence": round(mean_coherence, 2),
+        "contrast": round(median_contrast, 1),
+        "foreground": round(fg_share, 2),
+        "issues": issues,
+        "blocks": quality
+    }
+
+
+def heatmap(img: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+    """
+    Renders per-block quality over a small copy of the crop: red (poor) to green (good),
+    background blocks left uncolored. Returns a BGR image.
+    """
+    scale = min(1.0, HEATMAP_WIDTH / img.shape[1])
+    size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+    base = cv2.cvtColor(cv2.resize(np.asarray(img), size, interpolation=cv2.INTER_AREA), cv2.COLOR_GRAY2BGR)
+
+    # Hue 0 (red) to 60 (green) in OpenCV's 0-180 hue range
+    hsv = np.full(blocks.shape + (3,), 255, dtype=np.uint8)
+    hsv[..., 0] = (np.clip(blocks, 0, 1) * 60).astype(np.uint8)
+    colors = cv2.resize(cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR), size, interpolation=cv2.INTER_NEAREST)
+    ridges = cv2.resize((blocks >= 0).astype(np.uint8), size, interpolation=cv2.INTER_NEAREST).astype(bool)
+
+    blended = cv2.addWeighted(base, 0.5, colors, 0.5, 0)
+    base[ridges] = blended[ridges]
+    return base
@@ -0,0 +1,168 @@
+import os
+import time
+import uuid
+import errno
+import shutil
+import threading
+from contextlib import contextmanager
+
+from services.janitor import dir_size
+
+# Per-job scratch space.
+# Every pipeline run (EFT, FD-258, background prefetch) works in its own directory, so
+# concurrent runs for one session never touch each other's intermediates (PNG/JP2,
+# nfseg segments, decoded raws). Final outputs are moved into the session directory
+# with an atomic rename; readers see either the previous file or the complete new one.
+#
+# Scratch directories live in RAM (tmpfs, /dev/shm by default) while the RAM scratch
+# space is under its budget: the external tools (opj_compress, nfseg, nfiq, dwsq) still
+# get plain paths, but their files never hit the disk. When the budget is used up, new
+# jobs spill to `<session>/jobs/` on disk, and a RAM job that runs out of tmpfs space
+# part-way is re-run on disk (see run_in_scratch).
+
+JOBS_DIR = "jobs"
+
+RAM_SCRATCH_DIR = os.environ.get("OEFT_SCRATCH_RAM_DIR", "/dev/shm/oeft-scratch")
+RAM_SCRATCH_BYTES = int(os.environ.get("OEFT_SCRATCH_RAM_BYTES", 512 * 1024 * 1024)) # 0 disables RAM scratch
+JOB_RESERVE = 64 * 1024 * 1024 # Assumed size of a job that has just started
+
+_RAM_JOBS = 0 # Jobs of this process currently in RAM scratch
+_LOCK = threading.Lock()
+
+
+def _reserve_ram():
+    # Budget check: bytes in RAM scratch (all processes) plus jobs of this process that just started
+    global _RAM_JOBS
+    if RAM_SCRATCH_BYTES <= 0:
+        return False
+    try:
+        os.makedirs(RAM_SCRATCH_DIR, exist_ok=True)
+    except OSError:
+        return False
+    with _LOCK:
+        if dir_size(RAM_SCRATCH_DIR) + (_RAM_JOBS + 1) * JOB_RESERVE > RAM_SCRATCH_BYTES:
+            return False
+        # The tmpfs itself may be smaller than the budget (Docker's /dev/shm is 64 MB by default)
+        stat = os.statvfs(RAM_SCRATCH_DIR)
+        if stat.f_bavail * stat.f_frsize < (_RAM_JOBS + 1) * JOB_RESERVE:
+            return False
+        _RAM_JOBS += 1
+        return True
+
+
+def _release_ram():
+    global _RAM_JOBS
+    with _LOCK:
+        _RAM_JOBS -= 1
+
+
+@contextmanager
+def job_scratch(session_dir: str, prefix: str = "job", ram: bool = True):
+    """
+    Creates a scratch directory for one job and removes it, with all intermediates, afterwards.
+    The directory is on tmpfs if `ram` and the RAM budget allow, else below the session directory.
+    """
+    name = f"{prefix}-{uuid.uuid4().hex[:12]}"
+    in_ram = ram and _reserve_ram()
+    if in_ram:
+        job_dir = os.path.join(RAM_SCRATCH_DIR, os.path.basename(session_dir), name)
+    else:
+        job_dir = os.path.join(session_dir, JOBS_DIR, name)
+    try:
+        os.makedirs(job_dir)
+        yield job_dir
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        if in_ram:
+            _release_ram()
+            try:
+                os.rmdir(os.path.dirname(job_dir))
+            except OSError:
+                pass # Other jobs of the session are still running
+
+
+def in_ram(job_dir: str) -> bool:
+    return os.path.abspath(job_dir).startswith(os.path.abspath(RAM_SCRATCH_DIR) + os.sep)
+
+
+def check_space(job_dir: str):
+    """
+    Raises ENOSPC if `job_dir` is in RAM scratch and the tmpfs is (nearly) full.
+    Called when an external tool fails, since tools report a full disk as their own failure.
+    """
+    if not in_ram(job_dir):
+        return
+    try:
+        stat = os.statvfs(job_dir)
+    except OSError:
+        return
+    if stat.f_bavail * stat.f_frsize < JOB_RESERVE:
+        raise OSError(errno.ENOSPC, "RAM scratch is full", job_dir)
+
+
+def run_in_scratch(session_dir: str, fn, prefix: str = "job"):
+    """
+    Runs `fn(job_dir)` in a new scratch directory and returns its result.
+    A job in RAM scratch that runs out of space is re-run from the start on disk.
+    """
+    with job_scratch(session_dir, prefix) as job_dir:
+        try:
+            return fn(job_dir)
+        except OSError as e:
+            if not (in_ram(job_dir) and e.errno in (errno.ENOSPC, errno.EDQUOT)):
+                raise
+            print(f"RAM scratch full during {prefix} for {os.path.basename(session_dir)}, re-running on disk")
+    with job_scratch(session_dir, prefix, ram=False) as job_dir:
+        return fn(job_dir)
+
+
+def publish(path: str, dest: str) -> str:
+    """
+    Atomically moves a finished output into place, replacing any previous version.
+    Outputs from RAM scratch are first copied next to `dest`, so the final rename stays atomic.
+    """
+    try:
+        os.replace(path, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp_path = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, dest)
+        os.remove(path)
+    return dest
+
+
+def scratch_in_use(session_dir: str, max_age: float) -> bool:
+    """
+    True if a job of the session has a scratch directory (RAM or disk) modified within
+    `max_age` seconds. Older ones were left behind by killed workers and don't count.
+    """
+    cutoff = time.time() - max_age
+    for path in (os.path.join(RAM_SCRATCH_DIR, os.path.basename(session_dir)), os.path.join(session_dir, JOBS_DIR)):
+        try:
+            for entry in os.scandir(path):
+                if entry.stat().st_mtime >= cutoff:
+                    return True
+        except FileNotFoundError:
+            pass
+    return False
+
+
+def sweep_scratch(max_age: float) -> int:
+    """
+    Removes RAM scratch directories of sessions untouched for `max_age` seconds
+    (left behind by killed workers). Returns the number removed.
+    """
+    removed = 0
+    if not os.path.isdir(RAM_SCRATCH_DIR):
+        return removed
+    cutoff = time.time() - max_age
+    for entry in os.scandir(RAM_SCRATCH_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,200 @@
+import os
+import json
+import copy
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+# Session storage.
+# Sessions are small JSON-serializable dicts. Artifact paths inside them are kept
+# relative to TMP_DIR so any process on the host (or a container sharing the
+# volume) can resolve them. Two backends:
+# - MemorySessionStore: per-process dict (default, single worker)
+# - SQLiteSessionStore: local SQLite database in WAL mode, safe for `uvicorn --workers N`
+
+# Root of all session directories, caches and databases. Defined here only;
+# every other module imports it from this one.
+TMP_DIR = "/app/temp"
+
+
+class SessionStore(ABC):
+    """
+    Interface for session backends. `update` is the only way to modify an existing
+    session and is atomic with respect to other updates of the same store.
+    """
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def set(self, session_id: str, data: dict):
+        pass
+
+    @abstractmethod
+    def update(self, session_id: str, fn: Callable[[dict], None]) -> Optional[dict]:
+        """
+        Applies `fn` to the session dict in place and stores the result.
+        Returns the updated session, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def touch(self, session_id: str):
+        """Marks the session as recently used (for idle expiry)."""
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def ids(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def activity(self) -> Dict[str, float]:
+        """Returns {session_id: last activity timestamp} for all sessions."""
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            data = self._sessions.get(session_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def set(self, session_id, data):
+        data = copy.deepcopy(data)
+        data.setdefault("created", time.time())
+        data["updated"] = time.time()
+        with self._lock:
+            self._sessions[session_id] = data
+
+    def update(self, session_id, fn):
+        with self._lock:
+            data = self._sessions.get(session_id)
+            if data is None:
+                return None
+            fn(data)
+            data["updated"] = time.time()
+            return copy.deepcopy(data)
+
+    def touch(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id]["updated"] = time.time()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def ids(self):
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def activity(self):
+        with self._lock:
+            return {k: v["updated"] for k, v in self._sessions.items()}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Stores each session as a JSON document in a local SQLite database.
+    WAL mode lets readers proceed while a writer holds the lock; updates run inside
+    BEGIN IMMEDIATE so concurrent read-modify-write cycles are serialized.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # One connection per thread; autocommit, transactions are explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._conn().execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id, data):
+        data = dict(data)
+        data.setdefault("created", time.time())
+        data["updated"] = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), data["updated"])
+        )
+
+    def update(self, session_id, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            data = json.loads(row[0])
+            fn(data)
+            data["updated"] = time.time()
+            conn.execute(
+                "UPDATE sessions SET data = ?, updated = ? WHERE id = ?",
+                (json.dumps(data), data["updated"], session_id)
+            )
+            conn.execute("COMMIT")
+            return data
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def touch(self, session_id):
+        # Only the column; the JSON copy of `updated` is refreshed on the next update
+        self._conn().execute("UPDATE sessions SET updated = ? WHERE id = ?", (time.time(), session_id))
+
+    def delete(self, session_id):
+        self._conn().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def ids(self):
+        return [row[0] for row in self._conn().execute("SELECT id FROM sessions")]
+
+    def activity(self):
+        return {row[0]: row[1] for row in self._conn().execute("SELECT id, updated FROM sessions")}
+
+
+def create_session_store() -> SessionStore:
+    """
+    Creates the backend selected by OEFT_SESSION_STORE ('memory' or 'sqlite').
+    """
+    backend = os.environ.get("OEFT_SESSION_STORE", "memory").lower()
+    if backend == "sqlite":
+        path = os.environ.get("OEFT_SESSION_DB", os.path.join(TMP_DIR, "sessions.sqlite"))
+        print(f"Using SQLite session store at {path}")
+        return SQLiteSessionStore(path)
+    if backend != "memory":
+        raise ValueError(f"Unknown session store backend: {backend}")
+    return MemorySessionStore()
+
+
+def to_relative(path: str) -> str:
+    """Converts an artifact path to the form stored in sessions (relative to TMP_DIR)."""
+    return os.path.relpath(path, TMP_DIR)
+
+
+def to_absolute(path: str) -> str:
+    """Resolves a stored artifact path against TMP_DIR."""
+    return os.path.join(TMP_DIR, path)
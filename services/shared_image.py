@@ -0,0 +1,106 @@
+import os
+import uuid
+import math
+import numpy as np
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from services.session_store import to_relative, to_absolute
+
+# Shared copies of decoded session images.
+# The aligned card is written once as a raw .npy file (it is never PNG-encoded). Any
+# process on the host memory-maps it and crops prints as zero-copy views, so print
+# workers get a small descriptor plus a box instead of a pickled crop.
+# The pages stay in the OS page cache and are shared by all processes reading the card.
+# Rotated boxes, and boxes that must come out at a fixed size (Type-4), are sampled with a
+# single affine warp straight into a grayscale buffer of the output size.
+
+SHARED_NAME = "aligned.npy"
+
+
+def share_image(img: np.ndarray, path: str) -> dict:
+    """
+    Writes the image as a memory-mappable .npy file and returns its descriptor.
+
+    The descriptor (path relative to TMP_DIR, shape, dtype) is JSON-serializable and is
+    stored in the session, so job payloads carry it to other processes.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    shared = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=img.dtype, shape=img.shape)
+    shared[:] = img
+    shared.flush()
+    del shared
+    os.replace(tmp_path, path)
+    return {"path": to_relative(path), "shape": list(img.shape), "dtype": str(img.dtype)}
+
+
+def open_image(desc: dict) -> np.ndarray:
+    """
+    Memory-maps a shared image read-only. Raises FileNotFoundError or ValueError if it is missing or changed.
+    """
+    img = np.load(to_absolute(desc["path"]), mmap_mode="r")
+    if list(img.shape) != list(desc["shape"]) or str(img.dtype) != desc["dtype"]:
+        raise ValueError(f"Shared image {desc['path']} does not match its descriptor")
+    return img
+
+
+def crop_view(desc_or_img, box: dict) -> np.ndarray:
+    """
+    Returns the box of a shared image (descriptor or already opened) as a zero-copy view.
+    Boxes are clipped to the image like the preview crops.
+    """
+    img = open_image(desc_or_img) if isinstance(desc_or_img, dict) else desc_or_img
+    x, y, w, h = int(box["x"]), int(box["y"]), int(box["w"]), int(box["h"])
+    return np.asarray(img[max(0, y):y + h, max(0, x):x + w])
+
+
+def crop_print(desc_or_img, box: dict, size: tuple = None) -> np.ndarray:
+    """
+    Returns the print inside a box, at `size` (w, h; default the box size).
+
+    The box may carry an `angle` (degrees counter-clockwise, about its center). Axis-aligned
+    boxes at their own size are zero-copy views (see crop_view); anything else is sampled
+    with one warpAffine into a new buffer. Axis-aligned boxes are clipped to the image
+    first; rotated boxes reaching past the card are filled with white.
+    """
+    img = open_image(desc_or_img) if isinstance(desc_or_img, dict) else desc_or_img
+    angle = float(box.get("angle") or 0)
+    x, y, w, h = float(box["x"]), float(box["y"]), float(box["w"]), float(box["h"])
+    if angle == 0:
+        x1, y1 = max(0, int(x)), max(0, int(y))
+        x2, y2 = min(img.shape[1], int(x) + int(w)), min(img.shape[0], int(y) + int(h))
+        x, y, w, h = x1, y1, max(1, x2 - x1), max(1, y2 - y1)
+        if size is None or tuple(size) == (w, h):
+            return crop_view(img, {"x": x, "y": y, "w": w, "h": h})
+    out_w, out_h = (int(w), int(h)) if size is None else (int(size[0]), int(size[1]))
+
+    # Strong reductions are sampled at an integer multiple of the output size and
+    # box-averaged down, so fine ridges do not alias
+    factor = max(1, int(min(w / out_w, h / out_h)))
+    warp_w, warp_h = out_w * factor, out_h * factor
+
+    # Output pixel (u, v) -> card pixel: scale to the box, rotate about its center, move to the card.
+    # Pixel centers sit at +0.5, as in cv2.resize.
+    cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    rotation = np.float64([[cos, sin], [-sin, cos]])
+    linear = rotation @ np.diag([w / warp_w, h / warp_h])
+    offset = np.float64([x + w / 2 - 0.5, y + h / 2 - 0.5]) + rotation @ np.float64([w / warp_w * 0.5 - w / 2, h / warp_h * 0.5 - h / 2])
+
+    # Only the box's bounding rectangle of the card is handed to OpenCV
+    corners = offset + np.float64([[0, 0], [warp_w, 0], [0, warp_h], [warp_w, warp_h]]) @ linear.T
+    bx1, by1 = np.maximum(np.floor(corners.min(axis=0)).astype(int) - 1, 0)
+    bx2, by2 = np.minimum(np.ceil(corners.max(axis=0)).astype(int) + 2, [img.shape[1], img.shape[0]])
+    region = np.asarray(img[by1:max(by1, by2), bx1:max(bx1, bx2)])
+    matrix = np.hstack([linear, (offset - [bx1, by1]).reshape(2, 1)])
+
+    out = np.empty((warp_h, warp_w), dtype=img.dtype)
+    if region.size:
+        cv2.warpAffine(region, matrix, (warp_w, warp_h), dst=out, flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                       borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    else:
+        out.fill(255)
+    if factor > 1:
+        out = cv2.resize(out, (out_w, out_h), interpolation=cv2.INTER_AREA)
+    return out
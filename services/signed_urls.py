@@ -0,0 +1,72 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import uuid
+
+from services.session_store import TMP_DIR
+
+# Short-lived signed URLs for session images (previews, crops).
+# The secret comes from OEFT_URL_SECRET or is generated once and kept in the temp
+# directory, so every worker process on the host signs with the same key.
+
+DEFAULT_TTL = 300 # Seconds
+SECRET_FILE = os.path.join(TMP_DIR, ".url_secret")
+
+_secret = None
+
+
+def _get_secret() -> bytes:
+    global _secret
+    if _secret is not None:
+        return _secret
+
+    env_secret = os.environ.get("OEFT_URL_SECRET")
+    if env_secret:
+        _secret = env_secret.encode()
+        return _secret
+
+    # First process to get here creates the secret, everyone else reads it. The secret is
+    # written to a temp file and linked into place, so SECRET_FILE never exists half-written.
+    if not os.path.exists(SECRET_FILE):
+        tmp_path = f"{SECRET_FILE}.{uuid.uuid4().hex[:8]}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+                f.flush()
+                os.fsync(f.fileno())
+            os.link(tmp_path, SECRET_FILE)
+        except FileExistsError:
+            pass # Another process won
+        finally:
+            os.remove(tmp_path)
+    with open(SECRET_FILE, "r") as f:
+        secret = f.read().strip()
+    if not secret:
+        raise RuntimeError(f"URL signing secret {SECRET_FILE} is empty")
+    _secret = secret.encode()
+    return _secret
+
+
+def _signature(path: str, expires: int) -> str:
+    msg = f"{path}:{expires}".encode()
+    return hmac.new(_get_secret(), msg, hashlib.sha256).hexdigest()[:32]
+
+
+def sign_url(path: str, ttl: int = DEFAULT_TTL) -> str:
+    """
+    Returns `path` with `expires` and `sig` query parameters appended.
+    """
+    expires = int(time.time()) + ttl
+    return f"{path}?expires={expires}&sig={_signature(path, expires)}"
+
+
+def verify_url(path: str, expires: int, sig: str) -> bool:
+    """
+    Checks a signature produced by `sign_url` and that it has not expired.
+    """
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(path, expires), sig or "")
@@ -0,0 +1,152 @@
+import os
+import time
+from typing import List
+import cv2
+import numpy as np
+
+from services.shared_image import crop_print
+
+# Slap segmentation without NBIS.
+# A downsampled slap is binarized and its fingers are separated by the valleys of the
+# column projection profile; the largest connected component in each column is a
+# finger, whose second moments give its axis. The fingertip (distal phalanx) box is
+# cut along that axis. Used when nfseg fails or finds nothing, so a poor slap still
+# yields Type-14 positions and segments instead of forcing a re-scan.
+
+WORK_WIDTH = 320 # Working resolution (pixels across the slap)
+TIP_RATIO = 1.5 # Segment height relative to the finger width
+MIN_FINGER_AREA = 0.01 # Smallest finger blob, as a fraction of the working image
+
+# Fingers per slap
+FINGER_COUNTS = {13: 4, 14: 4, 15: 2}
+
+
+def finger_number(fp_number, i):
+    # Finger position of the i-th finger from the left, numbered as nfseg does (new_fgp):
+    # right slap 2..5, left slap 10..7, thumbs 12, 11
+    fp_number = int(fp_number)
+    if fp_number == 13:
+        return 2 + i
+    if fp_number == 14:
+        return 10 - i
+    return 12 - i
+
+
+def _foreground(small):
+    # Ridges are dark: blur them into solid finger blobs
+    blur = cv2.GaussianBlur(small, (0, 0), 2)
+    _, mask = cv2.threshold(blur, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7)))
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)))
+
+
+def _split_columns(mask, count):
+    # Column boundaries between fingers: the deepest valleys of the smoothed profile
+    profile = mask.sum(axis=0).astype(np.float64)
+    width = max(3, mask.shape[1] // 40)
+    profile = np.convolve(profile, np.ones(width) / width, mode="same")
+    cols = np.nonzero(profile > 0.05 * profile.max())[0]
+    if cols.size == 0:
+        return None
+    left, right = int(cols[0]), int(cols[-1]) + 1
+    min_gap = (right - left) / (count * 2)
+
+    inner = np.arange(left + 1, right - 1)
+    minima = inner[(profile[inner] <= profile[inner - 1]) & (profile[inner] <= profile[inner + 1])]
+    splits = []
+    for col in minima[np.argsort(profile[minima], kind="stable")]:
+        if len(splits) == count - 1:
+            break
+        if min(col - left, right - col) >= min_gap and all(abs(col - s) >= min_gap for s in splits):
+            splits.append(int(col))
+    if len(splits) < count - 1:
+        # Fingers pressed together: equal columns
+        splits = [int(left + (right - left) * i / count) for i in range(1, count)]
+    return [left] + sorted(splits) + [right]
+
+
+def _fingertip(component):
+    # Fingertip box (center, width, height, angle) of a finger blob in working pixels
+    ys, xs = np.nonzero(component)
+    pts = np.column_stack([xs, ys]).astype(np.float64)
+    mean = pts.mean(axis=0)
+    cov = np.cov((pts - mean).T)
+    evals, evecs = np.linalg.eigh(cov)
+    axis = evecs[:, np.argmax(evals)]
+    if axis[1] > 0:
+        axis = -axis # Point towards the tip (up)
+    # Degrees counter-clockwise from vertical (shared_image.crop_print convention)
+    angle = float(np.degrees(np.arctan2(-axis[0], -axis[1])))
+    across_axis = np.float64([np.cos(np.radians(angle)), -np.sin(np.radians(angle))])
+
+    along = pts @ axis
+    across = pts @ across_axis
+    a1, a2 = np.percentile(across, [2, 98])
+    width = a2 - a1
+    tip = along.max()
+    height = min(tip - along.min(), TIP_RATIO * width)
+    center = (a1 + a2) / 2 * across_axis + (tip - height / 2) * axis
+    return center, width, height, angle
+
+
+def find_fingers(img, fp_number) -> List[dict]:
+    """
+    Locates the fingertips of a slap image.
+
+    Args:
+        img: The grayscale slap (full resolution).
+        fp_number: 13 (right four), 14 (left four) or 15 (thumbs).
+
+    Returns:
+        List of boxes {n, x, y, w, h, angle} in full-resolution pixels, angle in degrees
+        counter-clockwise about the box center; fingers that are not found are left out.
+    """
+    count = FINGER_COUNTS.get(int(fp_number))
+    if count is None:
+        return []
+    scale = min(1.0, WORK_WIDTH / img.shape[1])
+    small = cv2.resize(np.asarray(img), None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    mask = _foreground(small)
+    bounds = _split_columns(mask, count)
+    if bounds is None:
+        return []
+
+    fingers = []
+    for i in range(count):
+        strip = np.zeros_like(mask)
+        strip[:, bounds[i]:bounds[i + 1]] = mask[:, bounds[i]:bounds[i + 1]]
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(strip, connectivity=8)
+        if n < 2:
+            continue
+        label = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        if stats[label, cv2.CC_STAT_AREA] < MIN_FINGER_AREA * mask.size:
+            continue
+        (cx, cy), w, h, angle = _fingertip(labels == label)
+        w, h = max(1, round(w / scale)), max(1, round(h / scale))
+        fingers.append({
+            "n": finger_number(fp_number, i),
+            "x": round(cx / scale - w / 2), "y": round(cy / scale - h / 2), "w": w, "h": h,
+            "angle": round(angle, 1)
+        })
+    return fingers
+
+
+def segment_slap(img, image_path: str, fp_number) -> List[dict]:
+    """
+    Segments a slap like `nbis_helper.segment_fingerprints`, without nfseg.
+
+    Each fingertip is cut from the slap along its axis and written next to `image_path`
+    as raw 8-bit pixels (`<base>_<nn>.raw`, sw x sh).
+
+    Returns:
+        Segment dicts with the same keys as segment_fingerprints (file, sw, sh, sx, sy, th).
+    """
+    start = time.time()
+    base = os.path.splitext(os.path.basename(image_path))[0]
+    segments = []
+    for box in find_fingers(img, fp_number):
+        name = f"{base}_{box['n']:02d}.raw"
+        crop_print(img, box).tofile(os.path.join(os.path.dirname(image_path), name))
+        segments.append({"file": name, "sw": box["w"], "sh": box["h"], "sx": box["x"], "sy": box["y"], "th": box["angle"]})
+    print(f"Fallback segmentation found {len(segments)} fingers in FP {fp_number} ({(time.time() - start) * 1000:.0f} ms)")
+    return segments
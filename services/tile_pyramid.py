@@ -0,0 +1,76 @@
+import os
+import math
+import uuid
+import cv2
+
+# Deep-zoom style image pyramid used by the crop and box editors.
+# Level `max_level` is the full-resolution image, every level below halves both
+# dimensions (rounding up) down to a single pixel at level 0.
+
+TILE_SIZE = 512
+TILE_QUALITY = 85
+
+
+def level_scale(pyramid: dict, level: int) -> int:
+    """
+    Returns the factor that maps coordinates on `level` back to full resolution.
+    """
+    level = max(0, min(int(level), pyramid["max_level"]))
+    return 2 ** (pyramid["max_level"] - level)
+
+
+def level_dimensions(pyramid: dict, level: int):
+    """
+    Returns (width, height) of the given pyramid level.
+    """
+    scale = level_scale(pyramid, level)
+    return math.ceil(pyramid["width"] / scale), math.ceil(pyramid["height"] / scale)
+
+
+def build_pyramid(img, out_dir: str, tile_size: int = TILE_SIZE) -> dict:
+    """
+    Cuts `img` into a tile pyramid under `out_dir/<pyramid_id>/<level>/<col>_<row>.jpg`.
+
+    Each pyramid gets a fresh id so tiles never change once written and can be
+    served with long-lived cache headers.
+
+    Args:
+        img: Image to tile (grayscale or BGR numpy array).
+        out_dir: Directory that holds all pyramids of a session.
+        tile_size: Edge length of the square tiles in pixels.
+
+    Returns:
+        A dict describing the pyramid (id, full resolution size, tile size, levels).
+    """
+    pyramid_id = uuid.uuid4().hex[:12]
+    root = os.path.join(out_dir, pyramid_id)
+
+    h, w = img.shape[:2]
+    max_level = int(math.ceil(math.log2(max(w, h, 1))))
+
+    level_img = img
+    for level in range(max_level, -1, -1):
+        lh, lw = level_img.shape[:2]
+        level_dir = os.path.join(root, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+
+        for row in range(0, math.ceil(lh / tile_size)):
+            for col in range(0, math.ceil(lw / tile_size)):
+                tile = level_img[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+                cv2.imwrite(os.path.join(level_dir, f"{col}_{row}.jpg"), tile, [cv2.IMWRITE_JPEG_QUALITY, TILE_QUALITY])
+
+        # Halve for the next level (INTER_AREA averages instead of dropping pixels)
+        if level > 0:
+            next_w, next_h = math.ceil(lw / 2), math.ceil(lh / 2)
+            level_img = cv2.resize(level_img, (next_w, next_h), interpolation=cv2.INTER_AREA)
+
+    print(f"Built tile pyramid {pyramid_id}: {w}x{h}, {max_level + 1} levels")
+    return {
+        "id": pyramid_id,
+        "width": w,
+        "height": h,
+        "tile_size": tile_size,
+        "max_level": max_level,
+        "format": "jpg"
+    }
+
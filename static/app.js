@@ -1,8 +1,8 @@
 
 // Global State
 let sessionId = null;
-let image = new Image(); // For verification/box selection (Step 1)
-let cropImage = new Image(); // For crop step (Step 1)
+let image = document.createElement('canvas'); // For verification/box selection (Step 1), one pyramid level
+let cropImage = document.createElement('canvas'); // For crop step (Step 1), one pyramid level
 let boxes = []; // Array of fingerprint boxes
 let activeBoxIndex = -1;
 let isCaptureSession = false; // Track if session is from capture
@@ -20,6 +20,7 @@ let isResizing = false;
 let resizeHandle = null;
 let scaleFactor = 1;
 let selectedGenMode = 'atf'; // 'atf' or 'rolled'
+let registeredBoxes = null; // Boxes per mode from card registration (full-resolution pixels)
 
 // Edit/View State
 let isEditMode = false;
@@ -174,6 +175,225 @@ async function loadDynamicContent(url, title) {
     }
 }
 
+// TILE PYRAMID
+// The server cuts each card into a deep-zoom style pyramid. Only the level that
+// fits the screen is fetched and stitched into a canvas; coordinates on that
+// canvas are mapped back to full resolution server-side using `level`.
+
+function pyramidLevelDims(pyramid, level) {
+    const scale = Math.pow(2, pyramid.max_level - level);
+    return { w: Math.ceil(pyramid.width / scale), h: Math.ceil(pyramid.height / scale) };
+}
+
+// Factor between canvas pixels and full-resolution pixels
+function levelScale(canvas) {
+    if (!canvas.pyramid) return 1;
+    return Math.pow(2, canvas.pyramid.max_level - canvas.level);
+}
+
+async function loadPyramidLevel(pyramid, maxW, maxH) {
+    // Smallest level that still covers the requested size
+    let level = pyramid.max_level;
+    while (level > 0) {
+        const dims = pyramidLevelDims(pyramid, level - 1);
+        if (dims.w < maxW && dims.h < maxH) break;
+        level--;
+    }
+
+    const dims = pyramidLevelDims(pyramid, level);
+    const canvas = document.createElement('canvas');
+    canvas.width = dims.w;
+    canvas.height = dims.h;
+    canvas.level = level;
+    canvas.pyramid = pyramid;
+    const ctx = canvas.getContext('2d');
+
+    const ts = pyramid.tile_size;
+    const jobs = [];
+    for (let row = 0; row < Math.ceil(dims.h / ts); row++) {
+        for (let col = 0; col < Math.ceil(dims.w / ts); col++) {
+            jobs.push(new Promise((resolve, reject) => {
+                const tile = new Image();
+                tile.onload = () => { ctx.drawImage(tile, col * ts, row * ts); resolve(); };
+                tile.onerror = () => reject(new Error("Failed to load image tile"));
+                tile.src = `${pyramid.url}/${level}/${col}_${row}.${pyramid.format}`;
+            }));
+        }
+    }
+    await Promise.all(jobs);
+    return canvas;
+}
+
+// Target size for pyramid levels: the whole viewport at device resolution
+function screenTargetSize() {
+    const dpr = window.devicePixelRatio || 1;
+    return { w: window.innerWidth * dpr, h: window.innerHeight * dpr };
+}
+
+// RESUMABLE UPLOADS
+// Files are sent in chunks to /api/uploads. After a dropped connection the client
+// asks the server for the committed offset and continues from there. The upload id
+// is remembered per file so a page reload can resume as well.
+
+const UPLOAD_RETRIES = 8;
+
+// Incremental SHA-256. Hashes the whole file chunk by chunk during the upload (crypto.subtle
+// has no incremental API) and stands in for crypto.subtle on pages served without a secure
+// context. Round constants are derived from the primes as in FIPS 180-4.
+const SHA256_K = [];
+const SHA256_H0 = [];
+(function () {
+    const frac = x => (x - Math.floor(x)) * 0x100000000 >>> 0;
+    for (let n = 2; SHA256_K.length < 64; n++) {
+        let prime = true;
+        for (let d = 2; d * d <= n; d++) if (n % d === 0) { prime = false; break; }
+        if (!prime) continue;
+        if (SHA256_H0.length < 8) SHA256_H0.push(frac(Math.sqrt(n)));
+        SHA256_K.push(frac(Math.cbrt(n)));
+    }
+})();
+
+class Sha256 {
+    constructor() {
+        this.h = SHA256_H0.slice();
+        this.w = new Uint32Array(64);
+        this.block = new Uint8Array(64);
+        this.used = 0; // Bytes waiting in `block`
+        this.length = 0;
+    }
+
+    _compress(view, pos) {
+        const w = this.w, h = this.h;
+        const rotr = (x, n) => (x >>> n) | (x << (32 - n));
+        for (let i = 0; i < 16; i++) w[i] = view.getUint32(pos + i * 4);
+        for (let i = 16; i < 64; i++) {
+            const s0 = rotr(w[i - 15], 7) ^ rotr(w[i - 15], 18) ^ (w[i - 15] >>> 3);
+            const s1 = rotr(w[i - 2], 17) ^ rotr(w[i - 2], 19) ^ (w[i - 2] >>> 10);
+            w[i] = w[i - 16] + s0 + w[i - 7] + s1;
+        }
+        let [a, b, c, d, e, f, g, hh] = h;
+        for (let i = 0; i < 64; i++) {
+            const t1 = hh + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + ((e & f) ^ (~e & g)) + SHA256_K[i] + w[i];
+            const t2 = (rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c));
+            hh = g; g = f; f = e; e = (d + t1) | 0; d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        [a, b, c, d, e, f, g, hh].forEach((v, i) => { h[i] = (h[i] + v) >>> 0; });
+    }
+
+    update(data) {
+        const bytes = data instanceof Uint8Array ? data : new Uint8Array(data);
+        this.length += bytes.length;
+        let i = 0;
+        if (this.used) {
+            i = Math.min(64 - this.used, bytes.length);
+            this.block.set(bytes.subarray(0, i), this.used);
+            this.used += i;
+            if (this.used < 64) return this;
+            this._compress(new DataView(this.block.buffer), 0);
+            this.used = 0;
+        }
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        for (; i + 64 <= bytes.length; i += 64) this._compress(view, i);
+        this.block.set(bytes.subarray(i), 0);
+        this.used = bytes.length - i;
+        return this;
+    }
+
+    hex() {
+        const length = this.length;
+        const pad = new Uint8Array((this.used < 56 ? 64 : 128) - this.used);
+        pad[0] = 0x80;
+        const view = new DataView(pad.buffer);
+        view.setUint32(pad.length - 8, Math.floor(length / 0x20000000));
+        view.setUint32(pad.length - 4, length * 8 >>> 0);
+        this.update(pad);
+        return this.h.map(v => v.toString(16).padStart(8, '0')).join('');
+    }
+}
+
+async function sha256Hex(buffer) {
+    // crypto.subtle is only available in secure contexts (https/localhost)
+    if (!window.crypto || !window.crypto.subtle) return new Sha256().update(buffer).hex();
+    const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function resumableUpload(file, kind) {
+    const resumeKey = `oeft-upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+    let uploadId = localStorage.getItem(resumeKey);
+    let offset = 0;
+    let chunkSize = 4 * 1024 * 1024;
+
+    if (uploadId) {
+        const res = await fetch(`/api/uploads/${uploadId}`);
+        if (res.ok) {
+            offset = (await res.json()).offset;
+        } else {
+            uploadId = null;
+        }
+    }
+
+    if (!uploadId) {
+        const res = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ kind: kind, size: file.size })
+        });
+        if (!res.ok) throw new Error((await res.json()).detail || "Upload failed");
+        const data = await res.json();
+        uploadId = data.upload_id;
+        chunkSize = data.chunk_size;
+        localStorage.setItem(resumeKey, uploadId);
+    }
+
+    // Whole-file hash for finalize, fed with every committed chunk in order
+    const fileHash = new Sha256();
+    let hashed = 0;
+
+    let failures = 0;
+    while (offset < file.size) {
+        const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+        const headers = { 'X-Chunk-SHA256': await sha256Hex(chunk) };
+
+        try {
+            const res = await fetch(`/api/uploads/${uploadId}?offset=${offset}`, { method: 'PUT', headers, body: chunk });
+            const data = await res.json();
+            if (res.ok) {
+                if (offset === hashed) {
+                    fileHash.update(chunk);
+                    hashed += chunk.byteLength;
+                }
+                offset = data.offset;
+                failures = 0;
+                continue;
+            }
+            if (data.offset === undefined || ++failures > UPLOAD_RETRIES) throw new Error(data.detail || "Upload failed");
+            // Server told us where to continue from (offset mismatch, bad checksum)
+            offset = data.offset;
+        } catch (e) {
+            if (++failures > UPLOAD_RETRIES) throw e;
+            await new Promise(r => setTimeout(r, Math.min(1000 * Math.pow(2, failures), 15000)));
+            const res = await fetch(`/api/uploads/${uploadId}`).catch(() => null);
+            if (res && res.ok) offset = (await res.json()).offset;
+        }
+    }
+
+    // Part sent before a page reload: hash it from the file
+    while (hashed < file.size) {
+        const rest = await file.slice(hashed, hashed + chunkSize).arrayBuffer();
+        fileHash.update(rest);
+        hashed += rest.byteLength;
+    }
+    const res = await fetch(`/api/uploads/${uploadId}/finalize`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ sha256: fileHash.hex() })
+    });
+    localStorage.removeItem(resumeKey);
+    if (!res.ok) throw new Error((await res.json()).detail || "Upload failed");
+    return await res.json();
+}
+
 // NEW EFT LOGIC
 
 function updateWizardUI() {
@@ -298,12 +518,73 @@ async function loadSupportInfo() {
 
 
 
+// Optional print conditioning (trim, background cleanup, contrast) before encoding
+function conditionPrints() {
+    const checkbox = document.getElementById('condition-prints');
+    return !!(checkbox && checkbox.checked);
+}
+
+// Boxes are confirmed: let the server start encoding the prints while Type-2 data is entered.
+// Fire-and-forget; /api/generate redoes anything that did not finish.
+// The response carries a quick quality check of each print, shown above the form.
+function prefetchPrints() {
+    document.getElementById('print-quality').classList.add('hidden');
+    fetch('/api/preview', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            session_id: sessionId,
+            boxes: boxes,
+            type2_data: {},
+            mode: selectedGenMode,
+            level: image.level,
+            condition: conditionPrints()
+        })
+    })
+        .then(res => res.ok ? res.json() : null)
+        .then(result => { if (result && result.quality) showPrintQuality(result.quality); })
+        .catch(() => {});
+}
+
+const QUALITY_ISSUES = { partial: 'Partial or missing', light: 'Too light', smudged: 'Smudged' };
+
+// Shows a heatmap card per print; the panel stays hidden when every print passes
+function showPrintQuality(quality) {
+    const panel = document.getElementById('print-quality');
+    const list = document.getElementById('print-quality-list');
+    list.innerHTML = '';
+    let flagged = 0;
+
+    Object.entries(quality).forEach(([id, q]) => {
+        if (q.issues.length) flagged++;
+        const card = document.createElement('div');
+        card.style.cssText = 'width: 160px; text-align: center; font-size: 0.8rem;';
+
+        const img = document.createElement('img');
+        img.src = q.heatmap;
+        img.alt = id;
+        img.style.cssText = 'width: 100%; border-radius: 4px; border: 2px solid ' + (q.issues.length ? '#e74c3c' : 'var(--accent-color)') + ';';
+
+        const label = document.createElement('div');
+        label.textContent = `${id}: ${Math.round(q.score * 100)}%`;
+        const issues = document.createElement('div');
+        issues.style.color = q.issues.length ? '#e74c3c' : 'var(--text-muted)';
+        issues.textContent = q.issues.length ? q.issues.map(i => QUALITY_ISSUES[i] || i).join(', ') : 'OK';
+
+        card.append(img, label, issues);
+        list.appendChild(card);
+    });
+
+    panel.classList.toggle('hidden', flagged === 0);
+}
+
 // Next Button Logic
 btnNext.onclick = async () => {
     if (currentStep === 1) {
         if (currentSubStep === 'crop') {
             await confirmCrop();
         } else if (currentSubStep === 'box') {
+            prefetchPrints();
             currentStep = 2;
             updateWizardUI();
         }
@@ -365,24 +646,18 @@ fileInput.addEventListener('change', (e) => {
 });
 
 async function handleFileUpload(file) {
-    const formData = new FormData();
-    formData.append("file", file);
-
     showLoading(true);
     try {
-        const res = await fetch('/api/upload', { method: 'POST', body: formData });
-        if (!res.ok) throw new Error("Upload failed");
-        const data = await res.json();
+        const data = await resumableUpload(file, 'card');
 
         sessionId = data.session_id;
         isCaptureSession = false;
 
-        cropImage.onload = () => {
-            currentSubStep = 'crop';
-            updateWizardUI();
-            requestAnimationFrame(initCropStep);
-        };
-        cropImage.src = "data:image/png;base64," + data.image_base64;
+        const target = screenTargetSize();
+        cropImage = await loadPyramidLevel(data.pyramid, target.w, target.h);
+        currentSubStep = 'crop';
+        updateWizardUI();
+        requestAnimationFrame(initCropStep);
 
     } catch (e) {
         alert(e.message);
@@ -400,9 +675,9 @@ function initCropStep() {
 
 function getRotatedDimensions() {
     if (cropRotation % 180 === 0) {
-        return { w: cropImage.naturalWidth, h: cropImage.naturalHeight };
+        return { w: cropImage.width, h: cropImage.height };
     } else {
-        return { w: cropImage.naturalHeight, h: cropImage.naturalWidth };
+        return { w: cropImage.height, h: cropImage.width };
     }
 }
 
@@ -427,7 +702,7 @@ function drawCropCanvas() {
 
     cropCtx.translate(dims.w / 2, dims.h / 2);
     cropCtx.rotate(cropRotation * Math.PI / 180);
-    cropCtx.drawImage(cropImage, -cropImage.naturalWidth / 2, -cropImage.naturalHeight / 2);
+    cropCtx.drawImage(cropImage, -cropImage.width / 2, -cropImage.height / 2);
 
     cropCtx.restore();
 
@@ -489,7 +764,8 @@ async function confirmCrop() {
     const dims = getRotatedDimensions();
     const finalCrop = cropBox || { x: 0, y: 0, w: dims.w, h: dims.h };
 
-    if (finalCrop.w < 100 || finalCrop.h < 100) return alert("Selection too small");
+    const cropScale = levelScale(cropImage);
+    if (finalCrop.w * cropScale < 100 || finalCrop.h * cropScale < 100) return alert("Selection too small");
 
     showLoading(true);
     try {
@@ -499,7 +775,8 @@ async function confirmCrop() {
             x: Math.round(finalCrop.x),
             y: Math.round(finalCrop.y),
             w: Math.round(finalCrop.w),
-            h: Math.round(finalCrop.h)
+            h: Math.round(finalCrop.h),
+            level: cropImage.level
         };
 
         const res = await fetch('/api/process_crop', {
@@ -511,14 +788,13 @@ async function confirmCrop() {
         if (!res.ok) throw new Error("Processing failed");
         const data = await res.json();
 
-        // boxes = data.boxes; // Do not use default boxes from backend
+        // Boxes from card registration; if the card was not recognized the UI defaults are used
+        registeredBoxes = data.registered ? data.mode_boxes : null;
 
-        image.onload = () => {
-            currentSubStep = 'mode';
-            updateWizardUI();
-            // requestAnimationFrame(initVerifyStep);
-        };
-        image.src = "data:image/png;base64," + data.image_base64;
+        const target = screenTargetSize();
+        image = await loadPyramidLevel(data.pyramid, target.w, target.h);
+        currentSubStep = 'mode';
+        updateWizardUI();
 
     } catch (e) {
         alert(e.message);
@@ -555,6 +831,12 @@ function getVerifyMousePos(evt) {
 }
 
 function getBoxesForMode(mode) {
+    if (registeredBoxes && registeredBoxes[mode]) {
+        // Full-resolution pixels -> loaded pyramid level
+        const unit = 1 / levelScale(image);
+        return registeredBoxes[mode].map(b => ({ ...b, x: b.x * unit, y: b.y * unit, w: b.w * unit, h: b.h * unit }));
+    }
+
     const w = image.width;
     const h = image.height;
 
@@ -603,7 +885,9 @@ function drawVerifyCanvas() {
     verifyCtx.save();
     verifyCtx.scale(scaleFactor, scaleFactor);
     verifyCtx.drawImage(image, 0, 0);
-    verifyCtx.lineWidth = 10;
+    // Sizes below are in full-resolution pixels; convert to the loaded pyramid level
+    const unit = 1 / levelScale(image);
+    verifyCtx.lineWidth = 10 * unit;
 
     boxes.forEach((box, index) => {
         // High contrast colors: Active=Magenta (#FF00FF), Inactive=Cyan (#00FFFF) or Lime (#00FF00)
@@ -612,13 +896,13 @@ function drawVerifyCanvas() {
         verifyCtx.strokeStyle = isActive ? '#FF00FF' : '#00FF00';
         verifyCtx.strokeRect(box.x, box.y, box.w, box.h);
         verifyCtx.fillStyle = verifyCtx.strokeStyle;
-        verifyCtx.font = 'bold 40px Arial';
-        verifyCtx.fillText(box.id, box.x, box.y - 10);
+        verifyCtx.font = `bold ${Math.round(40 * unit)}px Arial`;
+        verifyCtx.fillText(box.id, box.x, box.y - 10 * unit);
 
         if (isActive) {
             // Drag Handles: Bright Yellow/Orange for contrast
             verifyCtx.fillStyle = '#FFD700'; // Gold
-            const handleSize = 40;
+            const handleSize = 40 * unit;
             verifyCtx.fillRect(box.x - handleSize / 2, box.y - handleSize / 2, handleSize, handleSize);
             verifyCtx.fillRect(box.x + box.w - handleSize / 2, box.y - handleSize / 2, handleSize, handleSize);
             verifyCtx.fillRect(box.x - handleSize / 2, box.y + box.h - handleSize / 2, handleSize, handleSize);
@@ -681,7 +965,7 @@ function isInside(box, x, y) {
 }
 
 function getResizeHandle(box, x, y) {
-    const d = 40;
+    const d = 40 / levelScale(image);
     if (Math.abs(x - box.x) < d && Math.abs(y - box.y) < d) return 'tl';
     if (Math.abs(x - (box.x + box.w)) < d && Math.abs(y - box.y) < d) return 'tr';
     if (Math.abs(x - box.x) < d && Math.abs(y - (box.y + box.h)) < d) return 'bl';
@@ -690,22 +974,23 @@ function getResizeHandle(box, x, y) {
 }
 
 function resizeBox(box, handle, mx, my) {
+    const min = 10 / levelScale(image);
     if (handle === 'tl') {
         const newW = (box.x + box.w) - mx;
         const newH = (box.y + box.h) - my;
-        if (newW > 10 && newH > 10) { box.x = mx; box.y = my; box.w = newW; box.h = newH; }
+        if (newW > min && newH > min) { box.x = mx; box.y = my; box.w = newW; box.h = newH; }
     } else if (handle === 'tr') {
         const newW = mx - box.x;
         const newH = (box.y + box.h) - my;
-        if (newW > 10 && newH > 10) { box.y = my; box.w = newW; box.h = newH; }
+        if (newW > min && newH > min) { box.y = my; box.w = newW; box.h = newH; }
     } else if (handle === 'bl') {
         const newW = (box.x + box.w) - mx;
         const newH = my - box.y;
-        if (newW > 10 && newH > 10) { box.x = mx; box.w = newW; box.h = newH; }
+        if (newW > min && newH > min) { box.x = mx; box.w = newW; box.h = newH; }
     } else if (handle === 'br') {
         const newW = mx - box.x;
         const newH = my - box.y;
-        if (newW > 10 && newH > 10) { box.w = newW; box.h = newH; }
+        if (newW > min && newH > min) { box.w = newW; box.h = newH; }
     }
 }
 
@@ -827,7 +1112,9 @@ btnSubmit.onclick = async () => {
         session_id: sessionId,
         boxes: boxes,
         type2_data: data,
-        mode: selectedGenMode
+        mode: selectedGenMode,
+        level: isCaptureSession ? null : image.level,
+        condition: conditionPrints()
     };
 
     showLoading(true);
@@ -851,8 +1138,10 @@ btnSubmit.onclick = async () => {
         // Show FD258 button if capture session
         if (isCaptureSession) {
             document.getElementById('btn-dl-fd258').classList.remove('hidden');
+            document.getElementById('btn-dl-fd258-pdf').classList.remove('hidden');
         } else {
             document.getElementById('btn-dl-fd258').classList.add('hidden');
+            document.getElementById('btn-dl-fd258-pdf').classList.add('hidden');
         }
 
     } catch (e) {
@@ -863,7 +1152,8 @@ btnSubmit.onclick = async () => {
 };
 
 
-document.getElementById('btn-dl-fd258').onclick = async () => {
+// Renders the FD-258 card ('jpg' image or print-ready 'pdf') and downloads it
+async function downloadFD258(format) {
 
     const formData = new FormData(document.getElementById('type2-form'));
     const data = Object.fromEntries(formData.entries());
@@ -887,7 +1177,9 @@ document.getElementById('btn-dl-fd258').onclick = async () => {
         session_id: sessionId,
         boxes: boxes,
         type2_data: data,
-        mode: selectedGenMode
+        mode: selectedGenMode,
+        level: isCaptureSession ? null : image.level,
+        format: format
     };
 
     showLoading(true);
@@ -916,6 +1208,9 @@ document.getElementById('btn-dl-fd258').onclick = async () => {
     }
 }
 
+document.getElementById('btn-dl-fd258').onclick = () => downloadFD258('jpg');
+document.getElementById('btn-dl-fd258-pdf').onclick = () => downloadFD258('pdf');
+
 document.getElementById('btn-restart').onclick = () => window.location.reload();
 
 
@@ -1100,21 +1395,24 @@ function logToConsole(msg) {
     }
 }
 
+function base64ToBlob(b64, type) {
+    const bin = atob(b64);
+    const bytes = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    return new Blob([bytes], { type });
+}
+
 async function finalizeCapture() {
     // 1. Send images to backend to create a session
     showLoading(true);
     try {
-        const payload = {
-            l_slap: capturedPrints.L_SLAP,
-            r_slap: capturedPrints.R_SLAP,
-            thumbs: capturedPrints.THUMBS
-        };
+        // The helper delivers base64 over the websocket; send the decoded bytes as binary parts
+        const formData = new FormData();
+        formData.append("l_slap", base64ToBlob(capturedPrints.L_SLAP, "image/png"), "14.png");
+        formData.append("r_slap", base64ToBlob(capturedPrints.R_SLAP, "image/png"), "13.png");
+        formData.append("thumbs", base64ToBlob(capturedPrints.THUMBS, "image/png"), "15.png");
 
-        const res = await fetch('/api/start_capture_session', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(payload)
-        });
+        const res = await fetch('/api/start_capture_session', { method: 'POST', body: formData });
 
         if (!res.ok) throw new Error("Failed to start session");
         const data = await res.json();
@@ -1157,14 +1455,10 @@ const eftFileInput = document.getElementById('eft-file-input');
 eftFileInput.addEventListener('change', async (e) => {
     if (e.target.files.length > 0) {
         const file = e.target.files[0];
-        const formData = new FormData();
-        formData.append("file", file);
 
         showLoading(true);
         try {
-            const res = await fetch('/api/upload_eft', { method: 'POST', body: formData });
-            if (!res.ok) throw new Error("Upload failed");
-            const data = await res.json();
+            const data = await resumableUpload(file, 'eft');
 
             editSessionId = data.session_id;
 
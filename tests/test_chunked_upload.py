@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from services import chunked_upload
+from services.chunked_upload import UploadError, create_upload, get_upload, write_chunk, finalize_upload
+
+
+def body(*pieces):
+    # Fake request body: an async iterator of byte pieces, like Request.stream()
+    async def stream():
+        for piece in pieces:
+            yield piece
+    return stream()
+
+
+def put(session_dir, offset, data, sha256="auto", pieces=None, length=None):
+    if sha256 == "auto":
+        sha256 = hashlib.sha256(data).hexdigest()
+    length = len(data) if length is None else length
+    return asyncio.run(write_chunk(session_dir, offset, length, body(*(pieces or [data])), sha256))
+
+
+@pytest.fixture
+def upload(tmp_path):
+    data = os.urandom(1000)
+    session_dir = str(tmp_path / "upload")
+    create_upload(session_dir, "card", len(data))
+    return session_dir, data
+
+
+def test_chunks_commit_in_order_and_finalize(upload):
+    session_dir, data = upload
+    assert put(session_dir, 0, data[:400], pieces=[data[:100], data[100:400]])["offset"] == 400
+    assert get_upload(session_dir)["offset"] == 400
+    assert put(session_dir, 400, data[400:])["offset"] == 1000
+
+    kind, path = finalize_upload(session_dir, hashlib.sha256(data).hexdigest())
+    assert kind == "card"
+    assert os.path.basename(path) == "original.jpg"
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(os.path.join(session_dir, chunked_upload.STATE_NAME))
+
+
+def test_offset_mismatch_reports_committed_offset(upload):
+    session_dir, data = upload
+    put(session_dir, 0, data[:400])
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 500, data[500:600])
+    assert e.value.status_code == 409
+    assert e.value.offset == 400
+
+
+def test_chunk_over_max_length(upload, monkeypatch):
+    session_dir, data = upload
+    monkeypatch.setattr(chunked_upload, "MAX_CHUNK_SIZE", 100)
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 0, data[:200])
+    assert e.value.status_code == 413
+
+
+def test_chunk_beyond_declared_size(upload):
+    session_dir, data = upload
+    put(session_dir, 0, data[:900])
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 900, data[900:] + b"extra")
+    assert e.value.status_code == 413
+    assert get_upload(session_dir)["offset"] == 900
+
+
+def test_body_longer_than_content_length(upload):
+    session_dir, data = upload
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 0, data[:200], length=100)
+    assert e.value.status_code == 413
+
+
+def test_incomplete_body_is_not_committed(upload):
+    session_dir, data = upload
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 0, data[:200], pieces=[data[:150]])
+    assert e.value.status_code == 400
+    assert e.value.offset == 0
+    assert get_upload(session_dir)["offset"] == 0
+
+
+def test_missing_chunk_checksum(upload):
+    session_dir, data = upload
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 0, data[:200], sha256=None)
+    assert e.value.status_code == 428
+    assert get_upload(session_dir)["offset"] == 0
+
+
+def test_chunk_checksum_mismatch(upload):
+    session_dir, data = upload
+    with pytest.raises(UploadError) as e:
+        put(session_dir, 0, data[:200], sha256=hashlib.sha256(b"other").hexdigest())
+    assert e.value.status_code == 422
+    assert e.value.offset == 0
+    assert get_upload(session_dir)["offset"] == 0
+
+
+def test_finalize_incomplete(upload):
+    session_dir, data = upload
+    put(session_dir, 0, data[:400])
+    with pytest.raises(UploadError) as e:
+        finalize_upload(session_dir, hashlib.sha256(data).hexdigest())
+    assert e.value.status_code == 409
+    assert e.value.offset == 400
+
+
+def test_finalize_requires_file_checksum(upload):
+    session_dir, data = upload
+    put(session_dir, 0, data)
+    with pytest.raises(UploadError) as e:
+        finalize_upload(session_dir, None)
+    assert e.value.status_code == 428
+
+
+def test_finalize_checksum_mismatch(upload):
+    session_dir, data = upload
+    put(session_dir, 0, data)
+    with pytest.raises(UploadError) as e:
+        finalize_upload(session_dir, hashlib.sha256(data[::-1]).hexdigest())
+    assert e.value.status_code == 422
+    assert os.path.exists(os.path.join(session_dir, chunked_upload.PART_NAME))
+
+
+def test_unknown_upload(tmp_path):
+    with pytest.raises(UploadError) as e:
+        put(str(tmp_path / "missing"), 0, b"data")
+    assert e.value.status_code == 404
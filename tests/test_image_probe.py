@@ -0,0 +1,170 @@
+import struct
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+
+from services import image_probe
+from services.image_probe import ImageRejected, probe_image, check_limits, reduction_factor
+
+
+# Byte-level fixtures: headers only, the probe never reads pixel data
+
+def jpeg(width, height, channels=3, dpi=None, units=1, sof=0xC0, extra=b""):
+    data = b"\xff\xd8"
+    if dpi is not None:
+        app0 = b"JFIF\x00\x01\x02" + struct.pack(">BHHBB", units, dpi, dpi, 0, 0)
+        data += b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0
+    data += extra
+    sof_body = struct.pack(">BHHB", 8, height, width, channels) + b"\x01\x11\x00" * channels
+    return data + bytes([0xFF, sof]) + struct.pack(">H", len(sof_body) + 2) + sof_body + b"\xff\xd9"
+
+
+def png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def png(width, height, color_type=2, dpi=None):
+    data = b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+    if dpi is not None:
+        ppm = round(dpi / 0.0254)
+        data += png_chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1))
+    return data + png_chunk(b"IDAT", b"") + png_chunk(b"IEND", b"")
+
+
+def tiff(width, height, endian="<", dpi=None, unit=2, channels=None):
+    # Header, then one IFD at offset 8, then the XResolution rational
+    entries = [(256, 4, width), (257, 3, height)]
+    if channels is not None:
+        entries.append((277, 3, channels))
+    if unit != 2:
+        entries.append((296, 3, unit))
+    ifd_size = 2 + 12 * (len(entries) + (dpi is not None)) + 4
+    rational_offset = 8 + ifd_size
+    if dpi is not None:
+        entries.append((282, 5, rational_offset))
+    entries.sort()
+
+    magic = b"II*\x00" if endian == "<" else b"MM\x00*"
+    data = magic + struct.pack(endian + "I", 8) + struct.pack(endian + "H", len(entries))
+    for tag, typ, value in entries:
+        packed = struct.pack(endian + "H", value) + b"\x00\x00" if typ == 3 else struct.pack(endian + "I", value)
+        data += struct.pack(endian + "HHI", tag, typ, 1) + packed
+    data += struct.pack(endian + "I", 0)
+    if dpi is not None:
+        data += struct.pack(endian + "II", dpi * 10, 10)
+    return data
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(data, name="image"):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+def test_jpeg_dimensions_and_dpi(write):
+    info = probe_image(write(jpeg(2550, 3300, dpi=300)))
+    assert info == {"format": "jpeg", "dpi": 300, "width": 2550, "height": 3300, "channels": 3}
+
+
+def test_jpeg_dpi_in_centimeters(write):
+    assert probe_image(write(jpeg(100, 100, channels=1, dpi=394, units=2)))["dpi"] == 1001
+
+
+def test_jpeg_progressive_after_other_segments(write):
+    # Skips an APP1 segment and fill bytes before the progressive SOF2
+    app1 = b"\xff\xe1" + struct.pack(">H", 10) + b"Exif\x00\x00\x00\x00"
+    info = probe_image(write(jpeg(4000, 5000, dpi=None, sof=0xC2, extra=app1 + b"\xff")))
+    assert (info["width"], info["height"], info["dpi"]) == (4000, 5000, None)
+
+
+def test_jpeg_without_frame_header(write):
+    with pytest.raises(ImageRejected):
+        probe_image(write(b"\xff\xd8\xff\xd9"))
+
+
+def test_png_dimensions_channels_and_dpi(write):
+    info = probe_image(write(png(1913, 1784, color_type=0, dpi=500)))
+    assert info == {"format": "png", "dpi": 500, "width": 1913, "height": 1784, "channels": 1}
+    assert probe_image(write(png(10, 20, color_type=6)))["channels"] == 4
+    assert probe_image(write(png(10, 20)))["dpi"] is None
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_tiff_dimensions_and_dpi(write, endian):
+    info = probe_image(write(tiff(3000, 2000, endian, dpi=600)))
+    assert info == {"format": "tiff", "dpi": 600, "width": 3000, "height": 2000, "channels": 1}
+
+
+def test_tiff_dpi_in_centimeters(write):
+    assert probe_image(write(tiff(10, 10, dpi=200, unit=3, channels=3)))["dpi"] == 508
+
+
+def test_tiff_without_dimensions(write):
+    data = b"II*\x00" + struct.pack("<IH", 8, 0) + struct.pack("<I", 0)
+    with pytest.raises(ImageRejected):
+        probe_image(write(data))
+
+
+def test_headers_of_encoded_images(write):
+    # The fixtures agree with what OpenCV writes
+    img = np.zeros((123, 456, 3), np.uint8)
+    for ext in (".jpg", ".png", ".tiff"):
+        info = probe_image(write(cv2.imencode(ext, img)[1].tobytes(), "image" + ext))
+        assert (info["width"], info["height"]) == (456, 123)
+
+
+@pytest.mark.parametrize("data", [
+    jpeg(2550, 3300, dpi=300)[:-12], # Cut inside the SOF segment
+    jpeg(2550, 3300, dpi=300)[:8], # Cut inside APP0
+    png(100, 100)[:20], # Cut inside IHDR
+    tiff(100, 100, dpi=300)[:14], # Cut inside the IFD
+])
+def test_truncated_headers(write, data):
+    with pytest.raises(ImageRejected) as e:
+        probe_image(write(data))
+    assert e.value.status_code == 415
+
+
+def test_unsupported_format(write):
+    with pytest.raises(ImageRejected) as e:
+        probe_image(write(b"GIF89a" + b"\x00" * 20))
+    assert e.value.status_code == 415
+
+
+def test_limits(monkeypatch):
+    monkeypatch.setattr(image_probe, "MAX_PIXELS", 1_000_000)
+    monkeypatch.setattr(image_probe, "MAX_DIMENSION", 2000)
+    check_limits({"width": 1000, "height": 1000})
+    for w, h in ((1001, 1000), (2001, 10)):
+        with pytest.raises(ImageRejected) as e:
+            check_limits({"width": w, "height": h})
+        assert e.value.status_code == 413
+    # Decoded at 1/2 scale, a 2000x2000 scan fits
+    check_limits({"width": 2000, "height": 2000}, reduction=2)
+    with pytest.raises(ImageRejected):
+        check_limits({"width": 0, "height": 100})
+
+
+def test_decompression_bomb_rejected_from_header(write):
+    # A 65535 x 65535 JPEG is rejected before any decoding
+    info = probe_image(write(jpeg(65535, 65535)))
+    with pytest.raises(ImageRejected) as e:
+        check_limits(info)
+    assert e.value.status_code == 413
+
+
+@pytest.mark.parametrize("dpi, expected", [
+    (None, 1), (300, 1), (500, 1), (999, 1), (1000, 2), (2000, 4), (4000, 8), (9600, 8)
+])
+def test_reduction_factor(dpi, expected):
+    assert reduction_factor({"format": "jpeg", "dpi": dpi}, target_dpi=500) == expected
+
+
+def test_reduction_only_for_jpeg():
+    assert reduction_factor({"format": "png", "dpi": 4000}, target_dpi=500) == 1
+    assert reduction_factor({"format": "tiff", "dpi": 4000}, target_dpi=500) == 1
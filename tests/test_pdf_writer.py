@@ -0,0 +1,120 @@
+import io
+import os
+import re
+import zlib
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from services.pdf_writer import PDFWriter, pdf_string
+from services.fd258_generator import FD258Generator
+
+FD258_BLANK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "img", "fd258-blank.jpg")
+
+
+def parse_pdf(data: bytes) -> dict:
+    """
+    Re-reads a PDF through its trailer and cross-reference table, checking every byte
+    offset on the way. Returns {object number: (dictionary bytes, stream bytes or None)}.
+    """
+    assert data.startswith(b"%PDF-1.")
+    assert data.endswith(b"%%EOF\n")
+    startxref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", data).group(1))
+    assert data[startxref:].startswith(b"xref\n")
+
+    lines = data[startxref:].split(b"\n")
+    first, count = map(int, lines[1].split())
+    assert first == 0
+    entries = lines[2:2 + count]
+    assert entries[0] == b"0000000000 65535 f "
+    trailer = data[data.index(b"trailer", startxref):]
+    assert int(re.search(rb"/Size (\d+)", trailer).group(1)) == count
+
+    objects = {}
+    for num in range(1, count):
+        entry = entries[num]
+        assert len(entry) == 19 and entry.endswith(b" 00000 n ")
+        offset = int(entry[:10])
+        assert data[offset:].startswith(b"%d 0 obj\n" % num), f"xref offset of object {num} is wrong"
+        end = data.index(b"endobj\n", offset)
+        body = data[offset + len(b"%d 0 obj\n" % num):end]
+        stream = None
+        if b"\nstream\n" in body:
+            head, rest = body.split(b"\nstream\n", 1)
+            length = int(re.search(rb"/Length (\d+)", head).group(1))
+            stream = rest[:length]
+            assert rest[length:] == b"\nendstream\n"
+            body = head
+        objects[num] = (body, stream)
+
+    root = int(re.search(rb"/Root (\d+) 0 R", trailer).group(1))
+    assert b"/Type /Catalog" in objects[root][0]
+    return {"objects": objects, "root": root}
+
+
+def ref(body: bytes, key: bytes) -> int:
+    return int(re.search(rb"/" + key + rb" (\d+) 0 R", body).group(1))
+
+
+def pages(pdf):
+    objects = pdf["objects"]
+    tree = objects[ref(objects[pdf["root"]][0], b"Pages")][0]
+    kids = [int(n) for n in re.findall(rb"(\d+) 0 R", re.search(rb"/Kids \[([^\]]*)\]", tree).group(1))]
+    assert int(re.search(rb"/Count (\d+)", tree).group(1)) == len(kids)
+    return [objects[kid][0] for kid in kids]
+
+
+def page_images(pdf, page):
+    xobjects = re.search(rb"/XObject << ([^>]*) >>", page).group(1)
+    return {name.decode(): pdf["objects"][int(num)] for name, num in re.findall(rb"/(\w+) (\d+) 0 R", xobjects)}
+
+
+def test_two_image_pdf_round_trip():
+    gray = (np.arange(40 * 30) % 251).astype(np.uint8).reshape(30, 40)
+    color = np.dstack([gray, 255 - gray, gray // 2])
+    jpeg = cv2.imencode(".jpg", gray)[1].tobytes()
+
+    out = io.BytesIO()
+    pdf = PDFWriter(out)
+    images = {"Im0": pdf.add_image(color), "Im1": pdf.add_jpeg(jpeg, 40, 30)}
+    font = pdf.helvetica()
+    content = b"q 40 0 0 30 0 0 cm /Im0 Do Q q 40 0 0 30 50 0 cm /Im1 Do Q BT /F1 12 Tf 0 40 Td " + pdf_string("Doe (Jr)") + b" Tj ET"
+    pdf.add_page(100, 80, content, images=images, fonts={"F1": font})
+    pdf.close()
+
+    parsed = parse_pdf(out.getvalue())
+    [page] = pages(parsed)
+    assert b"/MediaBox [0 0 100.00 80.00]" in page
+    assert zlib.decompress(parsed["objects"][ref(page, b"Contents")][1]) == content
+
+    embedded = page_images(parsed, page)
+    head, data = embedded["Im0"]
+    assert b"/Width 40 /Height 30 /ColorSpace /DeviceRGB" in head
+    assert np.array_equal(np.frombuffer(zlib.decompress(data), np.uint8).reshape(30, 40, 3), color)
+    head, data = embedded["Im1"]
+    assert b"/Filter /DCTDecode" in head
+    assert data == jpeg
+
+
+def test_pdf_string_escapes():
+    assert pdf_string("a(b)c\\") == b"(a\\(b\\)c\\\\)"
+    assert pdf_string("Zoë") == b"(Zo\xeb)"
+
+
+def test_fd258_pdf_with_two_prints(tmp_path):
+    prints = {
+        2: SimpleNamespace(img=np.full((400, 300), 200, np.uint8)),
+        12: SimpleNamespace(img=np.full((500, 400), 30, np.uint8)), # Dark: inverted by the viewer
+    }
+    out_path = FD258Generator(FD258_BLANK).generate_pdf({"2.018": "DOE,JOHN", "2.022": "19800101"}, prints, str(tmp_path / "card.pdf"))
+    with open(out_path, "rb") as f:
+        parsed = parse_pdf(f.read())
+
+    [page] = pages(parsed)
+    embedded = page_images(parsed, page)
+    assert len(embedded) == 3 # Blank card and the two prints
+    heads = [head for head, _ in embedded.values()]
+    assert any(b"/Width 300 /Height 400" in head for head in heads)
+    assert any(b"/Width 400 /Height 500" in head and b"/Decode [1 0]" in head for head in heads)
+    assert b"DOE,JOHN" in zlib.decompress(parsed["objects"][ref(page, b"Contents")][1])
@@ -0,0 +1,79 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from services.slap_segmentation import find_fingers, finger_number, segment_slap
+
+
+def synthetic_slap(tilts, width=1600, height=1000):
+    """
+    White slap with one ridged finger blob per entry of `tilts` (degrees clockwise on screen,
+    as cv2.ellipse draws them), spread evenly from left to right.
+    """
+    img = np.full((height, width), 255, np.uint8)
+    stripes = ((np.indices((height, width))[0] // 5) % 2 * 80 + 40).astype(np.uint8)
+    mask = np.zeros_like(img)
+    step = width // len(tilts)
+    for i, tilt in enumerate(tilts):
+        center = (step * i + step // 2, height // 2 + 100)
+        cv2.ellipse(mask, center, (step // 4, height // 2 - 100), tilt, 0, 360, 255, -1)
+    img[mask > 0] = stripes[mask > 0]
+    return img
+
+
+@pytest.mark.parametrize("fp_number, expected", [
+    (13, [2, 3, 4, 5]),
+    (14, [10, 9, 8, 7]),
+    (15, [12, 11]),
+])
+def test_finger_numbers_match_nfseg(fp_number, expected):
+    assert [finger_number(fp_number, i) for i in range(len(expected))] == expected
+
+
+@pytest.mark.parametrize("fp_number, expected", [
+    (13, [2, 3, 4, 5]),
+    (14, [10, 9, 8, 7]),
+    (15, [12, 11]),
+])
+def test_fingers_found_left_to_right(fp_number, expected):
+    img = synthetic_slap([0] * len(expected))
+    fingers = find_fingers(img, fp_number)
+
+    assert [f["n"] for f in fingers] == expected
+    xs = [f["x"] for f in fingers]
+    assert xs == sorted(xs)
+    step = img.shape[1] // len(expected)
+    for i, f in enumerate(fingers):
+        # Each box sits on its own blob, at the top (fingertip) end
+        assert step * i <= f["x"] + f["w"] / 2 < step * (i + 1)
+        assert f["y"] < img.shape[0] / 2
+        assert f["h"] > f["w"] / 2
+        assert abs(f["angle"]) < 3
+
+
+def test_fingertip_angles():
+    # Clockwise on screen is negative in crop_print's counter-clockwise convention
+    tilts = [-15, -5, 5, 15]
+    fingers = find_fingers(synthetic_slap(tilts), 13)
+    assert len(fingers) == 4
+    for tilt, f in zip(tilts, fingers):
+        assert f["angle"] == pytest.approx(-tilt, abs=3)
+
+
+def test_blank_slap_finds_nothing():
+    assert find_fingers(np.full((600, 1000), 255, np.uint8), 13) == []
+
+
+def test_segment_slap_writes_raw_segments(tmp_path):
+    img = synthetic_slap([0, 0])
+    image_path = str(tmp_path / "fp_15.png")
+    segments = segment_slap(img, image_path, 15)
+
+    assert [s["file"] for s in segments] == ["fp_15_12.raw", "fp_15_11.raw"]
+    for s in segments:
+        raw = np.fromfile(os.path.join(tmp_path, s["file"]), np.uint8)
+        assert raw.size == s["sw"] * s["sh"]
+        # Fingertip crops are mostly ridges, not background
+        assert raw.mean() < 200
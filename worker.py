@@ -0,0 +1,25 @@
+# Standalone generation worker.
+# Claims EFT/FD-258 jobs from the shared job queue and writes results to TMP_DIR.
+# Run next to thin API processes (OEFT_EMBEDDED_WORKERS=0), on the same host or volume:
+#   python worker.py [threads]
+import os
+import sys
+import signal
+
+from services.session_store import TMP_DIR
+from services.job_queue import create_job_queue, start_workers
+from services.pipeline import HANDLERS, preload
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get("OEFT_WORKER_THREADS", 2))
+    os.makedirs(TMP_DIR, exist_ok=True)
+
+    preload()
+    stop = start_workers(create_job_queue(), HANDLERS, threads)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    print(f"Worker process {os.getpid()} running {threads} threads")
+
+    # Jobs interrupted here are picked up again by another worker once their lease expires
+    while not stop.wait(1):
+        pass